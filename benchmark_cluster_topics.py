@@ -0,0 +1,114 @@
+'''
+This script times topic modeling of every cluster one after another and with
+topic_modeling_for_clusters in topic_modeling_clusters.py, on the diary text
+saved with the recommender app (one pickle per cluster). It prints the time of
+each cluster, the sum and the slowest, the parallel wall time on 1, 2, 4, ...
+processes, and checks that the topics match. It then compares the vocabulary
+modes: the time to model every cluster, the memory to count the corpus, and
+whether the topics match fitting a count vectorizer on each cluster.
+
+Usage: python benchmark_cluster_topics.py [copies of the corpus]
+'''
+
+import glob
+import os
+import re
+import sys
+import time
+import tracemalloc
+from multiprocessing import cpu_count
+
+import numpy as np
+import pandas as pd
+
+from topic_modeling_clusters import (VOCABULARY_MODES, count_corpus, topic_modeling,
+                                     topic_modeling_for_clusters)
+
+def load_clusters(copies=1):
+    '''
+    Returns a dictionary of cluster to a dataframe of its diary text, with the
+    text of each cluster repeated copies times to make the clusters larger.
+    '''
+    clusters = {}
+    for path in sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl'))):
+        cluster = int(re.search(r'cluster_(\d+)', path).group(1))
+        texts = pd.read_pickle(path)[['diary_text_string']]
+        clusters[cluster] = pd.concat([texts] * copies, ignore_index=True)
+
+    return clusters
+
+def compare_vocabulary_modes(clusters):
+    '''
+    Models every cluster in this process with each vocabulary mode and returns
+    a dataframe of the timings, the memory peak of counting the corpus, the
+    share of column labels that are terms of the 'cluster' mode vocabulary, and
+    whether the vocabulary and topics match the 'cluster' mode.
+    '''
+    texts = pd.concat([data_nouns.diary_text_string for data_nouns in clusters.values()])
+
+    rows = []
+    for vocabulary in VOCABULARY_MODES:
+        start = time.perf_counter()
+        results = topic_modeling_for_clusters(clusters, processes=1, vocabulary=vocabulary)
+        seconds = time.perf_counter() - start
+        if vocabulary == 'cluster':
+            expected = results
+
+        tracemalloc.start()
+        if vocabulary != 'cluster':
+            count_corpus(texts, hashing=vocabulary == 'hashing')
+        count_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+        rows.append({'vocabulary': vocabulary, 'seconds': seconds, 'count_peak_mb': count_mb,
+                     'terms': sum(len(cvn.get_feature_names_out())
+                                  for cvn, _, _ in results.values()),
+                     'vocabulary_labels': np.mean(np.concatenate([
+                         np.isin(cvn.get_feature_names_out(),
+                                 expected[cluster][0].get_feature_names_out())
+                         for cluster, (cvn, _, _) in results.items()])),
+                     'same_topics': all(
+                         np.array_equal(cvn.get_feature_names_out(),
+                                        expected[cluster][0].get_feature_names_out())
+                         and np.allclose(nmf.components_, expected[cluster][1].components_)
+                         for cluster, (cvn, nmf, _) in results.items())})
+
+    return pd.DataFrame(rows)
+
+def main():
+    '''
+    Models each cluster sequentially, then on pools of 1, 2, 4, ... processes,
+    and prints the timings.
+    '''
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    clusters = load_clusters(copies)
+
+    seconds = {}
+    expected = {}
+    for cluster, data_nouns in clusters.items():
+        start = time.perf_counter()
+        expected[cluster] = topic_modeling(data_nouns, show_topics=False)[1].components_
+        seconds[cluster] = time.perf_counter() - start
+    print(pd.DataFrame({'diarists': {cluster: len(df) for cluster, df in clusters.items()},
+                        'seconds': seconds}).round(2).to_string())
+    print('sum {:.2f} s, slowest {:.2f} s'.format(sum(seconds.values()), max(seconds.values())))
+
+    rows = []
+    processes = 1
+    while processes <= min(cpu_count(), len(clusters)):
+        start = time.perf_counter()
+        results = topic_modeling_for_clusters(clusters, processes=processes)
+        wall = time.perf_counter() - start
+        rows.append({'processes': processes, 'wall_s': wall,
+                     'vs_sum': sum(seconds.values()) / wall,
+                     'vs_slowest': wall / max(seconds.values()),
+                     'same_topics': all(np.allclose(results[cluster][1].components_,
+                                                    expected[cluster])
+                                        for cluster in clusters)})
+        processes *= 2
+
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+    print(compare_vocabulary_modes(clusters).round(2).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
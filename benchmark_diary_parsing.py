@@ -0,0 +1,116 @@
+'''
+This script times how long it takes to extract the diarist metadata and diary
+text from a folder of saved money diary pages. It compares the original
+approach (one get_diarist_value scan per field plus a find_all for the text)
+with the single-pass extractors in web_scrape_money_diaries.py, and checks
+that every extractor gives the same fields and text. Without a folder it
+parses the fixture pages, which put comments between labels and values.
+
+Usage: python benchmark_diary_parsing.py [folder of saved .html pages] [repeats]
+'''
+
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+import pandas as pd
+
+from web_scrape_money_diaries import (FIELD_LABELS, extract_fields_bs4, extract_fields_lxml,
+                                      get_diarist_value)
+
+# Saved diary pages with the edge cases every extractor has to agree on
+FIXTURE_PAGE_FOLDER = os.path.join('fixtures', 'diary_pages')
+
+def extract_fields_repeated_scans(page):
+    '''
+    Extracts the fields the way the scraper originally did: one full-document
+    search per field and another walk for the section text.
+
+    Parameters
+    ----------
+    page : The HTML of one money diary.
+
+    Returns
+    -------
+    A dictionary of the field values and a list of the diary text sections.
+    '''
+    soup = BeautifulSoup(page, 'lxml')
+    fields = {label: get_diarist_value(soup, label + ':') for label in FIELD_LABELS}
+    diary_text = [div.text for div in soup.find_all('div', class_='section-text')]
+
+    return fields, diary_text
+
+def load_pages(page_folder):
+    '''
+    Reads every saved .html page in a folder.
+
+    Parameters
+    ----------
+    page_folder : The folder of saved money diary pages.
+
+    Returns
+    -------
+    A list of the HTML of each page.
+    '''
+    pages = []
+    for path in sorted(glob.glob(os.path.join(page_folder, '*.html'))):
+        with open(path, encoding='utf-8') as page_file:
+            pages.append(page_file.read())
+
+    return pages
+
+def benchmark_extractors(pages, repeats=3):
+    '''
+    Times each extractor over the corpus and checks that they agree with the
+    original approach.
+
+    Parameters
+    ----------
+    pages : A list of the HTML of each page.
+    repeats : The number of times the corpus is parsed; the best time is kept.
+
+    Returns
+    -------
+    A dataframe with the best time, pages per second, MB per second and speedup
+    for each extractor.
+    '''
+    extractors = {
+        'repeated scans': extract_fields_repeated_scans,
+        'single pass (bs4)': extract_fields_bs4,
+        'single pass (lxml)': extract_fields_lxml,
+        }
+    corpus_mb = sum(len(page.encode('utf-8')) for page in pages) / 1e6
+    expected = [extract_fields_repeated_scans(page) for page in pages]
+
+    rows = []
+    for name, extractor in extractors.items():
+        mismatches = sum(extractor(page) != result for page, result in zip(pages, expected))
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for page in pages:
+                extractor(page)
+            best = min(best, time.perf_counter() - start)
+        rows.append({'extractor': name, 'seconds': best, 'pages_per_s': len(pages) / best,
+                     'mb_per_s': corpus_mb / best, 'mismatches': mismatches})
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = results.seconds.iloc[0] / results.seconds
+
+    return results
+
+def main():
+    '''
+    Loads the saved pages named on the command line, or the fixture pages, and
+    prints the benchmark.
+    '''
+    pages = load_pages(sys.argv[1] if len(sys.argv) > 1 else FIXTURE_PAGE_FOLDER)
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print('{} pages'.format(len(pages)))
+    print(benchmark_extractors(pages, repeats).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+This script times location resolution on a synthetic column of locations
+drawn from the gazetteer, the overrides and hard cases. It compares parsing
+every row with resolve_location against resolve_locations in clean_all_data.py,
+which parses each distinct string once, and checks the hard cases: state names
+that are also foreign places, aliases and states named without a city.
+
+Usage: python benchmark_location_parsing.py [number of locations]
+'''
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clean_all_data import (GAZETTEER_PATH, high_cost_of_living_area, load_overrides,
+                            resolve_location, resolve_locations)
+
+# Each location and the city, state, country, international and nomad flags,
+# and high cost of living flag it should resolve to
+LOCATION_CASES = [
+    ('Tbilisi, Georgia', ('Tbilisi', None, 'Georgia', 1, 0), 0),
+    ('Atlanta, Georgia', ('Atlanta', 'GA', 'United States', 0, 0), 0),
+    ('Georgia', (None, 'GA', 'United States', 0, 0), 0),
+    ('New Mexico', (None, 'NM', 'United States', 0, 0), 0),
+    ('Albuquerque, New Mexico', ('Albuquerque', 'NM', 'United States', 0, 0), 0),
+    ('Mexico City, Mexico', ('Mexico City', None, 'Mexico', 1, 0), 0),
+    ('Washington state', (None, 'WA', 'United States', 0, 0), 0),
+    ('Paris, Texas', ('Paris', 'TX', 'United States', 0, 0), 0),
+    ('Kansas City', ('Kansas City', 'MO', 'United States', 0, 0), 0),
+    ('NYC', ('New York', 'NY', 'United States', 0, 0), 1),
+    ('Manhattan', ('Manhattan', 'NY', 'United States', 0, 0), 1),
+    ('New York, NY', ('New York', 'NY', 'United States', 0, 0), 1),
+    ('Toronto, Canada', ('Toronto', None, 'Canada', 1, 0), 0),
+    ]
+
+def make_locations(n_locations, seed=19):
+    '''
+    Builds a synthetic column of locations from the gazetteer names, the
+    overridden locations and the hard cases, with random capitalization.
+
+    Parameters
+    ----------
+    n_locations : The number of locations to generate.
+    seed : The random seed.
+
+    Returns
+    -------
+    A series of location text.
+    '''
+    names = pd.read_csv(GAZETTEER_PATH, dtype=str, keep_default_na=False).name.tolist()
+    names += load_overrides().location.dropna().tolist()
+    names += [location for location, _, _ in LOCATION_CASES]
+    rng = np.random.default_rng(seed)
+    locations = np.asarray(names, dtype=object)[rng.integers(0, len(names), n_locations)]
+
+    return pd.Series([location.title() if upper else location
+                      for location, upper in zip(locations, rng.integers(0, 2, n_locations))])
+
+def check_cases():
+    '''
+    Resolves every location of LOCATION_CASES.
+
+    Returns
+    -------
+    A dataframe of the cases whose resolution or high cost flag was not the
+    expected one.
+    '''
+    locations = pd.Series([location for location, _, _ in LOCATION_CASES])
+    checks = pd.DataFrame({
+        'location': locations,
+        'expected': [expected for _, expected, _ in LOCATION_CASES],
+        'resolved': [resolve_location(location) for location in locations],
+        'expected_high_cost': [high_cost for _, _, high_cost in LOCATION_CASES],
+        'high_cost': high_cost_of_living_area(locations),
+        })
+
+    return checks[(checks.expected != checks.resolved)
+                  | (checks.expected_high_cost != checks.high_cost)]
+
+def main():
+    '''
+    Generates the synthetic column, prints the time and rows per second of
+    each approach, and checks the hard cases.
+    '''
+    n_locations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    locations = make_locations(n_locations)
+
+    start = time.perf_counter()
+    per_row = [resolve_location.__wrapped__(location) for location in locations]
+    per_row_seconds = time.perf_counter() - start
+
+    resolve_location.cache_clear()
+    start = time.perf_counter()
+    resolved = resolve_locations(locations)
+    resolved_seconds = time.perf_counter() - start
+    same = resolved.reset_index(drop=True).equals(
+        pd.DataFrame(per_row, columns=resolved.columns).astype(resolved.dtypes))
+
+    print('{:,} locations, {:,} distinct'.format(n_locations, locations.nunique()))
+    print('resolve_location per row: {:.2f}s ({:,.0f} rows/s)'.format(
+        per_row_seconds, n_locations / per_row_seconds))
+    print('resolve_locations: {:.2f}s ({:,.0f} rows/s), same results: {}'.format(
+        resolved_seconds, n_locations / resolved_seconds, same))
+
+    mismatches = check_cases()
+    print('{} location cases: {} mismatches'.format(len(LOCATION_CASES), len(mismatches)))
+    if len(mismatches):
+        print(mismatches.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
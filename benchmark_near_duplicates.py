@@ -0,0 +1,94 @@
+'''
+This script times near-duplicate detection as the corpus grows, to check that
+MinHash/LSH in near_duplicates.py scales close to linearly, and measures how
+many planted near-duplicates it finds. Synthetic diaries are sampled from the
+words of the diaries saved with the recommender app, and a share of them are
+copied with every nth word changed.
+
+Usage: python benchmark_near_duplicates.py [largest corpus size]
+'''
+
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from near_duplicates import find_near_duplicates, minhash_signatures
+
+def load_vocabulary():
+    '''
+    Returns the words of the cleaned diaries saved for the recommender app.
+    '''
+    texts = [pd.read_pickle(path).diary_text_string
+             for path in sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl')))]
+
+    return np.array(' '.join(pd.concat(texts)).split())
+
+def make_corpus(vocabulary, n_diaries, duplicate_share=0.05, edit_every=50, seed=19):
+    '''
+    Builds a corpus of synthetic diaries with planted near-duplicates.
+
+    Parameters
+    ----------
+    vocabulary : An array of words to sample from.
+    n_diaries : The number of diaries, including the planted copies.
+    duplicate_share : The share of diaries that are edited copies of another.
+    edit_every : Every nth word of a copy is replaced.
+    seed : The random seed.
+
+    Returns
+    -------
+    A list of diaries and a set of the (original, copy) row pairs.
+    '''
+    rng = np.random.default_rng(seed)
+    n_copies = int(n_diaries * duplicate_share)
+    diaries = [list(rng.choice(vocabulary, rng.integers(1500, 5000)))
+               for _ in range(n_diaries - n_copies)]
+
+    planted = set()
+    for original in rng.choice(len(diaries), n_copies, replace=False):
+        copy = list(diaries[original])
+        copy[::edit_every] = rng.choice(vocabulary, len(copy[::edit_every]))
+        planted.add((int(original), len(diaries)))
+        diaries.append(copy)
+
+    return [' '.join(words) for words in diaries], planted
+
+def main():
+    '''
+    Times signatures and LSH grouping for corpora that double in size and
+    prints the time per diary and the share of planted copies found.
+    '''
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    vocabulary = load_vocabulary()
+
+    rows = []
+    n_diaries = 500
+    while n_diaries <= largest:
+        diaries, planted = make_corpus(vocabulary, n_diaries)
+
+        start = time.perf_counter()
+        signatures = minhash_signatures(diaries)
+        signature_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        report = find_near_duplicates(signatures, range(len(diaries)))
+        lsh_seconds = time.perf_counter() - start
+
+        groups = report.groupby('group').row.apply(frozenset)
+        found = sum(any({original, copy} <= group for group in groups)
+                    for original, copy in planted)
+        rows.append({'diaries': n_diaries, 'signature_s': signature_seconds,
+                     'lsh_s': lsh_seconds,
+                     'ms_per_diary': 1000 * (signature_seconds + lsh_seconds) / n_diaries,
+                     'planted': len(planted), 'found': found,
+                     'false_matches': int(report.dropped.sum()) - found})
+        n_diaries *= 2
+
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
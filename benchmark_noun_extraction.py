@@ -0,0 +1,77 @@
+'''
+This script times noun extraction on a synthetic corpus of diaries sampled from
+the words of the diaries saved with the recommender app. It compares the
+original one-diary-at-a-time nouns (on a sample of the corpus) with
+parallel_nouns in noun_extraction.py on 1, 2, 4, ... processes, and checks that
+they extract the same nouns. Needs the NLTK punkt and averaged perceptron
+tagger models.
+
+Usage: python benchmark_noun_extraction.py [number of diaries] [words per diary]
+'''
+
+import glob
+import os
+import sys
+import time
+from multiprocessing import cpu_count
+
+import numpy as np
+import pandas as pd
+
+from noun_extraction import nouns, parallel_nouns
+
+def make_corpus(n_diaries, words_per_diary, seed=19):
+    '''
+    Builds a synthetic corpus by sampling runs of words from the saved diaries,
+    so the text reads like cleaned diary text to the tagger.
+
+    Parameters
+    ----------
+    n_diaries : The number of diaries to generate.
+    words_per_diary : The number of words in each diary.
+    seed : The random seed.
+
+    Returns
+    -------
+    A list of diaries.
+    '''
+    texts = [pd.read_pickle(path).diary_text_string
+             for path in sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl')))]
+    words = ' '.join(pd.concat(texts)).split()
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, len(words) - words_per_diary, n_diaries)
+
+    return [' '.join(words[start:start + words_per_diary]) for start in starts]
+
+def main():
+    '''
+    Generates the corpus and prints the diaries per second of each approach and
+    the speedup over the original.
+    '''
+    n_diaries = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    words_per_diary = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    corpus = make_corpus(n_diaries, words_per_diary)
+    sample = corpus[:min(n_diaries, 500)]
+
+    start = time.perf_counter()
+    expected = [nouns(text) for text in sample]
+    baseline_rate = len(sample) / (time.perf_counter() - start)
+
+    rows = [{'approach': 'apply(nouns), {} diary sample'.format(len(sample)),
+             'diaries_per_s': baseline_rate, 'matches': True}]
+    processes = 1
+    while processes <= cpu_count():
+        start = time.perf_counter()
+        extracted = parallel_nouns(corpus, processes=processes)
+        rate = n_diaries / (time.perf_counter() - start)
+        rows.append({'approach': 'parallel_nouns, {} processes'.format(processes),
+                     'diaries_per_s': rate, 'matches': extracted[:len(sample)] == expected})
+        processes *= 2
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = results.diaries_per_s / baseline_rate
+    print('{:,} diaries of {} words'.format(n_diaries, words_per_diary))
+    print(results.round(2).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+This script replays the diaries saved with the recommender app as weekly
+batches: an online model from online_topics.py is fitted on most of them and
+then updated one week at a time. For each week it prints the time of the
+online update next to a full refit of the vectorizer and NMF, and the drift
+report against that refit.
+
+Usage: python benchmark_online_topics.py [diaries per week]
+'''
+
+import glob
+import os
+import sys
+import time
+
+import pandas as pd
+
+from online_topics import fit_online_topics, topic_drift, update_online_topics
+from topic_modeling_all_diarists import new_stopwords
+
+def load_diaries(seed=19):
+    '''
+    Returns the diaries saved for the recommender app in a random order, with a
+    unique story title for each row.
+    '''
+    paths = sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl')))
+    diaries = pd.concat([pd.read_pickle(path)[['story_title', 'diary_text_string']]
+                         for path in paths], ignore_index=True)
+    diaries['story_title'] = diaries.story_title + ' #' + diaries.index.astype(str)
+
+    return diaries.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def main():
+    '''
+    Fits the online model on all but the last weeks of diaries, then updates it
+    week by week and prints the timings and drift.
+    '''
+    per_week = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    diaries = load_diaries()
+    stop_words = new_stopwords()
+    n_initial = int(len(diaries) * 0.6)
+
+    state = fit_online_topics(diaries.diary_text_string[:n_initial],
+                              diaries.story_title[:n_initial], stop_words)
+
+    rows = []
+    for end in range(n_initial + per_week, len(diaries) + 1, per_week):
+        texts, titles = diaries.diary_text_string[:end], diaries.story_title[:end]
+
+        start = time.perf_counter()
+        update_online_topics(state, texts, titles)
+        online_seconds = time.perf_counter() - start
+
+        # topic_drift refits the vectorizer and NMF, which is what a full
+        # rebuild costs
+        start = time.perf_counter()
+        _, summary = topic_drift(state, texts, stop_words)
+        refit_seconds = time.perf_counter() - start
+
+        rows.append(dict(summary, online_s=online_seconds, refit_and_drift_s=refit_seconds))
+
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
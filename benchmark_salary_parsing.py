@@ -0,0 +1,131 @@
+'''
+This script times salary cleaning on a synthetic column of salaries. It
+compares the original per-row apply that only strips $ and , with the
+vectorized normalize_salaries in clean_all_data.py, which also parses ranges,
+hourly, daily, weekly and monthly rates, millions, bonuses and unemployment.
+It also checks normalize_salaries against the hand-corrected yearly salaries
+in overrides.csv, each written out in every salary format.
+
+Usage: python benchmark_salary_parsing.py [number of salaries]
+'''
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clean_all_data import OVERRIDES_PATH, load_overrides, normalize_salaries
+
+# Salary formats seen in the diaries, filled in with random amounts
+SALARY_TEMPLATES = [
+    '${:,}', '${:,} + bonus', '${:,} ($5,000 bonus)', '{}k',
+    '${:,}-${:,}', '${:,} to ${:,}', '${}/hour', '${} per hour + tips',
+    '${}/day', 'Unemployed', '${:,} per year, roughly ${}/hour',
+    ]
+
+# Each yearly salary written as the text a diarist might give for it: a
+# template and what the yearly salary is divided by to fill it in
+OVERRIDE_FORMATS = [
+    ('${:,.0f}', 1), ('${:,.0f} + bonus', 1), ('{}k', 1000), ('${} million', 1000000),
+    ('${}/hour', 40 * 52), ('${} an hour', 40 * 52), ('${}/day', 5 * 52),
+    ('${} per week', 52), ('${}/month', 12), ('${:,.0f} per year, roughly $20/hour', 1),
+    ]
+
+def make_salaries(n_salaries, seed=19):
+    '''
+    Builds a synthetic column of free-text salaries.
+
+    Parameters
+    ----------
+    n_salaries : The number of salaries to generate.
+    seed : The random seed.
+
+    Returns
+    -------
+    A series of salary text.
+    '''
+    rng = np.random.default_rng(seed)
+    yearly = rng.integers(20, 300, n_salaries) * 1000
+    hourly = rng.integers(12, 90, n_salaries)
+    choices = rng.integers(0, len(SALARY_TEMPLATES), n_salaries)
+
+    salaries = []
+    for choice, amount, rate in zip(choices, yearly, hourly):
+        template = SALARY_TEMPLATES[choice]
+        if 'roughly' in template:
+            salaries.append(template.format(amount, amount // 2080))
+        elif 'hour' in template or 'day' in template:
+            salaries.append(template.format(rate if 'hour' in template else rate * 10))
+        elif template.count('{') == 2:
+            salaries.append(template.format(amount, amount + 10000))
+        elif template == '{}k':
+            salaries.append(template.format(amount // 1000))
+        else:
+            salaries.append(template.format(amount))
+
+    return pd.Series(salaries)
+
+def check_overrides(overrides_path=OVERRIDES_PATH):
+    '''
+    Writes every hand-corrected salary in the overrides csv in each of the
+    OVERRIDE_FORMATS and checks that normalize_salaries gives the salary back.
+
+    Parameters
+    ----------
+    overrides_path : The path of the overrides csv.
+
+    Returns
+    -------
+    A dataframe of the salary texts that did not parse back to their salary.
+    '''
+    salaries = load_overrides(overrides_path).salary.dropna().astype(float)
+    rows = [{'text': 'Unemployed', 'expected': 0.0}]
+    for salary in salaries[salaries > 0]:
+        for template, divisor in OVERRIDE_FORMATS:
+            rows.append({'text': template.format(salary / divisor), 'expected': salary})
+    checks = pd.DataFrame(rows)
+    checks['parsed'] = normalize_salaries(checks.text)
+
+    return checks[~np.isclose(checks.parsed, checks.expected, rtol=1e-9, atol=0.01)]
+
+def strip_salary(text):
+    '''
+    The original per-row cleaning: removes $ , from text.
+    '''
+    text = text.replace('$', '')
+    text = text.replace(',', '')
+
+    return text
+
+def main():
+    '''
+    Generates the synthetic column and prints the time and rows per second of
+    each approach.
+    '''
+    n_salaries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    salaries = make_salaries(n_salaries)
+
+    start = time.perf_counter()
+    stripped = pd.to_numeric(salaries.apply(strip_salary), errors='coerce')
+    apply_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    normalized = normalize_salaries(salaries)
+    vectorized_seconds = time.perf_counter() - start
+
+    print('{:,} salaries'.format(n_salaries))
+    print('apply + to_numeric: {:.2f}s ({:,.0f} rows/s), {:.1%} parsed'.format(
+        apply_seconds, n_salaries / apply_seconds, stripped.notna().mean()))
+    print('normalize_salaries: {:.2f}s ({:,.0f} rows/s), {:.1%} parsed'.format(
+        vectorized_seconds, n_salaries / vectorized_seconds, normalized.notna().mean()))
+
+    mismatches = check_overrides()
+    print('{} salaries from {} written in {} formats: {} mismatches'.format(
+        load_overrides().salary.notna().sum(), OVERRIDES_PATH, len(OVERRIDE_FORMATS),
+        len(mismatches)))
+    if len(mismatches):
+        print(mismatches.head(20).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+'''
+This script times the concurrent scraper in web_scrape_money_diaries.py against
+a local HTTP stub instead of Refinery29. The stub serves the listing pages saved
+in fixtures/, synthetic diary pages with a fixed latency, and an article that
+matches the diary link pattern but is not a diary. It answers some links with
+404 and one with a 503 that outlasts the retries. It checks that discovery
+finds exactly the diaries on the saved listing pages, that the failed links
+and the article are skipped and left out of the manifest, that every other
+diary is written once, and that a rerun picks up the failed links once the
+stub serves them. It then checks that switching the output format or deleting
+the tables scrapes every diary again instead of trusting a stale manifest.
+
+Usage: python benchmark_scraper.py [number of diaries] [latency in ms]
+'''
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+import pandas as pd
+
+from storage import read_table
+from web_scrape_money_diaries import (LISTING_PATH, OUTPUT_PATHS, ScrapeMetrics,
+                                      discover_diary_links, manifest_path_for,
+                                      scrape_new_money_diaries)
+
+# Every MISSING_EVERY-th link answers 404, and the first link answers 503
+MISSING_EVERY = 10
+
+# Saved listing pages, whose diary links have class="story"
+LISTING_PAGE_PATH = os.path.join('fixtures', 'money_diary_listing_page_{}.html')
+
+# An article whose link looks like a diary but has none of the diarist fields
+ARTICLE_LINK = '/en-us/money-diary-faq'
+ARTICLE_PAGE = '<html><body><div class="section-text">How to submit a diary.</div></body></html>'
+
+def diary_link(number):
+    '''
+    Returns the unique part of the link of a synthetic diary.
+    '''
+    return '/en-us/diarist-{}-city-st-salary-money-diary'.format(number)
+
+def diary_page(number):
+    '''
+    Returns the HTML of a synthetic diary laid out like a money diary page.
+    '''
+    sections = ''.join('<div class="section-text">Day {}: spent ${} on coffee.</div>'.format(
+        day, number + day) for day in range(1, 8))
+    return ('<html><body><p><strong>Occupation:</strong> Analyst {0}</p>'
+            '<p><strong>Age:</strong> 2{1}</p><p><strong>Location:</strong> City, ST</p>'
+            '<p><strong>Salary:</strong> ${0},000</p>{2}</body></html>').format(
+                number, number % 10, sections)
+
+def listing_diary_links():
+    '''
+    Returns the paths of the diary links on the saved listing pages, in order.
+    '''
+    links = []
+    page_number = 1
+    while os.path.exists(LISTING_PAGE_PATH.format(page_number)):
+        with open(LISTING_PAGE_PATH.format(page_number), encoding='utf-8') as page_file:
+            soup = BeautifulSoup(page_file.read(), 'lxml')
+        links.extend(urlsplit(urljoin(LISTING_PATH, a['href'])).path
+                     for a in soup.find_all('a', class_='story'))
+        page_number += 1
+
+    return links
+
+def start_stub(n_diaries, latency):
+    '''
+    Starts the stub server in a daemon thread.
+
+    Parameters
+    ----------
+    n_diaries : The number of synthetic diaries served.
+    latency : The delay in seconds before each response.
+
+    Returns
+    -------
+    The server, whose failing attribute can be set to False to serve every link.
+    '''
+    numbers = {diary_link(number): number for number in range(n_diaries)}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlsplit(self.path)
+            number = numbers.get(url.path)
+            page = None
+            if url.path == LISTING_PATH:
+                listing_path = LISTING_PAGE_PATH.format(
+                    parse_qs(url.query).get('page', ['1'])[0])
+                if os.path.exists(listing_path):
+                    with open(listing_path, encoding='utf-8') as page_file:
+                        page = page_file.read()
+            elif url.path == ARTICLE_LINK:
+                page = ARTICLE_PAGE
+            elif number is not None and not (server.failing and (
+                    number == 0 or number % MISSING_EVERY == MISSING_EVERY - 1)):
+                page = diary_page(number)
+
+            if page is not None:
+                status = 200
+            elif number == 0:
+                status = 503
+            else:
+                status = 404
+            body = page.encode('utf-8') if page is not None else b'not found'
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.failing = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+def scrape(links, base_url, directory, max_workers, output_format='csv'):
+    '''
+    Scrapes the links not in the manifest into tables in a folder.
+
+    Returns
+    -------
+    The seconds taken, the ScrapeMetrics, the diarist table and the manifest.
+    '''
+    text_path, diarist_path = (os.path.join(directory, path)
+                               for path in OUTPUT_PATHS[output_format])
+    manifest_path = manifest_path_for(diarist_path)
+    metrics = ScrapeMetrics(log_every=0)
+
+    start = time.perf_counter()
+    scrape_new_money_diaries(links, output_format, text_path, diarist_path,
+                             max_workers=max_workers,
+                             per_host_limit=max_workers, base_url=base_url, cache_path=None,
+                             max_retries=1, backoff=0.01, metrics=metrics)
+    seconds = time.perf_counter() - start
+
+    with open(manifest_path) as manifest:
+        manifest_titles = [line.strip() for line in manifest if line.strip()]
+
+    return seconds, metrics, read_table(diarist_path), manifest_titles
+
+def main():
+    '''
+    Discovers the diaries on the saved listing pages, scrapes the stub serially
+    and with a thread pool, checks what was written, reruns once the stub serves
+    every link, and prints the timings.
+    '''
+    n_diaries = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    server = start_stub(n_diaries, latency)
+    base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    expected_links = listing_diary_links()
+    start = time.perf_counter()
+    discovered = list(discover_diary_links(base_url=base_url))
+    print('Discovered {} of {} diary links on the saved listing pages in {:.2f}s, '
+          'same links: {}'.format(len(discovered), len(expected_links),
+                                  time.perf_counter() - start, discovered == expected_links))
+
+    diaries = [diary_link(number) for number in range(n_diaries)]
+    links = diaries + [ARTICLE_LINK]
+    failed = {diary_link(number) for number in range(n_diaries)
+              if number == 0 or number % MISSING_EVERY == MISSING_EVERY - 1}
+    expected = sorted(set(diaries) - failed)
+
+    rows = []
+    for max_workers in (1, 8):
+        server.failing = True
+        with tempfile.TemporaryDirectory() as directory:
+            seconds, metrics, diarist_df, manifest = scrape(links, base_url, directory,
+                                                            max_workers)
+            statuses = metrics.summary()['statuses']
+            first_run_ok = (sorted(diarist_df.story_title) == expected
+                            and sorted(manifest) == expected
+                            and metrics.counters['not_diaries'] == 1)
+
+            server.failing = False
+            _, _, diarist_df, manifest = scrape(links, base_url, directory, max_workers)
+            rerun_ok = (sorted(diarist_df.story_title) == sorted(diaries)
+                        and sorted(manifest) == sorted(diaries))
+
+            _, _, diarist_df, _ = scrape(links, base_url, directory, max_workers, 'jsonl')
+            for path in OUTPUT_PATHS['csv']:
+                os.remove(os.path.join(directory, path))
+            _, _, csv_diarist_df, _ = scrape(links, base_url, directory, max_workers)
+            stale_manifest_ok = (sorted(diarist_df.story_title) == sorted(diaries)
+                                 and sorted(csv_diarist_df.story_title) == sorted(diaries))
+
+        rows.append({'max_workers': max_workers, 'seconds': seconds,
+                     'pages_per_s': len(expected) / seconds,
+                     'skipped': metrics.counters['failed'], '404s': statuses.get('404', 0),
+                     '503s': statuses.get('503', 0), 'first_run_ok': first_run_ok,
+                     'rerun_ok': rerun_ok, 'stale_manifest_ok': stale_manifest_ok})
+
+    server.shutdown()
+    results = pd.DataFrame(rows)
+    results['speedup'] = results.seconds.iloc[0] / results.seconds
+    print('{} diaries, {} failing, {:.0f} ms latency'.format(n_diaries, len(failed),
+                                                            latency * 1000))
+    print(results.round(3).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
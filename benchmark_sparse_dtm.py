@@ -0,0 +1,87 @@
+'''
+This script compares the memory and NMF fit time of the document-term matrix
+when it is densified into a DataFrame (the original path) and when it stays a
+sparse CSR matrix, on the diary text saved with the recommender app. It runs
+with the topic modeling vectorizer settings and with a wider vocabulary
+(every unigram and bigram in at least 2 diaries), and checks that both paths
+find the same topics.
+
+Usage: python benchmark_sparse_dtm.py
+'''
+
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.decomposition import NMF
+
+from topic_modeling_all_diarists import new_stopwords
+
+VECTORIZER_SETTINGS = {
+    'topic modeling (min_df=0.1, max_df=0.9)': dict(min_df=0.1, max_df=.9),
+    'wide vocabulary (min_df=2, max_df=0.9)': dict(min_df=2, max_df=.9),
+    }
+
+def load_texts():
+    '''
+    Returns the cleaned diary text saved for the recommender app.
+    '''
+    return pd.concat([pd.read_pickle(path).diary_text_string
+                      for path in sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl')))],
+                     ignore_index=True)
+
+def sparse_bytes(matrix):
+    '''
+    Returns the bytes held by a CSR matrix.
+    '''
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+def time_fit(matrix):
+    '''
+    Fits the topic modeling NMF and returns the model and the seconds it took.
+    '''
+    nmf = NMF(5, random_state=19)
+    start = time.perf_counter()
+    nmf.fit_transform(matrix)
+
+    return nmf, time.perf_counter() - start
+
+def main():
+    '''
+    Vectorizes the diaries with each setting and prints the memory and fit time
+    of the dense and sparse paths.
+    '''
+    texts = load_texts()
+    stop_words = new_stopwords()
+
+    rows = []
+    for name, settings in VECTORIZER_SETTINGS.items():
+        cvn = CountVectorizer(stop_words=list(stop_words), ngram_range=(1, 2), **settings)
+        data_cvn = cvn.fit_transform(texts)
+
+        data_dtmn = pd.DataFrame(data_cvn.toarray(), columns=cvn.get_feature_names_out())
+        dense_nmf, dense_seconds = time_fit(data_dtmn)
+        sparse_nmf, sparse_seconds = time_fit(data_cvn)
+
+        rows.append({
+            'vocabulary': name, 'terms': data_cvn.shape[1],
+            'density': data_cvn.nnz / np.prod(data_cvn.shape),
+            'dense_mb': data_dtmn.memory_usage(index=False).sum() / 1e6,
+            'sparse_mb': sparse_bytes(data_cvn) / 1e6,
+            'dense_fit_s': dense_seconds, 'sparse_fit_s': sparse_seconds,
+            'same_topics': np.allclose(dense_nmf.components_, sparse_nmf.components_,
+                                       rtol=1e-3, atol=1e-6),
+            })
+
+    results = pd.DataFrame(rows)
+    results['memory_saved'] = 1 - results.sparse_mb / results.dense_mb
+    results['fit_speedup'] = results.dense_fit_s / results.sparse_fit_s
+    print('{} diaries'.format(len(texts)))
+    print(results.round(3).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''
+This script times writes to a size-bounded SQLite cache from storage.py, the
+way cached_fetch_page writes each page: one INSERT OR REPLACE and an eviction
+check per entry. It compares summing the sizes of the whole table on every
+check (how evict_sqlite_cache worked before) with the running total kept by
+init_sqlite_cache, as the cache grows, and checks that the running total
+matches the sizes in the table after the writes and evictions.
+
+Usage: python benchmark_sqlite_cache.py [largest number of entries]
+'''
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from storage import evict_sqlite_cache, init_sqlite_cache
+
+COLUMNS = 'key TEXT PRIMARY KEY, accessed_at REAL, size INTEGER, body BLOB'
+
+# Entries timed at each cache size
+TIMED_WRITES = 2000
+
+def evict_by_scan(conn, table, key_column, max_cache_bytes):
+    '''
+    The eviction check before the running total: sums the sizes of the whole
+    table, then deletes the least recently read entries.
+    '''
+    total_size = conn.execute(
+        'SELECT COALESCE(SUM(size), 0) FROM {}'.format(table)).fetchone()[0]
+    if total_size <= max_cache_bytes:
+        return
+
+    stale_keys = []
+    rows = conn.execute('SELECT {}, size FROM {} ORDER BY accessed_at'.format(key_column, table))
+    for key, size in rows:
+        if total_size <= max_cache_bytes:
+            break
+        stale_keys.append((key,))
+        total_size -= size
+    conn.executemany('DELETE FROM {} WHERE {} = ?'.format(table, key_column), stale_keys)
+
+def time_writes(conn, evict, first_key, max_cache_bytes, body):
+    '''
+    Writes TIMED_WRITES entries one transaction at a time, each followed by an
+    eviction check, and returns the writes per second.
+    '''
+    start = time.perf_counter()
+    for key in range(first_key, first_key + TIMED_WRITES):
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                         (str(key), time.time(), len(body), body))
+            evict(conn, 'entries', 'key', max_cache_bytes)
+
+    return TIMED_WRITES / (time.perf_counter() - start)
+
+def main():
+    '''
+    Fills caches of growing size, times the writes with each eviction check,
+    and prints the writes per second.
+    '''
+    max_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    body = os.urandom(256)
+    sizes = np.unique(np.geomspace(1000, max_entries, 4).astype(int))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_entries in sizes:
+            row = {'entries': n_entries}
+            for name, evict in [('scan', evict_by_scan), ('running_total', evict_sqlite_cache)]:
+                path = os.path.join(directory, '{}_{}.sqlite'.format(name, n_entries))
+                init_sqlite_cache(path, 'entries', COLUMNS, 'key')
+                with closing(sqlite3.connect(path)) as conn:
+                    with conn:
+                        conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?)',
+                                         ((str(key), key, len(body), body)
+                                          for key in range(n_entries)))
+
+                    # The limit is reached halfway through, so evictions are timed too
+                    limit = (n_entries + TIMED_WRITES // 2) * len(body)
+                    row['{}_writes_per_s'.format(name)] = time_writes(conn, evict, n_entries,
+                                                                      limit, body)
+                    if evict is evict_sqlite_cache:
+                        total = conn.execute('SELECT total FROM cache_sizes').fetchone()[0]
+                        row['total_ok'] = total == conn.execute(
+                            'SELECT SUM(size) FROM entries').fetchone()[0]
+            rows.append(row)
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = results.running_total_writes_per_s / results.scan_writes_per_s
+    print(results.round(1).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
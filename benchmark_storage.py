@@ -0,0 +1,151 @@
+'''
+This script compares the size and load time of the tables passed between the
+pipeline stages when they are saved as CSV (the original path) and with the
+storage layer in storage.py (Parquet tables and a sparse .npz document-term
+matrix). The tables are rebuilt from the diary text and clustered metadata
+pickles in the repo, so no scrape is needed.
+
+Usage: python benchmark_storage.py [repeats]
+'''
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+from storage import (load_sparse_matrix, read_table, save_sparse_matrix, save_table,
+                     table_path)
+
+def build_tables():
+    '''
+    Rebuilds stand-ins for the pipeline tables from the pickles in the repo.
+
+    Returns
+    -------
+    A dictionary of table name to dataframe and the dense document-term matrix.
+    '''
+    clustered_data_scaled = pd.read_pickle(os.path.join('Notebooks', 'clustered_data_scaled.pkl'))
+    data_clean = pd.concat([pd.read_pickle(path) for path in
+                            sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl')))],
+                           ignore_index=True)
+
+    # The scraped text table keeps each diary as a list of sections; here each
+    # section is 200 words of the cleaned text
+    sections = [text.split() for text in data_clean.diary_text_string]
+    text_df = pd.DataFrame({
+        'story_title': data_clean.story_title,
+        'diary_text': [[' '.join(words[start:start + 200]) for start in range(0, len(words), 200)]
+                       for words in sections],
+        })
+
+    cvn = CountVectorizer(min_df=0.1, max_df=.9, ngram_range=(1, 2))
+    data_cvn = cvn.fit_transform(data_clean.diary_text_string)
+    data_dtmn = pd.DataFrame(data_cvn.toarray(), columns=cvn.get_feature_names_out())
+
+    tables = {'text_df': text_df, 'data_clean': data_clean,
+              'clustered_data_scaled': clustered_data_scaled}
+
+    return tables, data_dtmn
+
+def path_size(paths):
+    '''
+    Returns the total size in MB of a list of files.
+    '''
+    return sum(os.path.getsize(path) for path in paths) / 1e6
+
+def best_time(function, repeats):
+    '''
+    Returns the best time in seconds of calling function repeats times.
+    '''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def benchmark_storage(tables, data_dtmn, repeats=3):
+    '''
+    Saves each table both ways in the current directory and times loading them.
+
+    Parameters
+    ----------
+    tables : A dictionary of table name to dataframe.
+    data_dtmn : The dense document-term matrix as a dataframe.
+    repeats : The number of loads per table; the best time is kept.
+
+    Returns
+    -------
+    A dataframe with the size and load time of each table in each format.
+    '''
+    rows = []
+    for name, table in tables.items():
+        csv_path = save_table(table, name, 'csv')
+        parquet_path = save_table(table, name, 'parquet')
+        rows.append({
+            'table': name,
+            'csv_mb': path_size([csv_path]),
+            'parquet_mb': path_size([parquet_path]),
+            'csv_load_s': best_time(lambda: pd.read_csv(csv_path), repeats),
+            'parquet_load_s': best_time(lambda: read_table(parquet_path), repeats),
+            })
+
+    csv_path = save_table(data_dtmn, 'data_dtmn', 'csv')
+    npz_paths = save_sparse_matrix(data_dtmn.values, data_dtmn.columns, 'data_dtmn')
+    rows.append({
+        'table': 'data_dtmn ({} x {})'.format(*data_dtmn.shape),
+        'csv_mb': path_size([csv_path]),
+        'parquet_mb': path_size(npz_paths),
+        'csv_load_s': best_time(lambda: pd.read_csv(csv_path), repeats),
+        'parquet_load_s': best_time(lambda: load_sparse_matrix('data_dtmn'), repeats),
+        })
+
+    results = pd.DataFrame(rows)
+    results['size_ratio'] = results.csv_mb / results.parquet_mb
+    results['load_speedup'] = results.csv_load_s / results.parquet_load_s
+
+    return results
+
+def check_round_trip(tables):
+    '''
+    Checks that the Parquet tables load back with the same values and numeric
+    dtypes, including the list column of the text table. String columns may
+    come back as the pandas string dtype instead of object.
+    '''
+    for name, table in tables.items():
+        loaded = read_table(table_path(name, 'parquet'))
+        assert loaded.select_dtypes('number').dtypes.equals(table.select_dtypes('number').dtypes)
+        if 'diary_text' in table:
+            assert [list(text) for text in loaded.diary_text] == list(table.diary_text), name
+            loaded, table = loaded.drop(columns='diary_text'), table.drop(columns='diary_text')
+        assert list(loaded.columns) == list(table.columns), name
+        assert loaded.values.tolist() == table.values.tolist(), name
+
+def main():
+    '''
+    Builds the tables, saves them both ways in a temporary folder and prints the
+    size and load time of each.
+    '''
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    tables, data_dtmn = build_tables()
+
+    start_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            results = benchmark_storage(tables, data_dtmn, repeats)
+            check_round_trip(tables)
+        finally:
+            os.chdir(start_dir)
+
+    print('parquet_mb is the .npz and vocabulary file for data_dtmn')
+    print(results.round(4).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+This script times diary text cleaning on a synthetic corpus. It compares the
+original clean_text_round_2 (eight re.sub calls per diary) with the compiled
+version applied per diary, the pandas string-method path and the
+multiprocessing path in clean_all_data.py, and checks that they all agree.
+
+Usage: python benchmark_text_cleaning.py [number of diaries] [processes]
+'''
+
+import re
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clean_all_data import clean_text_parallel, clean_text_round_2, clean_text_series
+
+WORDS = ['coffee', 'Rent', 'dog', 'work', 'Friends', 'dinner', '$4.50', '7:30',
+         'a.m.', '[Ed. note]', 'don’t', '“great”', '…', '—', 'covid-19', '2x',
+         'it’s', 'Target,', 'gym!', '(lunch)', '\n', 'Day', 'One:', 'total']
+
+def make_corpus(n_diaries, words_per_diary=2000, seed=19):
+    '''
+    Builds a synthetic corpus of diary text from common diary tokens.
+
+    Parameters
+    ----------
+    n_diaries : The number of diaries to generate.
+    words_per_diary : The number of tokens in each diary.
+    seed : The random seed.
+
+    Returns
+    -------
+    A series of diary text.
+    '''
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    return pd.Series([' '.join(words[rng.integers(0, len(words), words_per_diary)])
+                      for _ in range(n_diaries)])
+
+def clean_text_original(text):
+    '''
+    The original clean_text_round_2.
+    '''
+    text = text.lower()
+    text = re.sub('\\[.*?\\]', '', text)
+    text = re.sub('[%s]' % re.escape(string.punctuation), '', text)
+    text = re.sub(' — ', ' ', text)
+    text = re.sub('\\w*\\d\\w*', '', text)
+    text = re.sub('[‘’“”…]', '', text)
+    text = re.sub('\n', '', text)
+    text = re.sub('^', '', text)
+
+    return text
+
+def main():
+    '''
+    Generates the corpus and prints the time and MB/s of each approach.
+    '''
+    n_diaries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    corpus = make_corpus(n_diaries)
+    corpus_mb = corpus.str.len().sum() / 1e6
+
+    approaches = {
+        'original apply': lambda texts: texts.apply(clean_text_original),
+        'compiled apply': lambda texts: texts.apply(clean_text_round_2),
+        'series path': clean_text_series,
+        'multiprocessing': lambda texts: clean_text_parallel(texts, processes),
+        }
+
+    expected = None
+    print('{:,} diaries, {:.1f} MB'.format(n_diaries, corpus_mb))
+    for name, approach in approaches.items():
+        start = time.perf_counter()
+        cleaned = approach(corpus)
+        seconds = time.perf_counter() - start
+        expected = cleaned if expected is None else expected
+        print('{:<16} {:6.2f}s {:7.1f} MB/s  matches original: {}'.format(
+            name, seconds, corpus_mb / seconds, cleaned.equals(expected)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+This script times top-term extraction for many topics: the original
+display_topics loop, which argsorts every topic's full vocabulary, against
+topic_summary in topic_summary.py, which uses one argpartition over all topics.
+The components are random weights shaped like the topic models of many
+clusters, and both approaches must find the same terms.
+
+Usage: python benchmark_topic_summary.py [number of topics] [vocabulary size]
+'''
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+from topic_summary import save_topic_summary, topic_summary
+
+def original_display_topics(model, feature_names, no_top_words):
+    '''
+    The display_topics the topic modeling scripts used before topic_summary.
+    '''
+    for i, topic in enumerate(model.components_):
+        print("\nTopic ", i)
+        print(", ".join([feature_names[i] for i in topic.argsort()[:-no_top_words - 1:-1]]))
+
+def main():
+    '''
+    Times both approaches and the JSON and Parquet exports, and prints the
+    speedup.
+    '''
+    n_topics = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_terms = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = np.random.default_rng(19)
+    model = types.SimpleNamespace(components_=rng.gamma(0.2, size=(n_topics, n_terms)))
+    feature_names = np.array(['term_{}'.format(term) for term in range(n_terms)], dtype=object)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as printed:
+        original_display_topics(model, feature_names, 10)
+    original_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = topic_summary(model, feature_names, 10)
+    summary_seconds = time.perf_counter() - start
+
+    expected = [line.split(', ') for line in printed.getvalue().splitlines()[2::3]]
+    matches = summary.groupby('topic').term.apply(list).tolist() == expected
+
+    rows = [{'approach': 'display_topics loop (argsort)', 'seconds': original_seconds},
+            {'approach': 'topic_summary (argpartition)', 'seconds': summary_seconds}]
+    with tempfile.TemporaryDirectory() as directory:
+        for table_format in ('json', 'parquet'):
+            start = time.perf_counter()
+            path = save_topic_summary(summary, os.path.join(directory, 'topic_summary'),
+                                      table_format)
+            rows.append({'approach': 'save_topic_summary ({})'.format(table_format),
+                         'seconds': time.perf_counter() - start,
+                         'kb': os.path.getsize(path) / 1e3})
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = original_seconds / results.seconds
+    print('{} topics, {:,} terms, same terms: {}'.format(n_topics, n_terms, matches))
+    print(results.round(4).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+This script times the topic count sweep in topic_count_sweep.py on the diary
+text saved with the recommender app: all diaries and each cluster pickle. It
+compares fitting every k from scratch with NMF's own stopping rule (how k was
+chosen before), the sweep's rounds from scratch, and the sweep's rounds with
+warm starts, then the warm sweep on pools of 1, 2, 4, ... processes.
+
+Usage: python benchmark_topic_sweep.py [smallest k] [largest k]
+'''
+
+import glob
+import os
+import re
+import sys
+import time
+import warnings
+from multiprocessing import cpu_count
+
+import numpy as np
+import pandas as pd
+
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.decomposition import NMF
+from sklearn.exceptions import ConvergenceWarning
+
+from topic_count_sweep import (MAX_TOPICS, MIN_TOPICS, best_topic_counts, cluster_stopwords,
+                               sweep_topic_counts)
+from topic_modeling_all_diarists import new_stopwords as all_diarists_stopwords
+from topic_modeling_clusters import MAX_DF, MIN_DF, NGRAM_RANGE
+
+def load_corpora():
+    '''
+    Returns a list of (name, diary text, stop words) for all diaries saved for
+    the recommender app and for each cluster.
+    '''
+    clusters = []
+    for path in sorted(glob.glob(os.path.join('Streamlit', 'cluster_*.pkl'))):
+        name = 'cluster_{}'.format(re.search(r'cluster_(\d+)', path).group(1))
+        clusters.append((name, pd.read_pickle(path).diary_text_string, cluster_stopwords()))
+    texts = pd.concat([cluster_texts for _, cluster_texts, _ in clusters], ignore_index=True)
+
+    return [('all_diarists', texts, all_diarists_stopwords())] + clusters
+
+def default_sweep(corpora, topic_counts):
+    '''
+    Fits NMF(k, random_state=19) from scratch for every k of every corpus and
+    returns the seconds spent fitting and the relative reconstruction errors.
+    '''
+    seconds = 0
+    errors = []
+    for _, texts, stop_words in corpora:
+        cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                              ngram_range=NGRAM_RANGE)
+        data_cvn = cvn.fit_transform(texts).astype(np.float64)
+        data_norm = np.sqrt(data_cvn.multiply(data_cvn).sum())
+        for k in topic_counts:
+            if k > min(data_cvn.shape):
+                break
+            start = time.perf_counter()
+            nmf = NMF(k, random_state=19)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', ConvergenceWarning)
+                nmf.fit(data_cvn)
+            seconds += time.perf_counter() - start
+            errors.append(nmf.reconstruction_err_ / data_norm)
+
+    return seconds, np.array(errors)
+
+def main():
+    '''
+    Runs each approach and prints the fit time, the error against the default
+    fits, and the best k of each corpus.
+    '''
+    min_topics = int(sys.argv[1]) if len(sys.argv) > 1 else MIN_TOPICS
+    max_topics = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_TOPICS
+    topic_counts = range(min_topics, max_topics + 1)
+    corpora = load_corpora()
+
+    default_seconds, default_errors = default_sweep(corpora, topic_counts)
+    rows = [{'approach': 'NMF default stopping, from scratch', 'fit_s': default_seconds,
+             'mean_error': default_errors.mean(), 'worst_error_gap': 0.0}]
+
+    sweeps = {}
+    for name, warm in [('rounds, from scratch', False), ('rounds, warm start', True)]:
+        sweeps[name] = sweep_topic_counts(corpora, topic_counts, processes=1, warm=warm)
+        errors = sweeps[name].reconstruction_error.to_numpy()
+        rows.append({'approach': name, 'fit_s': sweeps[name].seconds.sum(),
+                     'mean_error': errors.mean(),
+                     'worst_error_gap': (errors - default_errors).max()})
+
+    results = pd.DataFrame(rows)
+    results['fit_speedup'] = default_seconds / results.fit_s
+    print(results.round(4).to_string(index=False))
+
+    best = {name: best_topic_counts(sweep).k for name, sweep in sweeps.items()}
+    print('\nBest number of topics')
+    print(pd.DataFrame(best).to_string())
+
+    rows = []
+    processes = 1
+    while processes <= min(cpu_count(), len(corpora)):
+        start = time.perf_counter()
+        sweep_topic_counts(corpora, topic_counts, processes=processes)
+        rows.append({'processes': processes, 'wall_s': time.perf_counter() - start})
+        processes *= 2
+    print()
+    print(pd.DataFrame(rows).round(2).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
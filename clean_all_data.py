@@ -2,11 +2,102 @@
 This script cleans the metadata dataframe and the text datatframe.
 '''
 
+import os
 import re
 import string
+import sys
+from functools import lru_cache
+from multiprocessing import Pool
 
+import numpy as np
 import pandas as pd
 
+from near_duplicates import drop_near_duplicates, find_near_duplicates, minhash_signatures
+from storage import TableAppender, find_table, iter_table_batches, load_table, save_table
+
+# Manual corrections keyed by story_title, read but never written by the pipeline
+OVERRIDES_PATH = 'overrides.csv'
+
+# Salary text patterns: a number or range with an optional k or million, and
+# the pay period written right after it (e.g. /hour, per week, monthly), so a
+# rate mentioned later in the text does not change the salary. Then
+# unemployment, and the start of bonuses or notes to drop
+SALARY_PATTERN = (r'(?P<low>\d+(?:\.\d+)?)(?:\s*(?P<low_scale>k|m|million)\b)?'
+                  r'(?:\s*(?:-|–|—|to)\s*(?P<high>\d+(?:\.\d+)?)'
+                  r'(?:\s*(?P<high_scale>k|m|million)\b)?)?'
+                  r'\s*(?P<period>(?:/\s*|(?:per|an|a)\s+)'
+                  r'(?:hour|hr|day|week|wk|month|mo|year|yr|annum)\b'
+                  r'|hourly|daily|weekly|monthly|yearly|annually)?')
+SALARY_SCALES = {'k': 1000, 'm': 1000000, 'million': 1000000}
+# Pay periods other than a year, and how many of them are worked in a year:
+# 40 hours or 5 days a week, over 52 weeks
+PAY_PERIODS = [(r'hour|hr', 40 * 52), (r'day|daily', 5 * 52), (r'week|wk', 52),
+               (r'month|mo\b', 12)]
+UNEMPLOYED_PATTERN = r'unemployed|not employed|no income'
+SALARY_EXTRAS_PATTERN = r'\+|\bplus\b|\(|\bbonus|\bwith\b|;'
+
+STATE_ABBREVIATIONS = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas',
+    'CA': 'California', 'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware',
+    'DC': 'District of Columbia', 'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii',
+    'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
+    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland',
+    'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi',
+    'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma',
+    'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island',
+    'SC': 'South Carolina', 'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas',
+    'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington',
+    'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+    }
+STATE_NAME_TO_ABBREVIATION = {
+    name.lower(): abbreviation.lower() for abbreviation, name in STATE_ABBREVIATIONS.items()}
+STATE_ABBREVIATION_TO_NAME = {
+    abbreviation.lower(): name for abbreviation, name in STATE_ABBREVIATIONS.items()}
+# A state named anywhere in a location: a full name, optionally followed by
+# 'state' (in lowercase text), or an abbreviation written in capitals
+STATE_NAME_PATTERN = re.compile(r'\b(?P<name>{})(?: state)?\b'.format(
+    '|'.join(sorted(STATE_NAME_TO_ABBREVIATION, key=len, reverse=True))))
+STATE_ABBREVIATION_PATTERN = re.compile(r'\b(?:{})\b'.format('|'.join(STATE_ABBREVIATIONS)))
+# State names that are also countries, read as the state unless the place
+# before them is a known foreign city ('Tbilisi, Georgia')
+AMBIGUOUS_STATE_NAMES = frozenset(['georgia'])
+
+# Offline gazetteer of cities, aliases, regions and countries, and the words
+# that mark a diarist without a fixed home
+GAZETTEER_PATH = 'gazetteer.csv'
+NOMAD_PATTERN = r'\bnomad|\bvan\b|\brv\b|travel|various|everywhere|on the road|\bboat\b|\byacht'
+
+# The largest US cities by population (from:
+# https://en.wikipedia.org/wiki/List_of_United_States_cities_by_population) and
+# the other names diarists use for New York, as normalized location keys
+MAJOR_CITIES = [
+    'New York, NY', 'Los Angeles, CA', 'Chicago, IL', 'Houston, TX',
+    'Phoenix, AZ', 'Philadelphia, PA', 'San Antonio, TX', 'Dallas, TX',
+    'San Jose, CA', 'Austin, TX', 'Jacksonville, FL', 'Fort Worth, TX',
+    'Columbus, OH', 'Charlotte, NC', 'San Francisco, CA',
+    'Indianapolis, IN', 'Seattle, WA', 'Denver, CO', 'Washington, DC',
+    'Boston, MA', 'El Paso, TX', 'Nashville, TN', 'Detroit, MI',
+    'Oklahoma City, OK', 'Brooklyn, NY', 'Queens, NY', 'Manhattan, NY',
+    ]
+HIGH_COST_LOCATIONS = frozenset(city.lower() for city in MAJOR_CITIES)
+
+# 0/1 flags stored as uint8, and string columns stored as categoricals when at
+# most this share of their values are distinct
+FLAG_COLUMNS = ['nomad', 'international', 'high_cost_of_living_area']
+CATEGORY_MAX_DISTINCT_RATIO = 0.5
+
+# Metadata columns that are not carried into data_clean
+TEXT_DROP_COLUMNS = ['age', 'salary', 'nomad', 'international', 'high_cost_of_living_area']
+
+# Text cleaning patterns, compiled once
+BRACKETED_TEXT_PATTERN = re.compile(r'\[.*?\]')
+PUNCTUATION_PATTERN = re.compile('[%s]' % re.escape(string.punctuation))
+# Anchored at a word boundary so the engine does not retry inside every word
+WORDS_WITH_DIGITS_PATTERN = re.compile(r'\b\w*\d\w*')
+EXTRA_CHARACTERS = ['‘', '’', '“', '”', '…', '\n']
+
 # Helper function to remove blanks rows
 def remove_blank_rows(diarist_df):
     '''
@@ -26,310 +117,120 @@ def remove_blank_rows(diarist_df):
 
     return diarist_df
 
-# Create function to clean salaries by removing common characters in salaries
-def clean_salaries_round_1(text):
+# Parse the free-text salaries for a whole column at once
+def normalize_salaries(salaries):
     '''
-    Removes $ , from text.
+    Converts the free-text salary column to yearly numbers with vectorized
+    string operations. Takes current salary (no bonuses). If unemployed, put 0.
+    If salary range given, takes average. If hourly rate, calculated per year
+    based on 40 hours/week. If daily rate given, calculated per year based on
+    5 days/week and 52 weeks per year. Weekly and monthly rates are multiplied
+    by 52 and 12. The pay period is the one written right after the first
+    number. Removes $ , and expands a trailing k, m or million.
+    Salaries repeat a lot, so each distinct string is parsed once.
 
     Parameters
     ----------
-    text : A string of uncleaned text.
+    salaries : A series of uncleaned salary text.
 
     Returns
     -------
-    The original text that has been cleaned with $ and , removed.
-    '''
-    text = text.replace('$', '')
-    text = text.replace(',', '')
-
-    return text
-
-def clean_salaries_round_2(diarist_df):
-    '''
-    A function that manually fix salaries that aren't just 1 number. Takes
-    current salary (no bonuses). If unemployed, put 0. If salary range given,
-    takes average. If hourly rate, calculated per year based on 40 hours/week.
-    If daily rate given, calculated per year based on 5 days/week
-    and 52 weeks per year.
+    A float series of yearly salaries, NaN where no number could be parsed.
+    '''
+    codes, distinct_salaries = pd.factorize(salaries.astype(str), use_na_sentinel=False)
+    raw_text = pd.Series(distinct_salaries).str.lower()
+
+    # Drop bonuses and anything else after the current salary
+    text = raw_text.str.split(SALARY_EXTRAS_PATTERN, n=1, regex=True).str[0]
+    text = text.str.replace(r'[$,]', '', regex=True)
+
+    parts = text.str.extract(SALARY_PATTERN)
+    low = pd.to_numeric(parts.low, errors='coerce')
+    high = pd.to_numeric(parts.high, errors='coerce')
+    high_scale = parts.high_scale.map(SALARY_SCALES).astype(float)
+    high = high * high_scale.fillna(1)
+    # "50-60k" applies the k to both ends of the range
+    low_scale = parts.low_scale.map(SALARY_SCALES).astype(float)
+    low_scale = low_scale.fillna(high_scale.where(low < 1000)).fillna(1)
+    low = low * low_scale
+
+    yearly = pd.concat([low, high], axis=1).mean(axis=1)
+    for period_pattern, periods_per_year in PAY_PERIODS:
+        in_period = parts.period.str.contains(period_pattern, na=False)
+        yearly = yearly.where(~in_period, yearly * periods_per_year)
+    yearly = yearly.where(~raw_text.str.contains(UNEMPLOYED_PATTERN, na=False), 0)
+
+    return pd.Series(yearly.to_numpy()[codes], index=salaries.index, name=salaries.name)
+
+# Load the hand-made corrections keyed by story_title
+def load_overrides(overrides_path=OVERRIDES_PATH):
+    '''
+    Loads the table of manual corrections. Each row is keyed by story_title and
+    may correct the salary (current salary, no bonuses; 0 if unemployed; the
+    average of a range; hourly rates times 40 hours/week and daily rates times
+    5 days/week, over 52 weeks), fix the spelling of the location, or flag the
+    diarist as nomad or international. Blank cells leave the scraped value.
 
     Parameters
     ----------
-    diarist_df : A dataframe containing only the metadata from the daily diaries.
+    overrides_path : The path of the overrides csv.
 
     Returns
     -------
-    A cleaner version of diarist_df where specific diarists salaries with errors
-    have been cleaned.
-    '''
-    diarist_df.at[0, 'salary'] = 187000
-    diarist_df.at[2, 'salary'] = 0
-    diarist_df.at[3, 'salary'] = 145500
-    diarist_df.at[10, 'salary'] = 325000
-    diarist_df.at[11, 'salary'] = 128000
-    diarist_df.at[12, 'salary'] = 103500
-    diarist_df.at[13, 'salary'] = 190000
-    diarist_df.at[15, 'salary'] = 0
-    diarist_df.at[26, 'salary'] = 105000
-    diarist_df.at[27, 'salary'] = 230961
-    diarist_df.at[28, 'salary'] = 91000
-    diarist_df.at[30, 'salary'] = 40000
-    diarist_df.at[31, 'salary'] = 78600
-    diarist_df.at[33, 'salary'] = 45500
-    diarist_df.at[36, 'salary'] = 0
-    diarist_df.at[41, 'salary'] = 96000
-    diarist_df.at[42, 'salary'] = 100000
-    diarist_df.at[44, 'salary'] = 105000
-    diarist_df.at[45, 'salary'] = 27246
-    diarist_df.at[47, 'salary'] = 43680
-    diarist_df.at[48, 'salary'] = 50000
-    diarist_df.at[56, 'salary'] = 50000
-    diarist_df.at[57, 'salary'] = 80000
-    diarist_df.at[58, 'salary'] = 0
-    diarist_df.at[68, 'salary'] = 44100
-    diarist_df.at[69, 'salary'] = 66000
-    diarist_df.at[71, 'salary'] = 71000
-    diarist_df.at[77, 'salary'] = 60000
-    diarist_df.at[79, 'salary'] = 28000
-    diarist_df.at[85, 'salary'] = 0
-    diarist_df.at[86, 'salary'] = 34840
-    diarist_df.at[87, 'salary'] = 83000
-    diarist_df.at[88, 'salary'] = 76500
-    diarist_df.at[90, 'salary'] = 86500
-    diarist_df.at[93, 'salary'] = 115000
-    diarist_df.at[94, 'salary'] = 37440
-    diarist_df.at[95, 'salary'] = 32000
-    diarist_df.at[96, 'salary'] = 150000
-    diarist_df.at[97, 'salary'] = 76000
-    diarist_df.at[99, 'salary'] = 120000
-    diarist_df.at[101, 'salary'] = 50000
-    diarist_df.at[102, 'salary'] = 70000
-    diarist_df.at[112, 'salary'] = 115000
-    diarist_df.at[114, 'salary'] = 62473
-    diarist_df.at[116, 'salary'] = 110000
-    diarist_df.at[119, 'salary'] = 240000
-    diarist_df.at[120, 'salary'] = 104738
-    diarist_df.at[121, 'salary'] = 0
-    diarist_df.at[125, 'salary'] = 40000
-
-    return diarist_df
-
-def clean_salaries_round_3(diarist_df):
+    A dataframe of overrides with one row per story_title.
     '''
-    A function that manually fix salaries that aren't just 1 number. Takes
-    current salary (no bonuses). If unemployed, put 0. If salary range given,
-    takes average. If hourly rate, calculated per year based on 40 hours/week.
-    If daily rate given, calculated per year based on 5 days/week
-    and 52 weeks per year.
+    overrides = pd.read_csv(overrides_path, dtype={
+        'story_title': str, 'salary': 'Int64', 'location': str,
+        'nomad': 'Int64', 'international': 'Int64'})
 
-    Parameters
-    ----------
-    diarist_df : A dataframe containing only the metadata from the daily diaries.
+    return overrides.drop_duplicates(subset='story_title', keep='last')
 
-    Returns
-    -------
-    A cleaner version of diarist_df where specific diarists salaries with errors
-    have been cleaned.
-    '''
-    diarist_df.at[126, 'salary'] = 60000
-    diarist_df.at[127, 'salary'] = 38264
-    diarist_df.at[128, 'salary'] = 82000
-    diarist_df.at[133, 'salary'] = 5000
-    diarist_df.at[136, 'salary'] = 150000
-    diarist_df.at[143, 'salary'] = 154000
-    diarist_df.at[145, 'salary'] = 100000
-    diarist_df.at[148, 'salary'] = 14856
-    diarist_df.at[152, 'salary'] = 63500
-    diarist_df.at[158, 'salary'] = 82500
-    diarist_df.at[159, 'salary'] = 61948
-    diarist_df.at[162, 'salary'] = 84300
-    diarist_df.at[163, 'salary'] = 135000
-    diarist_df.at[165, 'salary'] = 90000
-    diarist_df.at[166, 'salary'] = 65000
-    diarist_df.at[169, 'salary'] = 80000
-    diarist_df.at[170, 'salary'] = 105000
-    diarist_df.at[171, 'salary'] = 515000
-    diarist_df.at[173, 'salary'] = 74000
-    diarist_df.at[175, 'salary'] = 45000
-    diarist_df.at[179, 'salary'] = 0
-    diarist_df.at[180, 'salary'] = 73850
-    diarist_df.at[186, 'salary'] = 31915
-    diarist_df.at[187, 'salary'] = 52000
-    diarist_df.at[190, 'salary'] = 108000
-    diarist_df.at[192, 'salary'] = 137000
-    diarist_df.at[193, 'salary'] = 89000
-    diarist_df.at[194, 'salary'] = 55640
-    diarist_df.at[198, 'salary'] = 111524
-    diarist_df.at[201, 'salary'] = 144870
-    diarist_df.at[202, 'salary'] = 210000
-    diarist_df.at[204, 'salary'] = 104000
-    diarist_df.at[205, 'salary'] = 80000
-    diarist_df.at[209, 'salary'] = 45760
-    diarist_df.at[213, 'salary'] = 180780
-    diarist_df.at[214, 'salary'] = 72000
-    diarist_df.at[215, 'salary'] = 133000
-    diarist_df.at[217, 'salary'] = 30000
-    diarist_df.at[219, 'salary'] = 77000
-    diarist_df.at[221, 'salary'] = 36000
-    diarist_df.at[223, 'salary'] = 61000
-    diarist_df.at[224, 'salary'] = 52000
-    diarist_df.at[228, 'salary'] = 115000
-    diarist_df.at[229, 'salary'] = 145600
-    diarist_df.at[232, 'salary'] = 280000
-    diarist_df.at[238, 'salary'] = 46000
-    diarist_df.at[242, 'salary'] = 20250
-    diarist_df.at[248, 'salary'] = 39208
-    diarist_df.at[249, 'salary'] = 43617
-
-    return diarist_df
-
-def clean_salaries_round_4(diarist_df):
+def unmatched_overrides(diarist_df, overrides):
     '''
-    A function that manually fix salaries that aren't just 1 number. Takes
-    current salary (no bonuses). If unemployed, put 0. If salary range given,
-    takes average. If hourly rate, calculated per year based on 40 hours/week.
-    If daily rate given, calculated per year based on 5 days/week
-    and 52 weeks per year.
+    Finds overrides whose story_title no longer matches any diarist, e.g.
+    because a diary was renamed or dropped from the scrape.
 
     Parameters
     ----------
     diarist_df : A dataframe containing only the metadata from the daily diaries.
+    overrides : The dataframe of overrides from load_overrides.
 
     Returns
     -------
-    A cleaner version of diarist_df where specific diarists salaries with errors
-    have been cleaned.
-    '''
-    diarist_df.at[251, 'salary'] = 44000
-    diarist_df.at[259, 'salary'] = 120000
-    diarist_df.at[260, 'salary'] = 40000
-    diarist_df.at[261, 'salary'] = 20840
-    diarist_df.at[262, 'salary'] = 59925
-    diarist_df.at[264, 'salary'] = 149000
-    diarist_df.at[272, 'salary'] = 285000
-    diarist_df.at[274, 'salary'] = 42000
-    diarist_df.at[276, 'salary'] = 96400
-    diarist_df.at[277, 'salary'] = 170000
-    diarist_df.at[280, 'salary'] = 62000
-    diarist_df.at[284, 'salary'] = 64000
-    diarist_df.at[287, 'salary'] = 100000
-    diarist_df.at[292, 'salary'] = 180000
-    diarist_df.at[297, 'salary'] = 52827
-    diarist_df.at[298, 'salary'] = 85000
-    diarist_df.at[299, 'salary'] = 208800
-    diarist_df.at[300, 'salary'] = 200000
-    diarist_df.at[301, 'salary'] = 125000
-    diarist_df.at[302, 'salary'] = 34500
-    diarist_df.at[304, 'salary'] = 70000
-    diarist_df.at[307, 'salary'] = 70000
-    diarist_df.at[308, 'salary'] = 37440
-    diarist_df.at[311, 'salary'] = 52817
-    diarist_df.at[312, 'salary'] = 122600
-    diarist_df.at[315, 'salary'] = 51500
-    diarist_df.at[328, 'salary'] = 120000
-    diarist_df.at[329, 'salary'] = 92400
-    diarist_df.at[330, 'salary'] = 50000
-    diarist_df.at[331, 'salary'] = 155000
-    diarist_df.at[332, 'salary'] = 33280
-    diarist_df.at[333, 'salary'] = 41600
-    diarist_df.at[344, 'salary'] = 49000
-    diarist_df.at[346, 'salary'] = 26000
-    diarist_df.at[347, 'salary'] = 94330
-    diarist_df.at[348, 'salary'] = 23000
-    diarist_df.at[349, 'salary'] = 100000
-    diarist_df.at[350, 'salary'] = 35360
-    diarist_df.at[355, 'salary'] = 26808
-    diarist_df.at[357, 'salary'] = 78000
-    diarist_df.at[358, 'salary'] = 52500
-    diarist_df.at[359, 'salary'] = 30000
-    diarist_df.at[360, 'salary'] = 150000
-    diarist_df.at[364, 'salary'] = 52000
-    diarist_df.at[366, 'salary'] = 56000
-    diarist_df.at[367, 'salary'] = 167000
-    diarist_df.at[371, 'salary'] = 72000
-    diarist_df.at[377, 'salary'] = 75000
-    diarist_df.at[384, 'salary'] = 15000
-
-    return diarist_df
+    A list of the story titles that were not found.
+    '''
+    return overrides.story_title[~overrides.story_title.isin(diarist_df.story_title)].tolist()
 
-def clean_salaries_round_5(diarist_df):
+def apply_overrides(diarist_df, overrides):
     '''
-    A function that manually fix salaries that aren't just 1 number. Takes
-    current salary (no bonuses). If unemployed, put 0. If salary range given,
-    takes average. If hourly rate, calculated per year based on 40 hours/week.
-    If daily rate given, calculated per year based on 5 days/week
-    and 52 weeks per year.
+    Applies the manual corrections to the salary and location columns and adds
+    the nomad and international columns with one merge on story_title. The
+    flags are left empty where there is no override so add_location_fields can
+    fill them from the gazetteer. Overrides that match no diarist are reported.
 
     Parameters
     ----------
     diarist_df : A dataframe containing only the metadata from the daily diaries.
+    overrides : The dataframe of overrides from load_overrides.
 
     Returns
     -------
-    A cleaner version of diarist_df where specific diarists salaries with errors
-    have been cleaned.
-    '''
-    diarist_df.at[387, 'salary'] = 110000
-    diarist_df.at[390, 'salary'] = 34376
-    diarist_df.at[392, 'salary'] = 115900
-    diarist_df.at[397, 'salary'] = 57200
-    diarist_df.at[408, 'salary'] = 194000
-    diarist_df.at[414, 'salary'] = 200000
-    diarist_df.at[417, 'salary'] = 120000
-    diarist_df.at[424, 'salary'] = 54000
-    diarist_df.at[426, 'salary'] = 34216
-    diarist_df.at[432, 'salary'] = 48000
-    diarist_df.at[439, 'salary'] = 80000
-    diarist_df.at[444, 'salary'] = 45645
-    diarist_df.at[450, 'salary'] = 20000
-    diarist_df.at[452, 'salary'] = 120000
-    diarist_df.at[456, 'salary'] = 21419
-    diarist_df.at[457, 'salary'] = 125000
-    diarist_df.at[461, 'salary'] = 85500
-    diarist_df.at[481, 'salary'] = 30000
-    diarist_df.at[487, 'salary'] = 500000
-    diarist_df.at[490, 'salary'] = 32000
-    diarist_df.at[495, 'salary'] = 104000
-    diarist_df.at[499, 'salary'] = 115000
-
-    return diarist_df
-
-def clean_salaries_round_6(diarist_df):
+    A cleaner version of diarist_df where the corrections have been applied.
     '''
-    A function that manually fixes missing salaries by looking them up on the
-    Refinery29 website.
+    unmatched = unmatched_overrides(diarist_df, overrides)
+    if unmatched:
+        print('{} overrides match no diarist:'.format(len(unmatched)))
+        print('\n'.join(unmatched))
 
-    Parameters
-    ----------
-    diarist_df : A dataframe containing only the metadata from the daily diaries.
+    merged = diarist_df[['story_title']].merge(overrides, on='story_title', how='left')
+    merged.index = diarist_df.index
 
-    Returns
-    -------
-    A cleaner version of diarist_df where specific diarists salaries with errors
-    have been cleaned by referencing the Refinery29 website.
-    '''
-    diarist_df.at[160, 'salary'] = 36255
-    diarist_df.at[184, 'salary'] = 230000
-    diarist_df.at[273, 'salary'] = 0
-    diarist_df.at[338, 'salary'] = 37000
-    diarist_df.at[339, 'salary'] = 65515
-    diarist_df.at[356, 'salary'] = 128000
-    diarist_df.at[361, 'salary'] = 11000
-    diarist_df.at[389, 'salary'] = 123000
-    diarist_df.at[406, 'salary'] = 92800
-    diarist_df.at[415, 'salary'] = 85000
-    diarist_df.at[421, 'salary'] = 48000
-    diarist_df.at[422, 'salary'] = 55000
-    diarist_df.at[428, 'salary'] = 31720
-    diarist_df.at[433, 'salary'] = 44673
-    diarist_df.at[434, 'salary'] = 62400
-    diarist_df.at[436, 'salary'] = 86000
-    diarist_df.at[448, 'salary'] = 56035
-    diarist_df.at[455, 'salary'] = 10560
-    diarist_df.at[458, 'salary'] = 12000
-    diarist_df.at[469, 'salary'] = 61000
-    diarist_df.at[485, 'salary'] = 60000
-    diarist_df.at[494, 'salary'] = 44096
-    diarist_df.at[498, 'salary'] = 16000
+    diarist_df = diarist_df.copy()
+    for column in ['salary', 'location']:
+        diarist_df[column] = merged[column].astype(object).where(
+            merged[column].notna(), diarist_df[column])
+    for column in ['nomad', 'international']:
+        diarist_df[column] = merged[column]
 
     return diarist_df
 
@@ -362,79 +263,145 @@ def clean_salaries_round_7(diarist_df):
 
     return diarist_df
 
-def clean_locations_round_1(diarist_df):
+def find_us_state(location):
     '''
-    A function that manually fixes the locations by fixing abbreviations and
-    spelling.
+    Finds a US state named anywhere in a location, by its full name or by its
+    abbreviation in capitals (so 'in' and 'me' in lowercase text do not count).
 
     Parameters
     ----------
-    diarist_df : A dataframe containing only the metadata from the daily diaries.
+    location : A text string of a location.
 
     Returns
     -------
-    A cleaner version of diarist_df where specific diarists locations have been
-    manually cleaned for spelling and mistakes.
-    '''
-
-    diarist_df.at[19, 'location'] = 'New York, NY'
-    diarist_df.at[21, 'location'] = 'Los Angeles, CA'
-    diarist_df.at[24, 'location'] = 'New York, NY'
-    diarist_df.at[38, 'location'] = 'Boston, MA'
-    diarist_df.at[62, 'location'] = 'Boston, MA'
-    diarist_df.at[87, 'location'] = 'San Francisco, CA'
-    diarist_df.at[107, 'location'] = 'New York, NY'
-    diarist_df.at[108, 'location'] = 'San Francisco, CA'
-    diarist_df.at[115, 'location'] = 'New York, NY'
-    diarist_df.at[116, 'location'] = 'Philadelphia, PA'
-    diarist_df.at[163, 'location'] = 'Baltimore, MD'
-    diarist_df.at[235, 'location'] = 'Chicago, IL'
-    diarist_df.at[243, 'location'] = 'Los Angeles, CA'
-    diarist_df.at[250, 'location'] = 'New York, NY'
-    diarist_df.at[258, 'location'] = 'New York, NY'
-    diarist_df.at[310, 'location'] = 'Chicago, IL'
-    diarist_df.at[330, 'location'] = 'Denver, CO'
-    diarist_df.at[384, 'location'] = 'Chicago, IL'
-    diarist_df.at[387, 'location'] = 'Chicago, IL'
-    diarist_df.at[388, 'location'] = 'Chicago, IL'
-    diarist_df.at[393, 'location'] = 'San Francisco, CA'
-    diarist_df.at[405, 'location'] = 'Boston, MA'
-    diarist_df.at[406, 'location'] = 'Boston, MA'
-    diarist_df.at[422, 'location'] = 'Detroit, MI'
-    diarist_df.at[429, 'location'] = 'New York, NY'
-    diarist_df.at[55, 'location'] = 'Japan'
-    diarist_df.at[273, 'location'] = 'Toronto'
-    diarist_df.at[320, 'location'] = 'Bali, Indonesia'
-    diarist_df.at[475, 'location'] = 'Chengdu, China'
-    diarist_df.at[142, 'location'] = 'Canada'
+    A tuple of the text that matched and the state abbreviation, or None.
+    '''
+    text = re.sub(r'\s+', ' ', str(location).replace('.', '')).strip()
+    match = STATE_NAME_PATTERN.search(text.lower())
+    if match is not None:
+        return match.group(), STATE_NAME_TO_ABBREVIATION[match.group('name')].upper()
+    match = STATE_ABBREVIATION_PATTERN.search(text)
+    if match is not None:
+        return match.group().lower(), match.group()
 
-    return diarist_df
+    return None
 
-def clean_locations_round_2(diarist_df):
+# Load the bundled gazetteer of cities, regions and countries
+@lru_cache(maxsize=None)
+def load_gazetteer(gazetteer_path=GAZETTEER_PATH):
     '''
-    A function that adds a column if the diarist lives a nomadic lifestyle.
+    Loads the offline gazetteer. Each row maps a lowercase name (a city, an
+    alias like nyc or bay area, a region or a country) to a canonical city,
+    state abbreviation and country. US states come from STATE_ABBREVIATIONS.
 
     Parameters
     ----------
-    diarist_df : A dataframe containing only the metadata from the daily diaries.
+    gazetteer_path : The path of the gazetteer csv.
+
+    Returns
+    -------
+    A dictionary of name to (city, state, country) and a compiled pattern that
+    finds the longest gazetteer name inside a location.
+    '''
+    gazetteer = pd.read_csv(gazetteer_path, dtype=str, keep_default_na=False)
+    places = {row.name: (row.city or None, row.state or None, row.country)
+              for row in gazetteer.itertuples(index=False)}
+    names = sorted(places, key=len, reverse=True)
+    name_pattern = re.compile(r'\b(?:{})\b'.format('|'.join(map(re.escape, names))))
+
+    return places, name_pattern
+
+@lru_cache(maxsize=None)
+def resolve_location(location, gazetteer_path=GAZETTEER_PATH):
+    '''
+    Parses one free-text location against the gazetteer. A US state (full name
+    or abbreviation) after the last comma is tried first, then a country or
+    region, then the place before the comma, then the longest gazetteer name
+    found anywhere in the text. A state name that is also a country only counts
+    as the state when the place before it is not a known foreign city
+    ('Atlanta, Georgia' but not 'Tbilisi, Georgia'). When nothing before the
+    comma resolved the country, a US state named anywhere in the text wins over
+    a foreign place ('New Mexico' is not Mexico, 'Georgia' is the state) and
+    over a shorter US name ('Washington state' is not DC). Results are memoized
+    per raw string.
+
+    Parameters
+    ----------
+    location : A text string of a location.
+    gazetteer_path : The path of the gazetteer csv.
+
+    Returns
+    -------
+    A tuple of city, state, country (None where unknown), and the international
+    and nomad flags (1 or 0).
+    '''
+    places, name_pattern = load_gazetteer(gazetteer_path)
+    text = re.sub(r'\s+', ' ', str(location).lower().replace('.', '')).strip()
+    parts = [part.strip() for part in text.split(',') if part.strip()]
+    nomad = int(bool(re.search(NOMAD_PATTERN, text)))
+    city = state = country = None
+
+    if parts:
+        last = parts[-1]
+        place = places.get(parts[0])
+        if len(parts) > 1 and last in AMBIGUOUS_STATE_NAMES and place is not None and \
+                place[2] != 'United States':
+            city, state, country = place
+        elif len(parts) > 1 and last in STATE_ABBREVIATION_TO_NAME:
+            state, country = last.upper(), 'United States'
+        elif len(parts) > 1 and last in STATE_NAME_TO_ABBREVIATION:
+            state, country = STATE_NAME_TO_ABBREVIATION[last].upper(), 'United States'
+        elif last in places:
+            city, state, country = places[last]
+
+        if place is not None and (country is None or place[2] == country) and \
+                (state is None or place[1] in (None, state)):
+            city = place[0] or city
+            state = state or place[1]
+            country = country or place[2]
+        elif country is not None and len(parts) > 1:
+            city = parts[0].title()
+
+    us_state = find_us_state(location)
+    if country is None:
+        match = name_pattern.search(text)
+        if match is not None and (us_state is None or (
+                places[match.group()][2] == 'United States'
+                and len(match.group()) >= len(us_state[0]))):
+            city, state, country = places[match.group()]
+        elif us_state is not None:
+            state, country = us_state[1], 'United States'
+
+    international = int(country is not None and country != 'United States')
+
+    return city, state, country, international, nomad
+
+def resolve_locations(locations):
+    '''
+    Resolves a whole column of locations. Each distinct string is parsed once
+    by resolve_location and the results are broadcast back to every row.
+
+    Parameters
+    ----------
+    locations : A series of location text.
 
     Returns
     -------
-    An updated version of diarist_df in which a new column has been added and coded
-    for diarists who live a nomadic lifestyle.
+    A dataframe with city, state, country, international and nomad columns.
     '''
-    diarist_df['nomad'] = 0
-    diarist_df.at[96, 'nomad'] = 1
-    diarist_df.at[171, 'nomad'] = 1
-    diarist_df.at[298, 'nomad'] = 1
-    diarist_df.at[431, 'nomad'] = 1
-    diarist_df.at[472, 'nomad'] = 1
+    codes, distinct_locations = pd.factorize(locations.astype(str), use_na_sentinel=False)
+    resolved = pd.DataFrame([resolve_location(location) for location in distinct_locations],
+                            columns=['city', 'state', 'country', 'international', 'nomad'])
+    resolved = resolved.iloc[codes]
+    resolved.index = locations.index
 
-    return diarist_df
+    return resolved
 
-def clean_locations_round_3(diarist_df):
+def add_location_fields(diarist_df):
     '''
-    A function that adds a column if the diarist lives internationally.
+    A function that adds the canonical city, state and country of each diarist
+    and fills in the nomad and international flags that were not set by an
+    override.
 
     Parameters
     ----------
@@ -442,104 +409,41 @@ def clean_locations_round_3(diarist_df):
 
     Returns
     -------
-    An updated version of diarist_df in which a new column has been added and coded
-    for diarists who live internationally.
-    '''
-    diarist_df['international'] = 0
-    diarist_df.at[0, 'international'] = 1
-    diarist_df.at[15, 'international'] = 1
-    diarist_df.at[26, 'international'] = 1
-    diarist_df.at[28, 'international'] = 1
-    diarist_df.at[30, 'international'] = 1
-    diarist_df.at[35, 'international'] = 1
-    diarist_df.at[55, 'international'] = 1
-    diarist_df.at[95, 'international'] = 1
-    diarist_df.at[98, 'international'] = 1
-    diarist_df.at[99, 'international'] = 1
-    diarist_df.at[117, 'international'] = 1
-    diarist_df.at[145, 'international'] = 1
-    diarist_df.at[146, 'international'] = 1
-    diarist_df.at[149, 'international'] = 1
-    diarist_df.at[187, 'international'] = 1
-    diarist_df.at[215, 'international'] = 1
-    diarist_df.at[226, 'international'] = 1
-    diarist_df.at[229, 'international'] = 1
-    diarist_df.at[230, 'international'] = 1
-    diarist_df.at[231, 'international'] = 1
-    diarist_df.at[257, 'international'] = 1
-    diarist_df.at[263, 'international'] = 1
-    diarist_df.at[271, 'international'] = 1
-    diarist_df.at[273, 'international'] = 1
-    diarist_df.at[286, 'international'] = 1
-    diarist_df.at[287, 'international'] = 1
-    diarist_df.at[289, 'international'] = 1
-    diarist_df.at[301, 'international'] = 1
-    diarist_df.at[302, 'international'] = 1
-    diarist_df.at[303, 'international'] = 1
-    diarist_df.at[320, 'international'] = 1
-    diarist_df.at[321, 'international'] = 1
-    diarist_df.at[337, 'international'] = 1
-    diarist_df.at[347, 'international'] = 1
-    diarist_df.at[350, 'international'] = 1
-    diarist_df.at[351, 'international'] = 1
-    diarist_df.at[395, 'international'] = 1
-    diarist_df.at[396, 'international'] = 1
-    diarist_df.at[400, 'international'] = 1
-    diarist_df.at[401, 'international'] = 1
-    diarist_df.at[417, 'international'] = 1
-    diarist_df.at[421, 'international'] = 1
-    diarist_df.at[436, 'international'] = 1
-    diarist_df.at[454, 'international'] = 1
-    diarist_df.at[466, 'international'] = 1
-    diarist_df.at[475, 'international'] = 1
+    An updated version of diarist_df with city, state and country columns and
+    nomad and international coded as 1 or 0.
+    '''
+    resolved = resolve_locations(diarist_df.location)
+
+    diarist_df = diarist_df.copy()
+    for column in ['city', 'state', 'country']:
+        diarist_df[column] = resolved[column]
+    for column in ['nomad', 'international']:
+        if column in diarist_df:
+            diarist_df[column] = diarist_df[column].fillna(resolved[column]).astype(int)
+        else:
+            diarist_df[column] = resolved[column]
 
     return diarist_df
 
-def in_major_city(location):
+def high_cost_of_living_area(locations):
     '''
-    Takes in a location and returns a value of 0 or 1 if the input location is
-    in one of the lists.
+    Codes each location with a 1 if the diarist lives in one of the largest US
+    cities (or a New York borough) and a 0 if not. The flag is taken from the
+    city and state resolve_locations finds, so aliases like 'NYC' and
+    'Manhattan' count the same as 'New York, NY'.
 
     Parameters
     ----------
-    location : A text string of a location.
+    locations : A series of location text.
 
     Returns
     -------
-    A new column coded with a 1 if the diarist lives in a major city in the lists
-    below or a 0 if not.
-    '''
-    major_city_list_abbreviation = [
-        'New York, NY', 'Los Angeles, CA', 'Chicago, IL', 'Houston, TX',
-        'Phoenix, AZ', 'Philadelphia, PA', 'San Antonio, TX', 'Dallas, TX',
-        'San Jose, CA', 'Austin, TX', 'Jacksonville, FL', 'Fort Worth, TX',
-        'Columbus, OH', 'Charlotte, NC', 'San Francisco, CA',
-        'Indianapolis, IN', 'Seattle, WA', 'Denver, CO', 'Washington, DC',
-        'Boston, MA', 'El Paso, TX', 'Nashville, TN', 'Detroit, MI',
-        'Oklahoma City, OK'
-        ]
-
-    major_city_list_full_state = [
-        'New York, New York', 'Los Angeles, California', 'Chicago, Illinois',
-        'Houston, Texas', 'Phoenix, Arizona', 'Philadelphia, PA',
-        'San Antonio, Texas', 'Dallas, Texas', 'San Jose, California',
-        'Austin, Texas', 'Jacksonville, Florida', 'Fort Worth, Texas',
-        'Columbus, Ohio', 'Charlotte, North Carolina',
-        'San Francisco, California', 'Indianapolis, Indiana',
-        'Seattle, Washington', 'Denver, Colorado', 'Washington DC',
-        'Boston, Massachusetts', 'El Paso, Texas', 'Nashville, Tennessee',
-        'Detroit, Michigan', 'Oklahoma City, Oklahoma'
-        ]
-
-    other_names_for_ny = ['Brooklyn, NY', 'Queens, NY', 'Manhattan, NY']
-
-    if (
-            location in major_city_list_abbreviation or
-            location in major_city_list_full_state  or
-            location in other_names_for_ny
-        ):
-        return 1
-    return 0
+    An integer series coded with a 1 for major cities and 0 otherwise.
+    '''
+    resolved = resolve_locations(locations)
+    keys = resolved.city.str.lower() + ', ' + resolved.state.str.lower()
+
+    return keys.isin(HIGH_COST_LOCATIONS).astype(int)
 
 def convert_age_to_int(diarist_df):
     '''
@@ -583,9 +487,7 @@ def clean_text_round_1(text_df, diarist_df):
     updated_text_df = pd.merge(diarist_df, text_df, left_on='story_title', right_on='story_title')
 
     # Drop all columns but link and diary text from updated_text_df
-    updated_text_df.drop(columns=[
-        'age', 'salary', 'nomad', 'international', 'high_cost_of_living_area'],
-                         inplace=True)
+    updated_text_df.drop(columns=TEXT_DROP_COLUMNS, inplace=True)
 
     return updated_text_df
 
@@ -593,7 +495,8 @@ def clean_text_round_2(text):
     '''
     Make text lowercase, remove text in square brackets, remove punctuation,
     remove words containing numbers, remove additional punctuation and other
-    non-sensical text.
+    non-sensical text. Uses the precompiled patterns, in
+    the same order as the original eight re.sub calls so the output matches.
 
     text: A string of text
 
@@ -603,50 +506,280 @@ def clean_text_round_2(text):
     brackets, removes punctuation, removes words containing numbers, removes additional
     punctuation, and other non-sensical text.
     '''
-    text = text.lower()
-    text = re.sub('\\[.*?\\]', '', text)
-    text = re.sub('[%s]' % re.escape(string.punctuation), '', text)
-    text = re.sub(' — ', ' ', text)
-    text = re.sub('\\w*\\d\\w*', '', text)
-    text = re.sub('[‘’“”…]', '', text)
-    text = re.sub('\n', '', text)
-    text = re.sub('^', '', text)
+    text = BRACKETED_TEXT_PATTERN.sub('', text.lower())
+    text = PUNCTUATION_PATTERN.sub('', text).replace(' — ', ' ')
+    text = WORDS_WITH_DIGITS_PATTERN.sub('', text)
+    for character in EXTRA_CHARACTERS:
+        text = text.replace(character, '')
 
     return text
 
-def main():
+def clean_text_series(texts):
     '''
-    Calls internal functions to the script to clean the text data and diarist
-    metadata.
+    Applies clean_text_round_2 to a whole column with the pandas string methods,
+    one pass over the column per step.
+
+    Parameters
+    ----------
+    texts : A series of diary text.
+
+    Returns
+    -------
+    A series of cleaned diary text.
+    '''
+    texts = texts.str.lower().str.replace(BRACKETED_TEXT_PATTERN, '', regex=True)
+    texts = texts.str.replace(PUNCTUATION_PATTERN, '', regex=True)
+    texts = texts.str.replace(' — ', ' ', regex=False)
+    texts = texts.str.replace(WORDS_WITH_DIGITS_PATTERN, '', regex=True)
+    for character in EXTRA_CHARACTERS:
+        texts = texts.str.replace(character, '', regex=False)
+
+    return texts
+
+def clean_text_chunk(texts):
+    '''
+    Cleans a list of diary text; the unit of work for clean_text_parallel.
+    '''
+    return [clean_text_round_2(text) for text in texts]
+
+def clean_text_parallel(texts, processes=None, chunk_size=200, pool=None):
+    '''
+    Cleans a large column of diary text on a pool of processes. The column is
+    split into chunks of chunk_size diaries and the results keep the row order.
+
+    Parameters
+    ----------
+    texts : A series of diary text.
+    processes : The number of worker processes (defaults to the CPU count).
+    chunk_size : The number of diaries sent to a worker at a time.
+    pool : An open Pool to reuse across calls instead of starting a new one.
+
+    Returns
+    -------
+    A series of cleaned diary text with the same index.
+    '''
+    values = texts.tolist()
+    chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+    if pool is None:
+        with Pool(processes) as pool:
+            cleaned = [text for chunk in pool.map(clean_text_chunk, chunks) for text in chunk]
+    else:
+        cleaned = [text for chunk in pool.map(clean_text_chunk, chunks) for text in chunk]
+
+    return pd.Series(cleaned, index=texts.index, name=texts.name)
+
+def clean_diarist_data(diarist_df):
     '''
+    Runs every metadata cleaning step on the diarist dataframe.
 
-    # Load in csv files
-    text_df = pd.read_csv('text_df.csv')
-    diarist_df = pd.read_csv('diarist_df.csv')
+    Parameters
+    ----------
+    diarist_df : A dataframe containing only the metadata from the daily diaries.
 
-    # Text and dataframe cleaning
+    Returns
+    -------
+    The cleaned diarist dataframe.
+    '''
     diarist_df = remove_blank_rows(diarist_df)
 
-    diarist_df.salary = diarist_df.salary.apply(clean_salaries_round_1)
-    diarist_df = clean_salaries_round_2(diarist_df)
-    diarist_df = clean_salaries_round_3(diarist_df)
-    diarist_df = clean_salaries_round_4(diarist_df)
-    diarist_df = clean_salaries_round_5(diarist_df)
-    diarist_df = clean_salaries_round_6(diarist_df)
+    diarist_df.salary = normalize_salaries(diarist_df.salary)
+    diarist_df = apply_overrides(diarist_df, load_overrides())
     diarist_df = clean_salaries_round_7(diarist_df)
+    diarist_df = add_location_fields(diarist_df)
 
-    diarist_df = clean_locations_round_1(diarist_df)
-    diarist_df = clean_locations_round_2(diarist_df)
-    diarist_df = clean_locations_round_3(diarist_df)
-
-    diarist_df['high_cost_of_living_area'] = diarist_df.apply(
-        lambda x: in_major_city(x['location']), axis=1)
+    diarist_df['high_cost_of_living_area'] = high_cost_of_living_area(diarist_df.location)
 
     diarist_df = convert_age_to_int(diarist_df)
 
+    return diarist_df
+
+# Store the cleaned metadata in the smallest dtypes that hold it
+def compact_dtypes(diarist_df):
+    '''
+    Downcasts the numeric columns, stores the 0/1 flags as uint8 and the
+    repeated strings (occupation, location, city, state, country) as
+    categoricals. Parquet keeps these dtypes, so later stages read them back
+    compact.
+
+    Parameters
+    ----------
+    diarist_df : The cleaned diarist dataframe.
+
+    Returns
+    -------
+    A copy of diarist_df with compact dtypes.
+    '''
+    diarist_df = diarist_df.copy()
+    for column in diarist_df.columns:
+        values = diarist_df[column]
+        if column in FLAG_COLUMNS:
+            diarist_df[column] = values.fillna(0).astype('uint8')
+        elif pd.api.types.is_integer_dtype(values):
+            diarist_df[column] = pd.to_numeric(values, downcast='unsigned' if values.min() >= 0
+                                               else 'integer')
+        elif pd.api.types.is_float_dtype(values):
+            diarist_df[column] = pd.to_numeric(values, downcast='float')
+        elif column != 'story_title' and len(values) and \
+                values.nunique() <= CATEGORY_MAX_DISTINCT_RATIO * len(values):
+            diarist_df[column] = values.astype('category')
+
+    return diarist_df
+
+def memory_report(before, after):
+    '''
+    Compares the memory used by each column before and after compact_dtypes.
+
+    Parameters
+    ----------
+    before : The dataframe before compacting.
+    after : The dataframe after compacting.
+
+    Returns
+    -------
+    A dataframe with the dtype and bytes of each column before and after, and a
+    total row.
+    '''
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'bytes_after': after.memory_usage(index=False, deep=True),
+        })
+    report.loc['total'] = ['', '', report.bytes_before.sum(), report.bytes_after.sum()]
+    report['saved'] = 1 - report.bytes_after / report.bytes_before
+
+    return report
+
+# Join batches of diary text to the metadata without merging whole tables
+def metadata_index(diarist_df):
+    '''
+    Builds the lookup of the metadata carried into data_clean.
+
+    Parameters
+    ----------
+    diarist_df : The cleaned diarist dataframe.
+
+    Returns
+    -------
+    A dataframe of the kept metadata columns indexed by story_title.
+    '''
+    return diarist_df.drop(columns=TEXT_DROP_COLUMNS).drop_duplicates(
+        'story_title').set_index('story_title')
+
+def join_text_batch(text_batch, metadata):
+    '''
+    Converts a batch of diary text from lists to strings and joins it to the
+    metadata of each diarist. Diaries without metadata are dropped, as in the
+    merge in clean_text_round_1.
+
+    Parameters
+    ----------
+    text_batch : A batch of rows of the text dataframe.
+    metadata : The lookup built by metadata_index.
+
+    Returns
+    -------
+    A dataframe with the metadata columns followed by diary_text_string.
+    '''
+    text_batch = text_batch[['story_title']].assign(
+        diary_text_string=[', '.join(map(str, l)) for l in text_batch['diary_text']])
+    joined = text_batch.join(metadata, on='story_title', how='inner')
+
+    return joined[['story_title', *metadata.columns, 'diary_text_string']]
+
+def clean_text_in_chunks(diarist_df, chunk_size=100, processes=None, output_name='data_clean'):
+    '''
+    Cleans the diary text chunk_size diaries at a time: each batch of the text
+    table is joined to the metadata, cleaned, and appended to the output table,
+    so memory is bounded by the chunk size rather than the corpus. Only the
+    MinHash signature of each diary is kept, and near-duplicates are removed
+    from the output in a second streaming pass.
+
+    Parameters
+    ----------
+    diarist_df : The cleaned diarist dataframe.
+    chunk_size : The number of diaries read, cleaned and written at a time.
+    processes : The number of worker processes that clean the text.
+    output_name : The name of the output table.
+
+    Returns
+    -------
+    The near-duplicate report from find_near_duplicates.
+    '''
+    metadata = metadata_index(diarist_df)
+    story_titles, signatures, word_hashes = [], [], {}
+
+    with Pool(processes) as pool, TableAppender(output_name) as output:
+        for text_batch in iter_table_batches('text_df', columns=['story_title', 'diary_text'],
+                                             batch_size=chunk_size):
+            data_clean = join_text_batch(text_batch, metadata)
+            data_clean.diary_text_string = clean_text_parallel(
+                data_clean.diary_text_string, chunk_size=max(1, chunk_size // 4), pool=pool)
+            output.append(data_clean)
+            story_titles.extend(data_clean.story_title)
+            signatures.append(minhash_signatures(data_clean.diary_text_string,
+                                                 word_hashes=word_hashes))
+
+    report = find_near_duplicates(np.vstack(signatures), story_titles)
+    if report.dropped.any():
+        remove_rows(output_name, set(report.row[report.dropped]), chunk_size)
+
+    return report
+
+def remove_rows(name, rows, chunk_size=100):
+    '''
+    Rewrites a saved table without the given rows, one batch at a time.
+
+    Parameters
+    ----------
+    name : The name of the table.
+    rows : A set of the row numbers to remove.
+    chunk_size : The number of rows read and written at a time.
+    '''
+    path = find_table(name)
+    start = 0
+    with TableAppender(name + '_filtered', path.rsplit('.', 1)[1]) as filtered:
+        for batch in iter_table_batches(name, batch_size=chunk_size):
+            positions = np.arange(start, start + len(batch))
+            filtered.append(batch[~np.isin(positions, list(rows))])
+            start += len(batch)
+    os.replace(filtered.path, path)
+
+def report_near_duplicates(report):
+    '''
+    Prints how many near-duplicate diaries were dropped and saves the report.
+    '''
+    print('Dropped {} near-duplicate diaries from {} groups'.format(
+        int(report.dropped.sum()), report.group.nunique()))
+    save_table(report, 'near_duplicates')
+
+def main(chunk_size=None):
+    '''
+    Calls internal functions to the script to clean the text data and diarist
+    metadata. With a chunk_size the text table is streamed in batches of that
+    many diaries instead of being loaded whole.
+    '''
+
+    # Load in the scraped metadata, clean it and save it in compact dtypes
+    diarist_df = clean_diarist_data(load_table('diarist_df'))
+    compact_diarist_df = compact_dtypes(diarist_df)
+    print(memory_report(diarist_df, compact_diarist_df).to_string())
+    diarist_df = compact_diarist_df
+    save_table(diarist_df, 'diarist_clean')
+
+    if chunk_size:
+        report_near_duplicates(clean_text_in_chunks(diarist_df, chunk_size))
+        return
+
+    text_df = load_table('text_df')
     data_clean = clean_text_round_1(text_df, diarist_df)
-    data_clean.diary_text_string = data_clean.diary_text_string.apply(clean_text_round_2)
+    data_clean.diary_text_string = clean_text_parallel(data_clean.diary_text_string)
+
+    # Drop reposted and syndicated copies before topic modeling
+    data_clean, report = drop_near_duplicates(data_clean)
+    report_near_duplicates(report)
 
-    data_clean.to_csv('data_clean.csv')
+    save_table(data_clean, 'data_clean')
 
-main()
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
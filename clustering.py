@@ -7,6 +7,11 @@ import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 
+from storage import load_table, save_table
+
+# The metadata columns the diarists are clustered on
+CLUSTER_FEATURES = ['age', 'salary']
+
 def cluster_metadata(diarist_df_numerical):
     '''
     A function that takes a numerical dataframe containing age and salary and
@@ -47,10 +52,12 @@ def append_clusters_to_df(diarist_df, scaled_clusters):
 
     Returns
     -------
-    A dataframe that has the clusters appended to it.
+    A dataframe that has the clusters appended to it, keeping the compact
+    dtypes of diarist_df and storing the cluster as uint8.
     '''
     clustered_data_scaled = diarist_df.copy()
-    clustered_data_scaled['Cluster'] = scaled_clusters
+    clustered_data_scaled['Cluster'] = pd.Series(scaled_clusters, index=diarist_df.index,
+                                                 dtype='uint8')
 
     return clustered_data_scaled
 
@@ -60,14 +67,14 @@ def main():
     and then appends the clusters to the original dataframe.
     '''
 
-    # Load in csv files
-    diarist_df = pd.read_csv('diarist_df.csv')
+    # Load in the cleaned diarist table
+    diarist_df = load_table('diarist_clean')
 
     # Clustering
-    identified_clusters_scaled = cluster_metadata(diarist_df)
+    identified_clusters_scaled = cluster_metadata(diarist_df[CLUSTER_FEATURES])
     clustered_data_scaled = append_clusters_to_df(diarist_df, identified_clusters_scaled)
 
-    # Save to csv
-    clustered_data_scaled.to_csv(r'clustered_data_scaled.csv', index=False)
+    # Save for the cluster topic modeling stage
+    save_table(clustered_data_scaled, 'clustered_data_scaled')
 
 main()
@@ -0,0 +1,217 @@
+'''
+This script finds near-duplicate diaries (reposts and syndicated copies under
+different URLs) with MinHash signatures and LSH banding, so they can be
+reported and dropped before topic modeling. Each diary is hashed once and only
+diaries that share an LSH bucket are compared, so the work grows close to
+linearly with the number of diaries.
+'''
+
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Word shingles, signature length and banding: with 32 bands of 4 rows a pair
+# at 0.7 Jaccard similarity shares a bucket with probability above 0.99, and
+# candidates are kept only if their estimated similarity reaches the threshold
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+NUM_BANDS = 32
+SIMILARITY_THRESHOLD = 0.7
+SEED = 19
+
+# Multiplier for combining the word hashes of a shingle
+SHINGLE_PRIME = np.uint64(1099511628211)
+
+def hash_functions(num_perm=NUM_PERM, seed=SEED):
+    '''
+    Draws the multiply-shift hash functions used for the MinHash permutations.
+
+    Returns
+    -------
+    Two arrays of num_perm odd multipliers and offsets.
+    '''
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    return multipliers, offsets
+
+def shingle_hashes(text, word_hashes, shingle_size=SHINGLE_SIZE):
+    '''
+    Hashes every run of shingle_size words in a diary.
+
+    Parameters
+    ----------
+    text : A cleaned diary.
+    word_hashes : A dictionary of word to hash, filled in as new words are seen.
+    shingle_size : The number of words in each shingle.
+
+    Returns
+    -------
+    An array of the distinct shingle hashes.
+    '''
+    words = text.split()
+    for word in set(words).difference(word_hashes):
+        word_hashes[word] = zlib.crc32(word.encode('utf-8'))
+    ids = np.fromiter(map(word_hashes.__getitem__, words), dtype=np.uint64, count=len(words))
+    if len(ids) < shingle_size:
+        return np.unique(ids)
+
+    shingles = np.zeros(len(ids) - shingle_size + 1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(shingle_size):
+            shingles = shingles * SHINGLE_PRIME + ids[offset:offset + len(shingles)]
+
+    return np.unique(shingles)
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=SEED, word_hashes=None):
+    '''
+    Computes a MinHash signature for each diary.
+
+    Parameters
+    ----------
+    texts : An iterable of cleaned diaries.
+    num_perm : The length of each signature.
+    seed : The seed of the hash functions; signatures are only comparable when
+    they share it.
+    word_hashes : An optional dictionary of word hashes shared across calls.
+
+    Returns
+    -------
+    A (number of diaries, num_perm) uint64 array of signatures. Empty diaries
+    get the maximum value in every position.
+    '''
+    multipliers, offsets = hash_functions(num_perm, seed)
+    word_hashes = {} if word_hashes is None else word_hashes
+
+    signatures = []
+    for text in texts:
+        shingles = shingle_hashes(text if isinstance(text, str) else '', word_hashes)
+        if not len(shingles):
+            signatures.append(np.full(num_perm, np.iinfo(np.uint64).max, dtype=np.uint64))
+            continue
+        with np.errstate(over='ignore'):
+            permuted = np.multiply.outer(multipliers, shingles)
+            permuted += offsets[:, np.newaxis]
+        signatures.append(permuted.min(axis=1))
+
+    if not signatures:
+        return np.empty((0, num_perm), dtype=np.uint64)
+
+    return np.vstack(signatures)
+
+def candidate_pairs(signatures, num_bands=NUM_BANDS):
+    '''
+    Finds the pairs of diaries that share at least one LSH band.
+
+    Parameters
+    ----------
+    signatures : The array returned by minhash_signatures.
+    num_bands : The number of bands the signature is split into.
+
+    Returns
+    -------
+    A set of (i, j) row pairs with i < j.
+    '''
+    n_rows, num_perm = signatures.shape
+    rows_per_band = num_perm // num_bands
+    pairs = set()
+    for band in range(num_bands):
+        band_values = np.ascontiguousarray(
+            signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = band_values.view(np.dtype((np.void, band_values.dtype.itemsize * rows_per_band)))
+        _, bucket, counts = np.unique(keys.ravel(), return_inverse=True, return_counts=True)
+
+        # Only buckets holding more than one diary produce pairs
+        shared = np.flatnonzero(counts[bucket] > 1)
+        order = shared[np.argsort(bucket[shared], kind='stable')]
+        for members in np.split(order, np.flatnonzero(np.diff(bucket[order])) + 1):
+            members = members.tolist()
+            for position, i in enumerate(members):
+                pairs.update((i, j) for j in members[position + 1:])
+
+    return pairs
+
+def find_near_duplicates(signatures, story_titles, threshold=SIMILARITY_THRESHOLD,
+                         num_bands=NUM_BANDS):
+    '''
+    Groups diaries whose estimated Jaccard similarity reaches the threshold.
+    Within each group the diary with the first story_title (then the first
+    row) is kept, so the choice does not depend on the order of the table.
+
+    Parameters
+    ----------
+    signatures : The array returned by minhash_signatures.
+    story_titles : The story title of each row of signatures.
+    threshold : The estimated similarity at which two diaries are duplicates.
+    num_bands : The number of LSH bands.
+
+    Returns
+    -------
+    A dataframe with one row per diary in a group of near-duplicates: its
+    row number, the group (the row number of the diary that is kept),
+    story_title, the story_title that is kept, the estimated similarity to it,
+    and whether the row is dropped.
+    '''
+    story_titles = list(story_titles)
+    parents = list(range(len(story_titles)))
+
+    # Empty diaries all share the same signature but are not duplicates
+    empty = (signatures == np.iinfo(np.uint64).max).all(axis=1)
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in candidate_pairs(signatures, num_bands):
+        if not empty[i] and (signatures[i] == signatures[j]).mean() >= threshold:
+            root_i, root_j = find(i), find(j)
+            parents[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = [find(i) for i in range(len(story_titles))]
+    group_sizes = Counter(groups)
+    kept_rows = {}
+    for i, group in enumerate(groups):
+        if group_sizes[group] > 1:
+            kept = kept_rows.setdefault(group, i)
+            if str(story_titles[i]) < str(story_titles[kept]):
+                kept_rows[group] = i
+
+    rows = []
+    for i, group in enumerate(groups):
+        if group in kept_rows:
+            kept = kept_rows[group]
+            rows.append({'row': i, 'group': kept, 'story_title': story_titles[i],
+                         'kept_story_title': story_titles[kept],
+                         'similarity': float((signatures[i] == signatures[kept]).mean()),
+                         'dropped': kept != i})
+
+    return pd.DataFrame(rows, columns=['row', 'group', 'story_title', 'kept_story_title',
+                                       'similarity', 'dropped'])
+
+def drop_near_duplicates(data_clean, text_column='diary_text_string',
+                         threshold=SIMILARITY_THRESHOLD):
+    '''
+    Drops the near-duplicate diaries from a cleaned text dataframe.
+
+    Parameters
+    ----------
+    data_clean : A dataframe with story_title and cleaned diary text.
+    text_column : The column of cleaned diary text.
+    threshold : The estimated similarity at which two diaries are duplicates.
+
+    Returns
+    -------
+    The dataframe without the dropped diaries, and the report from
+    find_near_duplicates.
+    '''
+    signatures = minhash_signatures(data_clean[text_column])
+    report = find_near_duplicates(signatures, data_clean.story_title, threshold)
+    keep = np.ones(len(data_clean), dtype=bool)
+    keep[report.row[report.dropped].to_numpy(dtype=int)] = False
+
+    return data_clean[keep], report
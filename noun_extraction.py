@@ -0,0 +1,169 @@
+'''
+This script holds the noun extraction shared by the topic modeling scripts.
+Tagging is the slowest step of topic modeling, so the nouns of each diary are
+kept in an on-disk cache keyed by a hash of the cleaned text and the tagger
+version: reruns, and the second topic modeling script, only tag new or changed
+diaries.
+'''
+
+import hashlib
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from multiprocessing import Pool
+
+import nltk
+from nltk import word_tokenize
+from nltk import pos_tag
+from nltk.tag import PerceptronTagger
+
+from storage import evict_sqlite_cache, init_sqlite_cache
+
+NOUN_CACHE_PATH = 'noun_cache.sqlite'
+MAX_NOUN_CACHE_BYTES = 200 * 1024 * 1024
+
+# The zlib-compressed nouns of each diary, keyed by noun_cache_key
+NOUN_CACHE_COLUMNS = 'key TEXT PRIMARY KEY, accessed_at REAL, size INTEGER, nouns BLOB'
+
+# Part of every cache key, so upgrading NLTK or changing what counts as a noun
+# never reuses nouns tagged the old way
+TAGGER_VERSION = 'nltk {} averaged perceptron, NN*'.format(nltk.__version__)
+
+# SQLite limits the number of parameters in one query
+LOOKUP_BATCH_SIZE = 500
+
+# The tagger of this process, loaded once by init_tagger
+TAGGER = None
+
+def nouns(text_string):
+    '''
+    Given a string of text, tokenize the text and pull out only the nouns.
+
+    Parameters
+    ----------
+    text_string : A string of text.
+
+    Returns
+    -------
+    A tokenized version of the text only containing nouns.
+    '''
+    is_noun = lambda pos: pos[:2] == 'NN'
+    tokenized = word_tokenize(text_string)
+    all_nouns = [word for (word, pos) in pos_tag(tokenized) if is_noun(pos)]
+    return ' '.join(all_nouns)
+
+def init_tagger():
+    '''
+    Loads the perceptron tagger once per process; used as the initializer of
+    the pool in parallel_nouns.
+    '''
+    global TAGGER
+    TAGGER = PerceptronTagger()
+
+def nouns_for_batch(texts):
+    '''
+    Extracts the nouns of a batch of diaries with one tag_sents call (what
+    pos_tag_sents does, without looking the tagger up again). Each diary's
+    tokens are tagged as one sequence, as in nouns, so the tags are the same.
+
+    Parameters
+    ----------
+    texts : A list of diaries.
+
+    Returns
+    -------
+    A list of the nouns of each diary.
+    '''
+    if TAGGER is None:
+        init_tagger()
+    tagged = TAGGER.tag_sents([word_tokenize(text) for text in texts])
+
+    return [' '.join(word for (word, pos) in tagged_text if pos[:2] == 'NN')
+            for tagged_text in tagged]
+
+def parallel_nouns(texts, processes=None, batch_size=32):
+    '''
+    Extracts the nouns of many diaries on a pool of processes. Diaries are sent
+    to the workers in batches of batch_size, each worker loads the tagger once,
+    and the results keep the order of texts.
+
+    Parameters
+    ----------
+    texts : A list of diaries.
+    processes : The number of worker processes (defaults to the CPU count), or
+    1 to tag in this process.
+    batch_size : The number of diaries tagged in one call.
+
+    Returns
+    -------
+    A list of the nouns of each diary.
+    '''
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    if processes == 1 or len(batches) <= 1:
+        return [noun_string for batch in batches for noun_string in nouns_for_batch(batch)]
+
+    with Pool(processes, initializer=init_tagger) as pool:
+        return [noun_string for batch in pool.imap(nouns_for_batch, batches)
+                for noun_string in batch]
+
+def noun_cache_key(text, tagger_version=TAGGER_VERSION):
+    '''
+    Returns the cache key of a diary: a SHA-256 of the tagger version and text.
+    '''
+    return hashlib.sha256('{}\0{}'.format(tagger_version, text).encode('utf-8')).hexdigest()
+
+# Extract nouns through the on-disk cache
+def cached_nouns(texts, cache_path=NOUN_CACHE_PATH, max_cache_bytes=MAX_NOUN_CACHE_BYTES,
+                 extract=parallel_nouns, tagger_version=TAGGER_VERSION):
+    '''
+    Returns the nouns of each diary, reading them from the cache where the same
+    text was tagged before and tagging only the rest. Identical diaries are
+    tagged once.
+
+    Parameters
+    ----------
+    texts : An iterable of cleaned diaries.
+    cache_path : The path of the SQLite cache file, or None to skip the cache.
+    max_cache_bytes : The maximum total size of the compressed nouns.
+    extract : A function that tags a list of diaries and returns their nouns.
+    tagger_version : The tagger version that is part of each cache key.
+
+    Returns
+    -------
+    A list of the nouns of each diary, in the order of texts.
+    '''
+    texts = [text if isinstance(text, str) else str(text) for text in texts]
+    if cache_path is None:
+        return extract(texts)
+
+    keys = [noun_cache_key(text, tagger_version) for text in texts]
+    init_sqlite_cache(cache_path, 'nouns', NOUN_CACHE_COLUMNS, 'key')
+    now = time.time()
+
+    with closing(sqlite3.connect(cache_path, timeout=30)) as conn:
+        found = {}
+        distinct_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(distinct_keys), LOOKUP_BATCH_SIZE):
+            batch = distinct_keys[start:start + LOOKUP_BATCH_SIZE]
+            rows = conn.execute(
+                'SELECT key, nouns FROM nouns WHERE key IN ({})'.format(
+                    ', '.join('?' * len(batch))), batch)
+            found.update((key, zlib.decompress(body).decode('utf-8')) for key, body in rows)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        tagged = dict(zip(missing, extract(list(missing.values()))))
+
+        with conn:
+            conn.executemany('UPDATE nouns SET accessed_at = ? WHERE key = ?',
+                             [(now, key) for key in found])
+            rows = []
+            for key, noun_string in tagged.items():
+                body = zlib.compress(noun_string.encode('utf-8'))
+                rows.append((key, now, len(body), body))
+            conn.executemany('INSERT OR REPLACE INTO nouns VALUES (?, ?, ?, ?)', rows)
+            evict_sqlite_cache(conn, 'nouns', 'key', max_cache_bytes)
+
+    found.update(tagged)
+
+    return [found[key] for key in keys]
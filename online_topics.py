@@ -0,0 +1,232 @@
+'''
+This script holds the online topic modeling shared by the topic modeling
+scripts. A mini-batch NMF model and its vectorizer are saved after each run,
+so new diaries update the topics with one partial_fit step instead of a full
+refit. Since the vocabulary is fixed when the model is first fitted and the
+topics only move with each update, a drift report compares the online topics
+with a full refit and says when a rebuild is due.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from joblib import dump, load
+from scipy.optimize import linear_sum_assignment
+from sklearn.decomposition import NMF, MiniBatchNMF
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Vectorizer settings of both topic modeling scripts, which import them from
+# here; in topic_modeling_clusters.py they apply to each cluster on its own
+MIN_DF = 0.1
+MAX_DF = .9
+NGRAM_RANGE = (1, 2)
+
+# Keep every earlier diary in the running statistics of the model (1.0), rather
+# than letting weekly batches of a few diaries wash out the rest of the corpus
+FORGET_FACTOR = 1.0
+
+# A full rebuild is due when a topic is less similar than this to its closest
+# topic in a full refit, or when the online vocabulary covers less than this
+# share of the refit topics' weight
+DRIFT_THRESHOLD = 0.9
+
+def online_state_path(name):
+    '''
+    Returns the path of the saved online model of a corpus.
+    '''
+    return '{}_online_nmf.joblib'.format(name)
+
+def fit_online_topics(texts, story_titles, stop_words, n_components=5):
+    '''
+    Fits the vectorizer and NMF on the whole corpus, as the full refit does,
+    and starts a mini-batch NMF model from that solution, so the online topics
+    begin where a full refit would be and any drift comes from the updates.
+
+    Parameters
+    ----------
+    texts : The nouns of every diary.
+    story_titles : The story title of each diary.
+    stop_words : The list of stop words.
+    n_components : The number of topics.
+
+    Returns
+    -------
+    A dictionary of the model state: the vectorizer, the NMF model, the
+    doc_topic of every diary, and the story titles of its rows.
+    '''
+    cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                          ngram_range=NGRAM_RANGE)
+    data_cvn = cvn.fit_transform(texts)
+
+    full_nmf = NMF(n_components, random_state=19)
+    doc_topic = full_nmf.fit_transform(data_cvn)
+    nmf = MiniBatchNMF(n_components, init='custom', forget_factor=FORGET_FACTOR,
+                       random_state=19)
+    nmf.partial_fit(data_cvn, W=doc_topic, H=full_nmf.components_)
+
+    return {'vectorizer': cvn, 'nmf': nmf, 'doc_topic': doc_topic,
+            'story_titles': list(story_titles), 'updates': 0}
+
+def update_online_topics(state, texts, story_titles):
+    '''
+    Updates the topics with the diaries whose story title the model has not seen,
+    in one partial_fit step, and appends their doc_topic rows. Earlier rows are
+    left as they were.
+
+    Parameters
+    ----------
+    state : The dictionary returned by fit_online_topics.
+    texts : The nouns of every diary.
+    story_titles : The story title of each diary.
+
+    Returns
+    -------
+    The number of new diaries.
+    '''
+    seen = set(state['story_titles'])
+    new = [(title, text) for title, text in zip(story_titles, texts) if title not in seen]
+    if not new:
+        return 0
+
+    new_titles, new_texts = zip(*new)
+    data_cvn = state['vectorizer'].transform(new_texts)
+    state['nmf'].partial_fit(data_cvn)
+    state['doc_topic'] = np.vstack([state['doc_topic'], state['nmf'].transform(data_cvn)])
+    state['story_titles'].extend(new_titles)
+    state['updates'] += 1
+
+    return len(new)
+
+def topic_drift(state, texts, stop_words):
+    '''
+    Compares the online topics with a full refit of the vectorizer and NMF on
+    the same diaries. Each online topic is paired with a refit topic so that the
+    total cosine similarity of the pairs, over the terms of both vocabularies,
+    is highest.
+
+    Parameters
+    ----------
+    state : The dictionary returned by fit_online_topics.
+    texts : The nouns of every diary.
+    stop_words : The list of stop words.
+
+    Returns
+    -------
+    A dataframe with one row per online topic: the paired refit topic and their
+    similarity, and a dictionary summary with the lowest similarity, the share
+    of the refit topics' weight on terms in the online vocabulary, the relative
+    reconstruction error of both models, and whether a rebuild is due.
+    '''
+    online_cvn, online_nmf = state['vectorizer'], state['nmf']
+    n_components = online_nmf.n_components_
+
+    refit_cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                                ngram_range=NGRAM_RANGE)
+    refit_cvn_data = refit_cvn.fit_transform(texts)
+    refit_nmf = NMF(n_components, random_state=19)
+    refit_nmf.fit(refit_cvn_data)
+
+    # Put both sets of topics on the union of the two vocabularies
+    online_terms = online_cvn.get_feature_names_out()
+    refit_terms = refit_cvn.get_feature_names_out()
+    terms = pd.Index(np.union1d(online_terms, refit_terms))
+    online_topics = np.zeros((n_components, len(terms)))
+    online_topics[:, terms.get_indexer(online_terms)] = online_nmf.components_
+    refit_topics = np.zeros((n_components, len(terms)))
+    refit_topics[:, terms.get_indexer(refit_terms)] = refit_nmf.components_
+
+    online_topics /= np.linalg.norm(online_topics, axis=1, keepdims=True)
+    refit_topics /= np.linalg.norm(refit_topics, axis=1, keepdims=True)
+    similarity = online_topics @ refit_topics.T
+    topics, refit_pairs = linear_sum_assignment(similarity, maximize=True)
+    report = pd.DataFrame({'topic': topics, 'refit_topic': refit_pairs,
+                           'similarity': similarity[topics, refit_pairs]})
+
+    covered = np.isin(refit_terms, online_terms)
+    coverage = refit_nmf.components_[:, covered].sum() / refit_nmf.components_.sum()
+
+    online_cvn_data = online_cvn.transform(texts)
+    summary = {
+        'diaries': len(state['story_titles']), 'updates': state['updates'],
+        'min_similarity': report.similarity.min(), 'vocabulary_coverage': coverage,
+        'online_error': relative_error(online_cvn_data, online_nmf),
+        'refit_error': relative_error(refit_cvn_data, refit_nmf),
+        }
+    summary['rebuild_due'] = bool(summary['min_similarity'] < DRIFT_THRESHOLD
+                                  or coverage < DRIFT_THRESHOLD)
+
+    return report, summary
+
+def relative_error(data_cvn, nmf):
+    '''
+    Returns the Frobenius norm of the NMF reconstruction error of a sparse
+    document term matrix, relative to the norm of the matrix.
+    '''
+    doc_topic = nmf.transform(data_cvn)
+
+    # ||X - WH||^2 = ||X||^2 - 2 tr(W'XH') + tr(W'W HH'), without a dense WH
+    squared_norm = data_cvn.multiply(data_cvn).sum()
+    cross = np.sum((data_cvn @ nmf.components_.T) * doc_topic)
+    reconstruction = np.sum((doc_topic.T @ doc_topic) * (nmf.components_ @ nmf.components_.T))
+
+    return np.sqrt(max(squared_norm - 2 * cross + reconstruction, 0) / squared_norm)
+
+def online_topic_modeling(texts, story_titles, name, stop_words, n_components=5,
+                          check_drift=False):
+    '''
+    Loads the saved online model of a corpus (fitting one the first time),
+    updates it with the new diaries, and saves it. The saved model is refitted
+    instead when it has a different number of topics, or when it holds diaries
+    that are no longer in the corpus. Models of clusters are saved under the
+    KMeans label ('cluster_0', ...), which is not stable: rerunning
+    clustering.py can give a cluster another label, and the diaries of the
+    model saved under that label then no longer match. The drift report needs a
+    full refit, so it is only printed when asked for.
+
+    Parameters
+    ----------
+    texts : The nouns of every diary.
+    story_titles : The story title of each diary.
+    name : The name of the corpus, used for the saved model.
+    stop_words : The list of stop words.
+    n_components : The number of topics.
+    check_drift : Whether to print the drift report.
+
+    Returns
+    -------
+    The vectorizer, the NMF model, and the doc_topic of each diary, in the order
+    of story_titles.
+    '''
+    texts, story_titles = list(texts), list(story_titles)
+    path = online_state_path(name)
+    state = load(path) if os.path.exists(path) else None
+    if state is not None and state['nmf'].n_components_ != n_components:
+        print('{}: the saved model has {} topics, not {}; refitting'.format(
+            name, state['nmf'].n_components_, n_components))
+        state = None
+    elif state is not None and not set(state['story_titles']) <= set(story_titles):
+        print('{}: the saved model holds diaries that are not in this corpus, as after the '
+              'clusters are relabeled; refitting'.format(name))
+        state = None
+
+    if state is None:
+        state = fit_online_topics(texts, story_titles, stop_words, n_components)
+    else:
+        print('{}: {} new diaries'.format(name, update_online_topics(state, texts, story_titles)))
+    dump(state, path)
+
+    if check_drift:
+        report, summary = topic_drift(state, texts, stop_words)
+        print(report.round(3).to_string(index=False))
+        print(', '.join('{}: {}'.format(key, round(value, 3)
+                                        if isinstance(value, float) else value)
+                        for key, value in summary.items()))
+        if summary['rebuild_due']:
+            print('{}: the online topics have drifted from a full refit; delete {} to '
+                  'rebuild'.format(name, path))
+
+    rows = {title: row for row, title in enumerate(state['story_titles'])}
+    return (state['vectorizer'], state['nmf'],
+            state['doc_topic'][[rows[title] for title in story_titles]])
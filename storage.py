@@ -0,0 +1,356 @@
+'''
+This script holds the storage layer shared by the pipeline scripts. Tables are
+saved between stages as typed, compressed Parquet and read back with column
+projection, and document-term matrices are saved as sparse .npz files with a
+vocabulary file. CSV (and the scraper's jsonl) tables can still be read, so
+older outputs keep working. The on-disk caches of the scraper and the noun
+extraction are SQLite tables bounded in size by the same least recently used
+eviction.
+'''
+
+import ast
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+# Parquet when pyarrow is installed, otherwise the original CSV files
+TABLE_FORMAT = 'parquet' if pq is not None else 'csv'
+TABLE_FORMATS = ('parquet', 'csv', 'jsonl')
+COMPRESSION = 'zstd'
+
+# Columns that hold lists; CSV only keeps their repr, so they are parsed back
+LIST_COLUMNS = ('diary_text',)
+
+def table_path(name, table_format=TABLE_FORMAT):
+    '''
+    Returns the path of a table in the given format, e.g. data_clean.parquet.
+    '''
+    return '{}.{}'.format(name, table_format)
+
+# Find the most recently saved copy of a table
+def find_table(name):
+    '''
+    Finds the saved copy of a table. When a table was saved in more than one
+    format, e.g. a data_clean.csv written after an older data_clean.parquet,
+    the most recently modified copy is used and printed, so a stale copy never
+    shadows a fresh one. Parquet copies are skipped without pyarrow.
+
+    Parameters
+    ----------
+    name : The name of the table without an extension, e.g. 'data_clean'.
+
+    Returns
+    -------
+    The path of the newest copy of the table.
+    '''
+    paths = [table_path(name, table_format) for table_format in TABLE_FORMATS
+             if table_format != 'parquet' or pq is not None]
+    paths = [path for path in paths if os.path.exists(path)]
+    if len(paths) == 1:
+        return paths[0]
+    if paths:
+        path = max(paths, key=os.path.getmtime)
+        print('{} is saved as {}; reading the newest, {}'.format(name, ', '.join(paths), path))
+        return path
+
+    raise FileNotFoundError('No saved table named {}'.format(name))
+
+def read_table(path, columns=None):
+    '''
+    Reads a table, choosing the reader from the extension.
+
+    Parameters
+    ----------
+    path : The path of a .parquet file or folder of part files, .csv or .jsonl file.
+    columns : The columns to read, or None for all of them. Parquet only reads
+    these columns from disk.
+
+    Returns
+    -------
+    A dataframe of the table.
+    '''
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+
+    if path.endswith('.jsonl'):
+        table = pd.read_json(path, lines=True)
+        return table if columns is None else table[columns]
+
+    table = pd.read_csv(path, usecols=columns)
+    for column in LIST_COLUMNS:
+        if column in table.columns:
+            table[column] = table[column].map(
+                lambda value: ast.literal_eval(value) if isinstance(value, str) else value)
+
+    return table
+
+def lists_for_csv(table):
+    '''
+    Returns the table with its list columns as Python lists, since Parquet
+    loads them as numpy arrays and the repr of an array cannot be parsed back.
+    '''
+    columns = [column for column in LIST_COLUMNS if column in table.columns]
+    if not columns:
+        return table
+
+    return table.assign(**{column: table[column].map(
+        lambda value: value.tolist() if isinstance(value, np.ndarray) else value)
+        for column in columns})
+
+def load_table(name, columns=None):
+    '''
+    Loads a table saved by an earlier stage of the pipeline.
+
+    Parameters
+    ----------
+    name : The name of the table without an extension, e.g. 'data_clean'.
+    columns : The columns to read, or None for all of them.
+
+    Returns
+    -------
+    A dataframe of the table.
+    '''
+    return read_table(find_table(name), columns)
+
+def save_table(table, name, table_format=TABLE_FORMAT):
+    '''
+    Saves a table for the next stage of the pipeline. Parquet keeps the
+    dtypes, including integers and lists, and is compressed with zstd.
+
+    Parameters
+    ----------
+    table : The dataframe to save.
+    name : The name of the table without an extension, e.g. 'data_clean'.
+    table_format : 'parquet' or 'csv'.
+
+    Returns
+    -------
+    The path the table was saved to.
+    '''
+    path = table_path(name, table_format)
+    if table_format == 'parquet':
+        table.to_parquet(path, compression=COMPRESSION, index=False)
+    elif table_format == 'csv':
+        lists_for_csv(table).to_csv(path, index=False)
+    else:
+        raise ValueError('Unknown table format: {}'.format(table_format))
+
+    return path
+
+# Stream a table in row batches so it never has to fit in memory at once
+def iter_table_batches(name, columns=None, batch_size=100):
+    '''
+    Reads a saved table batch_size rows at a time.
+
+    Parameters
+    ----------
+    name : The name of the table without an extension, e.g. 'text_df'.
+    columns : The columns to read, or None for all of them.
+    batch_size : The number of rows in each batch.
+
+    Returns
+    -------
+    A generator of dataframes of at most batch_size rows, in table order.
+    '''
+    path = find_table(name)
+    if path.endswith('.parquet'):
+        # Without pre_buffer and readahead only about one batch is held in
+        # memory; with them the scanner buffers whole files
+        parquet_format = ds.ParquetFileFormat(
+            default_fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False))
+        batches = ds.dataset(path, format=parquet_format).to_batches(
+            columns=columns, batch_size=batch_size, batch_readahead=1, fragment_readahead=1)
+        for batch in batches:
+            if batch.num_rows:
+                yield batch.to_pandas()
+        return
+
+    if path.endswith('.jsonl'):
+        for batch in pd.read_json(path, lines=True, chunksize=batch_size):
+            yield batch if columns is None else batch[columns]
+        return
+
+    for batch in pd.read_csv(path, usecols=columns, chunksize=batch_size):
+        for column in LIST_COLUMNS:
+            if column in batch.columns:
+                batch[column] = batch[column].map(
+                    lambda value: ast.literal_eval(value) if isinstance(value, str) else value)
+        yield batch
+
+# Append batches to one output table as they are produced
+class TableAppender:
+    '''
+    Writes a table one batch at a time. Parquet batches become row groups of
+    a single file with the schema of the first batch; CSV batches are appended
+    below one header.
+
+    Parameters
+    ----------
+    name : The name of the table without an extension, e.g. 'data_clean'.
+    table_format : 'parquet' or 'csv'.
+    '''
+
+    def __init__(self, name, table_format=TABLE_FORMAT):
+        if table_format not in ('parquet', 'csv'):
+            raise ValueError('Unknown table format: {}'.format(table_format))
+
+        self.path = table_path(name, table_format)
+        self.table_format = table_format
+        self.writer = None
+        self.n_rows = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def append(self, batch):
+        '''
+        Writes one dataframe to the end of the table.
+        '''
+        if self.table_format == 'parquet':
+            if self.writer is None:
+                schema = pa.Schema.from_pandas(batch, preserve_index=False)
+                self.writer = pq.ParquetWriter(self.path, schema, compression=COMPRESSION)
+            self.writer.write_table(pa.Table.from_pandas(batch, schema=self.writer.schema,
+                                                         preserve_index=False))
+        else:
+            lists_for_csv(batch).to_csv(self.path, mode='a', header=self.n_rows == 0,
+                                        index=False)
+        self.n_rows += len(batch)
+
+    def close(self):
+        '''
+        Closes the table.
+        '''
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Sparse matrices are saved as .npz with the column names beside them
+def save_sparse_matrix(matrix, vocabulary, name):
+    '''
+    Saves a document-term matrix without densifying it.
+
+    Parameters
+    ----------
+    matrix : A scipy sparse matrix (or a dense array, which is converted).
+    vocabulary : The term for each column of the matrix.
+    name : The name of the matrix without an extension, e.g. 'data_dtmn'.
+
+    Returns
+    -------
+    The paths of the .npz file and the vocabulary file.
+    '''
+    matrix_path = name + '.npz'
+    vocabulary_path = name + '_vocabulary.txt'
+    sparse.save_npz(matrix_path, sparse.csr_matrix(matrix), compressed=True)
+    with open(vocabulary_path, 'w', encoding='utf-8') as vocabulary_file:
+        vocabulary_file.writelines(term + '\n' for term in vocabulary)
+
+    return matrix_path, vocabulary_path
+
+def load_sparse_matrix(name):
+    '''
+    Loads a document-term matrix saved by save_sparse_matrix.
+
+    Parameters
+    ----------
+    name : The name of the matrix without an extension, e.g. 'data_dtmn'.
+
+    Returns
+    -------
+    A CSR matrix and the list of terms for its columns.
+    '''
+    matrix = sparse.load_npz(name + '.npz').tocsr()
+    with open(name + '_vocabulary.txt', encoding='utf-8') as vocabulary_file:
+        vocabulary = [line.rstrip('\n') for line in vocabulary_file]
+
+    return matrix, vocabulary
+
+# Create a size-bounded SQLite cache table
+def init_sqlite_cache(cache_path, table, columns, key_column):
+    '''
+    Creates a SQLite cache table if it does not exist yet. Besides its primary
+    key, every cache table has an accessed_at time and the size of each entry,
+    which evict_sqlite_cache uses. The total size of the table is kept in a
+    cache_sizes row that triggers update in the same transaction as every
+    write, so checking it costs one lookup instead of a scan of the table.
+    Entries are written with INSERT OR REPLACE; a replaced entry's size is
+    taken off the total before the new one is added.
+
+    Parameters
+    ----------
+    cache_path : The path of the SQLite cache file.
+    table : The name of the table, e.g. 'pages'.
+    columns : The column definitions of the table, e.g.
+    'key TEXT PRIMARY KEY, accessed_at REAL, size INTEGER, body BLOB'.
+    key_column : The name of the primary key column of the table.
+    '''
+    triggers = {
+        'replace': 'BEFORE INSERT ON {table} BEGIN UPDATE cache_sizes SET total = total - '
+                   'COALESCE((SELECT size FROM {table} WHERE {key} = NEW.{key}), 0) '
+                   "WHERE name = '{table}'; END",
+        'insert': 'AFTER INSERT ON {table} BEGIN UPDATE cache_sizes SET total = total + '
+                  "NEW.size WHERE name = '{table}'; END",
+        'delete': 'AFTER DELETE ON {table} BEGIN UPDATE cache_sizes SET total = total - '
+                  "OLD.size WHERE name = '{table}'; END",
+        'update': 'AFTER UPDATE OF size ON {table} BEGIN UPDATE cache_sizes SET total = '
+                  "total + NEW.size - OLD.size WHERE name = '{table}'; END",
+        }
+    with closing(sqlite3.connect(cache_path, timeout=30)) as conn, conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(table, columns))
+        conn.execute('CREATE INDEX IF NOT EXISTS {0}_accessed_at ON {0} (accessed_at)'.format(
+            table))
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_sizes ('
+                     'name TEXT PRIMARY KEY, total INTEGER)')
+
+        # Caches written before the running total existed are summed once
+        if conn.execute('SELECT 1 FROM cache_sizes WHERE name = ?', (table,)).fetchone() is None:
+            conn.execute('INSERT INTO cache_sizes SELECT ?, COALESCE(SUM(size), 0) '
+                         'FROM {}'.format(table), (table,))
+        for name, trigger in triggers.items():
+            conn.execute('CREATE TRIGGER IF NOT EXISTS {}_size_{} {}'.format(
+                table, name, trigger.format(table=table, key=key_column)))
+
+# Remove the least recently used entries once a cache is too large
+def evict_sqlite_cache(conn, table, key_column, max_cache_bytes):
+    '''
+    Deletes the least recently read entries of a cache table created by
+    init_sqlite_cache until their sizes add up to at most max_cache_bytes. The
+    total is read from cache_sizes, and the oldest entries from the accessed_at
+    index, so a cache under its limit is checked without a scan.
+
+    Parameters
+    ----------
+    conn : An open connection to the SQLite cache file.
+    table : The name of the table.
+    key_column : The name of the primary key column of the table.
+    max_cache_bytes : The maximum total size of the entries.
+    '''
+    total_size = conn.execute('SELECT total FROM cache_sizes WHERE name = ?',
+                              (table,)).fetchone()[0]
+    if total_size <= max_cache_bytes:
+        return
+
+    stale_keys = []
+    rows = conn.execute('SELECT {}, size FROM {} ORDER BY accessed_at'.format(key_column, table))
+    for key, size in rows:
+        if total_size <= max_cache_bytes:
+            break
+        stale_keys.append((key,))
+        total_size -= size
+    conn.executemany('DELETE FROM {} WHERE {} = ?'.format(table, key_column), stale_keys)
@@ -0,0 +1,292 @@
+'''
+This script sweeps the number of topics for the text from all diarists and for
+each cluster, to choose k instead of hand-editing it. Each corpus is swept in
+its own worker process; within a corpus every k is warm-started from the
+solution for k - 1 plus one new topic. Each fit is scored by its relative
+reconstruction error and by the NPMI coherence of its top words, computed from
+document co-occurrence counts taken once per corpus. The table is saved as
+topic_count_sweep and the best k of each corpus is printed.
+
+Usage: python topic_count_sweep.py [smallest k] [largest k]
+'''
+
+import sys
+import time
+import warnings
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.decomposition import NMF
+from sklearn.exceptions import ConvergenceWarning
+
+from storage import load_table, save_table
+from topic_modeling_all_diarists import create_noun_dataframe
+from topic_modeling_all_diarists import new_stopwords as all_diarists_stopwords
+from topic_modeling_clusters import (MAX_DF, MIN_DF, NGRAM_RANGE, create_dataframes_for_clusters,
+                                     init_cluster_worker)
+from topic_modeling_clusters import new_stopwords as cluster_stopwords
+from topic_summary import top_term_indices
+
+MIN_TOPICS = 2
+MAX_TOPICS = 12
+
+# The number of top words of each topic scored for coherence
+COHERENCE_WORDS = 10
+
+# Every fit runs in rounds of ROUND_ITERATIONS and stops once a round improves
+# the relative reconstruction error by less than SWEEP_TOL. NMF's own tol is
+# relative to the error at initialization, so a warm start, which begins close
+# to the solution, would otherwise run to max_iter
+ROUND_ITERATIONS = 10
+SWEEP_TOL = 1e-4
+MAX_ITERATIONS = 400
+
+def cooccurrence_counts(data_cvn):
+    '''
+    Counts the documents each pair of terms appears in together.
+
+    Parameters
+    ----------
+    data_cvn : A sparse CSR document term matrix.
+
+    Returns
+    -------
+    A sparse term by term matrix of co-document counts, whose diagonal is the
+    document frequency of each term.
+    '''
+    occurs = (data_cvn > 0).astype(np.int32)
+    return (occurs.T @ occurs).tocsr()
+
+def npmi_coherence(components, co_doc, n_docs, top_words=COHERENCE_WORDS):
+    '''
+    Scores each topic by the mean normalized pointwise mutual information of
+    the pairs of its top words, with probabilities taken from document counts:
+    log(P(w_i, w_j) / (P(w_i) P(w_j))) / -log P(w_i, w_j). Pairs that never
+    share a document score -1. Unlike UMass, it does not favor a few topics of
+    the most frequent words.
+
+    Parameters
+    ----------
+    components : The topic by term weights of an NMF model.
+    co_doc : The co-document counts returned by cooccurrence_counts.
+    n_docs : The number of documents counted.
+    top_words : The number of top words of each topic to score.
+
+    Returns
+    -------
+    An array of the coherence of each topic.
+    '''
+    top = top_term_indices(components, top_words)
+    n_topics, top_words = top.shape
+
+    # The co-document counts of the top words of each topic with each other
+    words = top.ravel()
+    counts = co_doc[words][:, words].toarray().reshape(n_topics, top_words, n_topics, top_words)
+    counts = counts[np.arange(n_topics), :, np.arange(n_topics), :].astype(np.float64)
+
+    word_probability = np.diagonal(counts, axis1=1, axis2=2) / n_docs
+    pair_probability = counts / n_docs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        npmi = (np.log(pair_probability / (word_probability[:, :, np.newaxis]
+                                           * word_probability[:, np.newaxis, :]))
+                / -np.log(pair_probability))
+    npmi[counts == 0] = -1
+    npmi[pair_probability >= 1] = 0
+
+    pairs = np.triu_indices(top_words, 1)
+    return npmi[:, pairs[0], pairs[1]].mean(axis=1)
+
+def warm_start(data_cvn, doc_topic, components):
+    '''
+    Builds the starting point for k + 1 topics from the solution for k: the
+    new topic is the positive part of the residual of the worst-reconstructed
+    document, and its weights are the least-squares fit of every document's
+    residual onto it. The residuals are never formed densely.
+
+    Parameters
+    ----------
+    data_cvn : A sparse CSR document term matrix.
+    doc_topic : The document by topic weights for k topics.
+    components : The topic by term weights for k topics.
+
+    Returns
+    -------
+    The document by topic and topic by term starting weights for k + 1 topics.
+    '''
+    # ||x - wH||^2 for each document
+    projected = np.asarray(data_cvn @ components.T)
+    residual_norms = (np.asarray(data_cvn.multiply(data_cvn).sum(axis=1)).ravel()
+                      - 2 * np.sum(projected * doc_topic, axis=1)
+                      + np.sum((doc_topic @ (components @ components.T)) * doc_topic, axis=1))
+    worst = np.argmax(residual_norms)
+
+    new_topic = np.maximum(data_cvn[worst].toarray().ravel() - doc_topic[worst] @ components, 0)
+    if not new_topic.any():
+        new_topic = np.full(components.shape[1], components.mean())
+    new_weights = np.maximum(data_cvn @ new_topic - doc_topic @ (components @ new_topic), 0)
+    new_weights /= new_topic @ new_topic
+
+    return (np.hstack([doc_topic, new_weights[:, np.newaxis]]),
+            np.vstack([components, new_topic]))
+
+def fit_nmf(data_cvn, k, doc_topic=None, components=None, tol=SWEEP_TOL,
+            max_iterations=MAX_ITERATIONS):
+    '''
+    Fits NMF in rounds of ROUND_ITERATIONS, each continuing from the last, until
+    a round improves the relative reconstruction error by less than tol.
+
+    Parameters
+    ----------
+    data_cvn : A sparse CSR document term matrix.
+    k : The number of topics.
+    doc_topic : Optional starting document by topic weights.
+    components : Optional starting topic by term weights.
+    tol : The smallest improvement of the relative error that continues the fit.
+    max_iterations : The most iterations in all rounds.
+
+    Returns
+    -------
+    The last NMF model, its doc_topic, the relative reconstruction error, and the
+    number of iterations.
+    '''
+    data_norm = np.sqrt(data_cvn.multiply(data_cvn).sum())
+    error = np.inf
+    iterations = 0
+    while iterations < max_iterations:
+        nmf = NMF(k, init=None if components is None else 'custom', random_state=19,
+                  max_iter=ROUND_ITERATIONS)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            doc_topic = nmf.fit_transform(data_cvn, W=doc_topic, H=components)
+        components = nmf.components_
+        iterations += nmf.n_iter_
+
+        improvement = error - nmf.reconstruction_err_ / data_norm
+        error = nmf.reconstruction_err_ / data_norm
+        if improvement < tol or nmf.n_iter_ < ROUND_ITERATIONS:
+            break
+
+    return nmf, doc_topic, error, iterations
+
+def sweep_corpus(task):
+    '''
+    Fits NMF for every k of one corpus, each warm-started from the last; the
+    task of each worker process.
+
+    Parameters
+    ----------
+    task : A tuple of the corpus name, its nouns, its stop words, the range of
+    k, and whether to warm-start.
+
+    Returns
+    -------
+    A dataframe with one row per k: the corpus, k, the relative reconstruction
+    error, the mean and lowest topic coherence, the iterations and the seconds
+    of the fit.
+    '''
+    name, texts, stop_words, topic_counts, warm = task
+    cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                          ngram_range=NGRAM_RANGE)
+    data_cvn = cvn.fit_transform(texts).astype(np.float64)
+    co_doc = cooccurrence_counts(data_cvn)
+
+    rows = []
+    start_weights = (None, None)
+    for k in topic_counts:
+        if k > min(data_cvn.shape):
+            break
+        start = time.perf_counter()
+        nmf, doc_topic, error, iterations = fit_nmf(data_cvn, k, *start_weights)
+        seconds = time.perf_counter() - start
+        if warm:
+            start_weights = warm_start(data_cvn, doc_topic, nmf.components_)
+
+        coherence = npmi_coherence(nmf.components_, co_doc, data_cvn.shape[0])
+        rows.append({'corpus': name, 'diaries': data_cvn.shape[0], 'k': k,
+                     'reconstruction_error': error, 'coherence': coherence.mean(),
+                     'min_coherence': coherence.min(), 'iterations': iterations,
+                     'seconds': seconds})
+
+    return pd.DataFrame(rows)
+
+def sweep_topic_counts(corpora, topic_counts, processes=None, warm=True):
+    '''
+    Sweeps the number of topics of every corpus, each in its own worker process,
+    largest corpus first.
+
+    Parameters
+    ----------
+    corpora : A list of (name, nouns, stop words) tuples.
+    topic_counts : The range of k to fit.
+    processes : The number of worker processes (defaults to the CPU count, at
+    most one per corpus), or 1 to sweep in this process.
+    warm : Whether to warm-start each k from the solution for k - 1.
+
+    Returns
+    -------
+    A dataframe of the rows returned by sweep_corpus, in the order of corpora.
+    '''
+    processes = min(processes or cpu_count(), len(corpora))
+    tasks = sorted(((name, list(texts), stop_words, list(topic_counts), warm)
+                    for name, texts, stop_words in corpora),
+                   key=lambda task: len(task[1]), reverse=True)
+    if processes <= 1:
+        results = map(sweep_corpus, tasks)
+    else:
+        with Pool(processes, initializer=init_cluster_worker) as pool:
+            results = pool.map(sweep_corpus, tasks, chunksize=1)
+
+    results = {task[0]: result for task, result in zip(tasks, results)}
+    return pd.concat([results[name] for name, _, _ in corpora], ignore_index=True)
+
+def best_topic_counts(sweep):
+    '''
+    Picks the k of each corpus with the most coherent topics, breaking ties by
+    the lower reconstruction error.
+
+    Parameters
+    ----------
+    sweep : The dataframe returned by sweep_topic_counts.
+
+    Returns
+    -------
+    The rows of sweep for the best k of each corpus.
+    '''
+    ranked = sweep.sort_values(['coherence', 'reconstruction_error'], ascending=[False, True])
+    return ranked.drop_duplicates('corpus').set_index('corpus').loc[sweep.corpus.unique()]
+
+def main(min_topics=MIN_TOPICS, max_topics=MAX_TOPICS):
+    '''
+    Loads the cleaned diary text and the clusters, sweeps the number of topics
+    for all diarists and each cluster, saves the table and prints the best k.
+    '''
+
+    # Load only the columns needed: the cleaned text and each diarist's cluster
+    data_clean = load_table('data_clean', columns=['story_title', 'diary_text_string'])
+    clustered_data_scaled = load_table('clustered_data_scaled', columns=['story_title', 'Cluster'])
+
+    # Extract the nouns of all diarists once, then split them by cluster
+    data_nouns = create_noun_dataframe(data_clean)
+    data_nouns['story_title'] = data_clean.story_title
+    clusters = create_dataframes_for_clusters(
+        pd.merge(clustered_data_scaled, data_nouns, left_on='story_title',
+                 right_on='story_title'))
+
+    corpora = [('all_diarists', data_nouns.diary_text_string, all_diarists_stopwords())]
+    corpora.extend(('cluster_{}'.format(cluster), cluster_nouns.diary_text_string,
+                    cluster_stopwords())
+                   for cluster, cluster_nouns in clusters.items())
+
+    sweep = sweep_topic_counts(corpora, range(min_topics, max_topics + 1))
+    save_table(sweep, 'topic_count_sweep')
+
+    print(sweep.round(3).to_string(index=False))
+    print('\nBest number of topics')
+    best = best_topic_counts(sweep)[['k', 'coherence', 'reconstruction_error']]
+    print(best.round(3).to_string())
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -1,54 +1,26 @@
 '''
-This script performs topic modeling on the text from all diarists.
+This script performs topic modeling on the text from all diarists. In online
+mode the saved mini-batch NMF model is updated with the new diaries instead of
+refitting, and 'drift' prints how far it has moved from a full refit. The
+number of topics defaults to N_TOPICS; topic_count_sweep.py reports the best.
+
+Usage: python topic_modeling_all_diarists.py [full | online] [drift] [number of topics]
 '''
 
+import sys
+
 import pandas as pd
 
 from sklearn.feature_extraction import text
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import NMF
 
-from nltk import word_tokenize
-from nltk import pos_tag
-
-def display_topics(model, feature_names, no_top_words, topic_names=None):
-    '''
-    Given a model, return the top words for each topic.
-
-    Parameters
-    ----------
-    model : A NMF, LSA, or LDA model of text data.
-    feature_names : A list of features extracted from the vectorized model.
-    no_top_words : The number of top wrods to display from each topic.
-    topic_names : The names of the topics. Set to None as default.
-
-    Returns
-    -------
-    The top words for each topic.
-    '''
-    for i, topic in enumerate(model.components_):
-        if not topic_names or not topic_names[i]:
-            print("\nTopic ", i)
-        else:
-            print("\nTopic: '", topic_names[i], "'")
-        print(", ".join([feature_names[i] for i in topic.argsort()[:-no_top_words - 1:-1]]))
-
-def nouns(text_string):
-    '''
-    Given a string of text, tokenize the text and pull out only the nouns.
-
-    Parameters
-    ----------
-    text_string : A string of text.
+from noun_extraction import cached_nouns
+from online_topics import MAX_DF, MIN_DF, NGRAM_RANGE, online_topic_modeling
+from storage import load_table, save_sparse_matrix, save_table
+from topic_summary import display_topics, save_topic_summary, topic_summary
 
-    Returns
-    -------
-    A tokenized version of the text only containing nouns.
-    '''
-    is_noun = lambda pos: pos[:2] == 'NN'
-    tokenized = word_tokenize(text_string)
-    all_nouns = [word for (word, pos) in pos_tag(tokenized) if is_noun(pos)]
-    return ' '.join(all_nouns)
+N_TOPICS = 5
 
 def new_stopwords():
     '''
@@ -88,7 +60,8 @@ def new_stopwords():
 def create_noun_dataframe(data_clean):
     '''
     A function that takes in a dataframe and returns a new dataframe that has been applied
-    with the nouns function.
+    with the nouns function. Nouns come from the shared on-disk cache, so only
+    diaries that have not been tagged before are tagged.
 
     Parameters
     ----------
@@ -98,39 +71,43 @@ def create_noun_dataframe(data_clean):
     -------
     A new dataframe containing only nouns in the text.
     '''
-    data_nouns = pd.DataFrame(data_clean.diary_text_string.apply(nouns))
+    data_nouns = pd.DataFrame({'diary_text_string': cached_nouns(data_clean.diary_text_string)},
+                              index=data_clean.index)
     return data_nouns
 
-def topic_modeling(data_nouns):
+def topic_modeling(data_nouns, n_components=N_TOPICS):
     '''
     Performs topic modeling using count vectorizer, noun parts-of-speech tagging,
-    non-negative matrix factorization, a custom list of stop words, and 5 topics.
+    non-negative matrix factorization, a custom list of stop words, and
+    n_components topics.
 
     Parameters
     ----------
     data_nouns : A clean text dataframe where the text only contains nouns.
+    n_components : The number of topics.
 
     Returns
     -------
-    A print out of the top 10 words for each of the topics, the document term matrix,
-    and the NMF model applied to the document term matrix.
+    A print out of the top 10 words for each of the topics, the document term matrix
+    (a sparse CSR matrix, never densified), its vocabulary, the NMF model, and the
+    NMF model applied to the document term matrix.
     '''
     stop_words = new_stopwords()
 
     # use count vectorizer
-    cvn = CountVectorizer(stop_words=stop_words, min_df=0.1, max_df=.9, ngram_range=(1, 2))
+    cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                          ngram_range=NGRAM_RANGE)
     data_cvn = cvn.fit_transform(data_nouns.diary_text_string)
-    data_dtmn = pd.DataFrame(data_cvn.toarray(), columns=cvn.get_feature_names())
-    data_dtmn.index = data_nouns.index
+    vocabulary = cvn.get_feature_names_out()
 
-    # create NMF object and transform the document term object created above
-    nmf = NMF(5, random_state=19)
-    doc_topic = nmf.fit_transform(data_dtmn)
+    # create NMF object and transform the sparse document term matrix created above
+    nmf = NMF(n_components, random_state=19)
+    doc_topic = nmf.fit_transform(data_cvn)
 
     # View top words in each topic
-    display_topics(nmf, cvn.get_feature_names(), 10)
+    display_topics(nmf, vocabulary, 10)
 
-    return data_dtmn, doc_topic
+    return data_cvn, vocabulary, nmf, doc_topic
 
 def term_document_matrix(doc_topic):
     '''
@@ -143,30 +120,51 @@ def term_document_matrix(doc_topic):
     Returns
     -------
     A term document matrix that shows the diarists and how each diary is made
-    up of the 8 topics.
+    up of the topics, with one column per topic.
     '''
     term_doc_matrix = pd.DataFrame(doc_topic.round(5), columns=[
-        'component_1', 'component_2', 'component_3', 'component_4',
-        'compnent_5', 'component_6', 'component_7', 'component_8'])
+        'component_{}'.format(topic + 1) for topic in range(doc_topic.shape[1])])
 
     return term_doc_matrix
 
-def main():
+def main(mode='full', check_drift=False, n_components=N_TOPICS):
     '''
     Loads in the cleaned diary text dataframe, calls NMF noun topic modeling, and
     returns top topics, a document term matrix and a term document matrix.
+
+    Parameters
+    ----------
+    mode : 'full' to refit the topics, or 'online' to update the saved online
+    model with the new diaries.
+    check_drift : Whether to print the drift of the online model from a full refit.
+    n_components : The number of topics.
     '''
 
-    # Load in csv files
-    data_clean = pd.read_csv('data_clean.csv')
+    # Load only the columns needed from the cleaned table
+    data_clean = load_table('data_clean', columns=['story_title', 'diary_text_string'])
 
     # Topic modeling
     data_nouns = create_noun_dataframe(data_clean)
-    data_dtmn, doc_topic = topic_modeling(data_nouns)
+    if mode == 'online':
+        cvn, nmf, doc_topic = online_topic_modeling(
+            data_nouns.diary_text_string, data_clean.story_title, 'all_diarists',
+            new_stopwords(), n_components, check_drift)
+        data_cvn = cvn.transform(data_nouns.diary_text_string)
+        vocabulary = cvn.get_feature_names_out()
+        display_topics(nmf, vocabulary, 10)
+    else:
+        data_cvn, vocabulary, nmf, doc_topic = topic_modeling(data_nouns, n_components)
     term_doc_matrix = term_document_matrix(doc_topic)
 
-    # Save dataframes to csv files
-    data_dtmn.to_csv(r'data_dtmn.csv', index=False)
-    term_doc_matrix.to_csv(r'term_doc_matrix.csv', index=False)
-
-main()
+    # Save the document term matrix as a sparse matrix, the topics of each diary
+    # as a table, and the top terms of each topic for dashboards
+    save_sparse_matrix(data_cvn, vocabulary, 'data_dtmn')
+    save_table(term_doc_matrix, 'term_doc_matrix')
+    save_topic_summary(topic_summary(nmf, vocabulary, corpus='all_diarists'),
+                       'topic_summary_all_diarists')
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    topic_counts = [int(arg) for arg in args if arg.isdigit()]
+    main(args[0] if args and not args[0].isdigit() else 'full', 'drift' in args,
+         topic_counts[0] if topic_counts else N_TOPICS)
@@ -1,90 +1,64 @@
 '''
-This script performs topic modeling on each of the 5 clusters.
+This script performs topic modeling on each cluster of diarists. The clusters
+are modeled in parallel worker processes, so the run takes about as long as the
+largest cluster. By default the text of all diarists is tokenized and counted
+once, and each cluster's document term matrix is a slice of that count.
+
+In online mode each cluster's saved mini-batch NMF model is updated with its new
+diaries instead of refitting, and 'drift' prints how far each has moved from a
+full refit. The models are saved under the cluster labels, so after
+clustering.py is rerun a cluster whose label changed is refitted. The number
+of topics defaults to N_TOPICS; topic_count_sweep.py reports the best for each
+cluster.
+
+Usage: python topic_modeling_clusters.py [cluster | shared | hashing | online] [drift]
+       [number of topics]
 '''
 
+import sys
+from collections import Counter, defaultdict
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from sklearn.feature_extraction import text
-from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
 from sklearn.decomposition import NMF
+from sklearn.utils import murmurhash3_32
+from threadpoolctl import threadpool_limits
 
-from nltk import word_tokenize
-from nltk import pos_tag
-
-def create_dataframes_for_clusters(updated_text_df):
-    '''
-    A function that takes in a dataframe with clusters and returns 5 dataframes:
-    one for each unique cluster.
-
-    Parameters
-    ----------
-    updated_text_df : A clean text dataframe that has the clusters appended
-
-    Returns
-    -------
-    A dataframe for each cluster of diarist (5 in total).
-    '''
-
-    # cluster 0
-    cluster_0 = updated_text_df[updated_text_df['Cluster'] == 0]
-    del cluster_0['Cluster']
-
-    # cluster 1
-    cluster_1 = updated_text_df[updated_text_df['Cluster'] == 1]
-    del cluster_1['Cluster']
-
-    # cluster 2
-    cluster_2 = updated_text_df[updated_text_df['Cluster'] == 2]
-    del cluster_2['Cluster']
-
-    # cluster 3
-    cluster_3 = updated_text_df[updated_text_df['Cluster'] == 3]
-    del cluster_3['Cluster']
-
-    # cluster 4
-    cluster_4 = updated_text_df[updated_text_df['Cluster'] == 4]
-    del cluster_4['Cluster']
-
-    return cluster_0, cluster_1, cluster_2, cluster_3, cluster_4
+from noun_extraction import cached_nouns
+from online_topics import MAX_DF, MIN_DF, NGRAM_RANGE, online_topic_modeling
+from storage import load_table
+from topic_summary import display_topics, save_topic_summary, topic_summary
 
-def display_topics(model, feature_names, no_top_words, topic_names=None):
-    '''
-    Given a model, return the top words for each topic.
-
-    Parameters
-    ----------
-    model : A NMF, LSA, or LDA model of text data.
-    feature_names : A list of features extracted from the vectorized model.
-    no_top_words : The number of top wrods to display from each topic.
-    topic_names : The names of the topics. Set to None as default.
+# How each cluster's document term matrix is built: 'cluster' fits a count
+# vectorizer per cluster, 'shared' counts the full corpus once and slices it,
+# and 'hashing' does the same with a hashing vectorizer, which keeps no
+# vocabulary dictionary for very large corpora
+VOCABULARY_MODES = ('cluster', 'shared', 'hashing')
+HASHING_FEATURES = 2 ** 20
 
-    Returns
-    -------
-    The top words for each topic.
-    '''
-    for i, topic in enumerate(model.components_):
-        if not topic_names or not topic_names[i]:
-            print("\nTopic ", i)
-        else:
-            print("\nTopic: '", topic_names[i], "'")
-        print(", ".join([feature_names[i] for i in topic.argsort()[:-no_top_words - 1:-1]]))
+N_TOPICS = 5
 
-def nouns(text_string):
+def create_dataframes_for_clusters(updated_text_df):
     '''
-    Given a string of text, tokenize the text and pull out only the nouns.
+    A function that takes in a dataframe with clusters and returns one dataframe
+    for each unique cluster, grouping the rows in a single pass.
 
     Parameters
     ----------
-    text_string : A string of text.
+    updated_text_df : A clean text dataframe that has the clusters appended
 
     Returns
     -------
-    A tokenized version of the text only containing nouns.
+    A dictionary of cluster to the dataframe of its diarists, in cluster order.
     '''
-    is_noun = lambda pos: pos[:2] == 'NN'
-    tokenized = word_tokenize(text_string)
-    all_nouns = [word for (word, pos) in pos_tag(tokenized) if is_noun(pos)]
-    return ' '.join(all_nouns)
+    return {cluster: cluster_df.drop(columns='Cluster')
+            for cluster, cluster_df in updated_text_df.groupby('Cluster', sort=True,
+                                                               observed=True)}
 
 def new_stopwords():
     '''
@@ -124,7 +98,8 @@ def new_stopwords():
 def create_noun_dataframe(data_clean):
     '''
     A function that takes in a dataframe and returns a new dataframe that has been applied
-    with the nouns function.
+    with the nouns function. Nouns come from the shared on-disk cache, so only
+    diaries that have not been tagged before are tagged.
 
     Parameters
     ----------
@@ -134,18 +109,22 @@ def create_noun_dataframe(data_clean):
     -------
     A new dataframe containing only nouns in the text.
     '''
-    data_nouns = pd.DataFrame(data_clean.diary_text_string.apply(nouns))
+    data_nouns = pd.DataFrame({'diary_text_string': cached_nouns(data_clean.diary_text_string)},
+                              index=data_clean.index)
     return data_nouns
 
-def topic_modeling(data_nouns):
+def topic_modeling(data_nouns, show_topics=True, n_components=N_TOPICS):
     '''
     Performs topic modeling using count vectorizer, noun parts-of-speech tagging,
-    non-negative matrix factorization, a custom list of stop words, and 5 topics.
+    non-negative matrix factorization, a custom list of stop words, and
+    n_components topics.
     Return 3 items that should be pickled for each cluster to be used later for the app.
 
     Parameters
     ----------
     data_nouns : A clean text dataframe where the text only contains nouns.
+    show_topics : Whether to print the top words of each topic.
+    n_components : The number of topics.
 
     Returns
     -------
@@ -154,54 +133,335 @@ def topic_modeling(data_nouns):
     '''
     stop_words = new_stopwords()
 
-    # use count vectorizer
-    cvn = CountVectorizer(stop_words=stop_words, min_df=0.1, max_df=.9, ngram_range=(1, 2))
+    # use count vectorizer; the document term matrix stays a sparse CSR matrix
+    cvn = CountVectorizer(stop_words=list(stop_words), min_df=MIN_DF, max_df=MAX_DF,
+                          ngram_range=NGRAM_RANGE)
     data_cvn = cvn.fit_transform(data_nouns.diary_text_string)
-    data_dtmn = pd.DataFrame(data_cvn.toarray(), columns=cvn.get_feature_names())
-    data_dtmn.index = data_nouns.index
 
     # create NMF object and transform the document term object created above
-    nmf = NMF(5, random_state=19)
+    nmf = NMF(n_components, random_state=19)
+    doc_topic = nmf.fit_transform(data_cvn)
 
     # View top words in each topic
-    display_topics(nmf, cvn.get_feature_names(), 10)
+    if show_topics:
+        display_topics(nmf, cvn.get_feature_names_out(), 10)
+
+    return cvn, nmf, doc_topic
 
-def main():
+class HashedVectorizer:
     '''
-    Loads in the cleaned diary text dataframe, calls NMF noun topic modeling, and
-    returns top topics, a document term matrix and a term document matrix.
+    The vectorizer of one cluster in hashing mode: the columns of a hashing
+    vectorizer that pass the cluster's document frequency filter, with the
+    terms they hold and the min_df used to label them. Like a fitted count
+    vectorizer it has transform and get_feature_names_out, so it can be
+    pickled for the app.
     '''
 
-    # Load in csv files
-    text_df = pd.read_csv('text_df.csv')
-    clustered_data_scaled = pd.read_csv('clustered_data_scaled.csv')
+    def __init__(self, vectorizer, columns, feature_names=None, min_df=MIN_DF):
+        self.vectorizer = vectorizer
+        self.columns = columns
+        self.feature_names = feature_names
+        self.min_df = min_df
 
-    # Merge datasets together
-    updated_text_df = pd.merge(clustered_data_scaled, text_df, left_on='story_title',
-                               right_on='story_title')
+    def transform(self, raw_documents):
+        return self.vectorizer.transform(raw_documents)[:, self.columns]
+
+    def get_feature_names_out(self):
+        return self.feature_names
+
+def count_corpus(texts, hashing=False, n_features=HASHING_FEATURES):
+    '''
+    Tokenizes and counts the full corpus once, without any document frequency
+    filter, so the counts of each cluster are a slice of the result. Unlike
+    CountVectorizer.fit_transform, the vocabulary is left in the order terms
+    were first seen rather than sorted and pruned, since each cluster keeps
+    only a few thousand of its terms.
+
+    Parameters
+    ----------
+    texts : The nouns of every diary.
+    hashing : Whether to hash the terms into n_features columns instead of
+    building a vocabulary.
+    n_features : The number of columns of the hashing vectorizer.
+
+    Returns
+    -------
+    The vectorizer, a sparse CSR matrix of term counts, and an array of the
+    term in each column (None when hashing).
+    '''
+    stop_words = list(new_stopwords())
+    if hashing:
+        vectorizer = HashingVectorizer(stop_words=stop_words, ngram_range=NGRAM_RANGE,
+                                       n_features=n_features, alternate_sign=False,
+                                       norm=None, dtype=np.int64)
+        return vectorizer, vectorizer.transform(texts).tocsr(), None
+
+    vectorizer = CountVectorizer(stop_words=stop_words, ngram_range=NGRAM_RANGE)
+    analyzer = vectorizer.build_analyzer()
+
+    # Each new term gets the next column number
+    vocabulary = defaultdict()
+    vocabulary.default_factory = vocabulary.__len__
+    indices = []
+    counts = []
+    indptr = [0]
+    for text in texts:
+        term_counts = Counter(map(vocabulary.__getitem__, analyzer(text)))
+        indices.extend(term_counts.keys())
+        counts.extend(term_counts.values())
+        indptr.append(len(indices))
+
+    data_cvn = sparse.csr_matrix((np.array(counts, dtype=np.int64),
+                                  np.array(indices, dtype=np.int64),
+                                  np.array(indptr, dtype=np.int64)),
+                                 shape=(len(indptr) - 1, len(vocabulary)))
+    data_cvn.sort_indices()
+
+    return vectorizer, data_cvn, np.array(list(vocabulary), dtype=object)
+
+def document_frequency_columns(data_cvn, min_df=MIN_DF, max_df=MAX_DF):
+    '''
+    Finds the columns of a count matrix whose document frequency is within
+    min_df and max_df, the way CountVectorizer prunes its vocabulary.
+
+    Parameters
+    ----------
+    data_cvn : A sparse CSR matrix of term counts.
+    min_df : The minimum document frequency, a count or a share of the rows.
+    max_df : The maximum document frequency, a count or a share of the rows.
+
+    Returns
+    -------
+    An array of the column numbers to keep.
+    '''
+    n_docs = data_cvn.shape[0]
+    max_doc_count = max_df if isinstance(max_df, int) else max_df * n_docs
+    min_doc_count = min_df if isinstance(min_df, int) else min_df * n_docs
+    if max_doc_count < min_doc_count:
+        raise ValueError('max_df corresponds to < documents than min_df')
+
+    doc_counts = np.bincount(data_cvn.indices, minlength=data_cvn.shape[1])
+    columns = np.flatnonzero((doc_counts >= min_doc_count) & (doc_counts <= max_doc_count))
+    if not len(columns):
+        raise ValueError('After pruning, no terms remain. Try a lower min_df or a higher max_df.')
+
+    return columns
+
+def hashed_feature_names(vectorizer, texts, columns, min_df=MIN_DF):
+    '''
+    Recovers the terms held by some columns of a hashing vectorizer by hashing
+    the terms of the texts again and counting the documents of each. Only terms
+    in the given columns are kept, so the memory used grows with the columns,
+    not the vocabulary. A column is labeled with its terms that pass min_df on
+    their own, joined with ' | ', so rare terms that only share its column are
+    left out, as the 'shared' mode prunes them; a column whose terms only pass
+    together is labeled with its most frequent term.
+
+    Parameters
+    ----------
+    vectorizer : The hashing vectorizer.
+    texts : The diaries that were counted.
+    columns : An array of column numbers.
+    min_df : The minimum document frequency of a term, a count or a share of
+    the texts.
+
+    Returns
+    -------
+    An array of the terms of each column.
+    '''
+    wanted = set(columns.tolist())
+    analyzer = vectorizer.build_analyzer()
+    n_features = vectorizer.n_features
+    term_columns = {}
+    doc_counts = Counter()
+    n_docs = 0
+    for text in texts:
+        n_docs += 1
+        for term in set(analyzer(text)):
+            # The column HashingVectorizer gives the term
+            column = abs(murmurhash3_32(term, seed=0)) % n_features
+            if column in wanted:
+                term_columns[term] = column
+                doc_counts[term] += 1
+
+    min_doc_count = min_df if isinstance(min_df, int) else min_df * n_docs
+    terms = {}
+    for term, column in term_columns.items():
+        terms.setdefault(column, []).append(term)
+
+    names = []
+    for column in columns.tolist():
+        column_terms = terms.get(column, [])
+        kept = sorted(term for term in column_terms if doc_counts[term] >= min_doc_count)
+        if not kept and column_terms:
+            kept = [min(column_terms, key=lambda term: (-doc_counts[term], term))]
+        names.append(' | '.join(kept))
+
+    return np.array(names, dtype=object)
+
+def slice_clusters(clusters, vocabulary='shared', min_df=MIN_DF, max_df=MAX_DF):
+    '''
+    Counts the terms of all clusters at once and slices out each cluster's
+    document term matrix, re-applying min_df and max_df to each slice. The
+    result matches fitting a count vectorizer on each cluster.
+
+    Parameters
+    ----------
+    clusters : A dictionary of cluster to its noun dataframe.
+    vocabulary : 'shared' or 'hashing'.
+    min_df : The minimum document frequency within a cluster.
+    max_df : The maximum document frequency within a cluster.
+
+    Returns
+    -------
+    A dictionary of cluster to its vectorizer and sparse document term matrix.
+    '''
+    texts = pd.concat([data_nouns.diary_text_string for data_nouns in clusters.values()])
+    vectorizer, data_cvn, terms = count_corpus(texts, hashing=vocabulary == 'hashing')
+
+    sliced = {}
+    start = 0
+    for cluster, data_nouns in clusters.items():
+        cluster_cvn = data_cvn[start:start + len(data_nouns)]
+        start += len(data_nouns)
+        columns = document_frequency_columns(cluster_cvn, min_df, max_df)
+
+        # Sort the kept terms, as CountVectorizer does, and give them to a
+        # count vectorizer with a fixed vocabulary, which transforms new
+        # diaries into the same columns as the slice
+        if vocabulary == 'shared':
+            columns = columns[np.argsort(terms[columns], kind='stable')]
+            cvn = CountVectorizer(stop_words=vectorizer.stop_words,
+                                  ngram_range=NGRAM_RANGE, vocabulary=terms[columns])
+        else:
+            cvn = HashedVectorizer(vectorizer, columns, min_df=min_df)
+        sliced[cluster] = cvn, cluster_cvn[:, columns]
+
+    return sliced
+
+def init_cluster_worker():
+    '''
+    Limits each worker process to one BLAS thread, so parallel clusters do not
+    compete for the same cores.
+    '''
+    threadpool_limits(1)
+
+def cluster_topic_modeling(task):
+    '''
+    Performs topic modeling on one cluster; the task of each worker process.
+    Without a document term matrix the cluster is vectorized on its own with
+    topic_modeling.
+
+    Parameters
+    ----------
+    task : A tuple of the cluster, its noun dataframe, the number of topics, and
+    its vectorizer and sparse document term matrix (or None and None).
+
+    Returns
+    -------
+    A tuple of the cluster and its count vectorizer, NMF model, and doc_topic.
+    '''
+    cluster, data_nouns, n_components, cvn, data_cvn = task
+    if cvn is None:
+        return cluster, topic_modeling(data_nouns, show_topics=False, n_components=n_components)
+
+    nmf = NMF(n_components, random_state=19)
+    doc_topic = nmf.fit_transform(data_cvn)
+    if isinstance(cvn, HashedVectorizer):
+        cvn.feature_names = hashed_feature_names(cvn.vectorizer, data_nouns.diary_text_string,
+                                                 cvn.columns, cvn.min_df)
+
+    return cluster, (cvn, nmf, doc_topic)
 
-    # Create dataframes for each cluster
-    cluster_0, cluster_1, cluster_2, cluster_3, cluster_4 = create_dataframes_for_clusters(
-        updated_text_df)
+def topic_modeling_for_clusters(clusters, processes=None, vocabulary='shared',
+                                n_components=N_TOPICS):
+    '''
+    Performs topic modeling on every cluster, each in its own worker process.
+    The largest clusters are started first, so the wall time stays close to
+    that of the slowest cluster.
 
-    # Cluster 0 topic modeling
-    data_nouns_cluster_0 = create_noun_dataframe(cluster_0)
-    topic_modeling(data_nouns_cluster_0)
+    Parameters
+    ----------
+    clusters : A dictionary of cluster to its noun dataframe.
+    processes : The number of worker processes (defaults to the CPU count, at
+    most one per cluster), or 1 to model the clusters in this process.
+    vocabulary : One of VOCABULARY_MODES.
+    n_components : The number of topics of every cluster.
 
-    # Cluster 1 topic modeling
-    data_nouns_cluster_1 = create_noun_dataframe(cluster_1)
-    topic_modeling(data_nouns_cluster_1)
+    Returns
+    -------
+    A dictionary of cluster to the count vectorizer, NMF model, and doc_topic
+    returned by topic_modeling, in the order of clusters.
+    '''
+    if vocabulary not in VOCABULARY_MODES:
+        raise ValueError('vocabulary must be one of {}'.format(', '.join(VOCABULARY_MODES)))
+    if vocabulary == 'cluster':
+        sliced = dict.fromkeys(clusters, (None, None))
+    else:
+        sliced = slice_clusters(clusters, vocabulary)
+
+    processes = min(processes or cpu_count(), len(clusters))
+    tasks = sorted(((cluster, data_nouns, n_components) + sliced[cluster]
+                    for cluster, data_nouns in clusters.items()),
+                   key=lambda task: len(task[1]), reverse=True)
+    if processes <= 1:
+        results = dict(map(cluster_topic_modeling, tasks))
+    else:
+        with Pool(processes, initializer=init_cluster_worker) as pool:
+            results = dict(pool.imap_unordered(cluster_topic_modeling, tasks))
+
+    return {cluster: results[cluster] for cluster in clusters}
+
+def main(vocabulary='shared', check_drift=False, n_components=N_TOPICS):
+    '''
+    Loads in the cleaned diary text dataframe, extracts the nouns of every diary,
+    and prints the top topics of each cluster.
 
-    # Cluster 2 topic modeling
-    data_nouns_cluster_2 = create_noun_dataframe(cluster_2)
-    topic_modeling(data_nouns_cluster_2)
+    Parameters
+    ----------
+    vocabulary : One of VOCABULARY_MODES, or 'online' to update the saved online
+    model of each cluster with its new diaries.
+    check_drift : Whether to print the drift of the online models from a full refit.
+    n_components : The number of topics of every cluster.
+    '''
 
-    # Cluster 3 topic modeling
-    data_nouns_cluster_3 = create_noun_dataframe(cluster_3)
-    topic_modeling(data_nouns_cluster_3)
+    # Load only the columns needed: the cleaned text and each diarist's cluster
+    data_clean = load_table('data_clean', columns=['story_title', 'diary_text_string'])
+    clustered_data_scaled = load_table('clustered_data_scaled', columns=['story_title', 'Cluster'])
 
-    # Cluster 4 topic modeling
-    data_nouns_cluster_4 = create_noun_dataframe(cluster_4)
-    topic_modeling(data_nouns_cluster_4)
+    # Merge datasets together
+    updated_text_df = pd.merge(clustered_data_scaled, data_clean, left_on='story_title',
+                               right_on='story_title')
 
-main()
+    # Extract the nouns of all diarists at once, then split them by cluster
+    data_nouns = create_noun_dataframe(updated_text_df)
+    data_nouns['story_title'] = updated_text_df.story_title
+    data_nouns['Cluster'] = updated_text_df.Cluster
+    clusters = create_dataframes_for_clusters(data_nouns)
+
+    # Topic modeling for each cluster
+    if vocabulary == 'online':
+        results = {}
+        for cluster, cluster_nouns in clusters.items():
+            results[cluster] = online_topic_modeling(
+                cluster_nouns.diary_text_string, cluster_nouns.story_title,
+                'cluster_{}'.format(cluster), new_stopwords(), n_components, check_drift)
+    else:
+        results = topic_modeling_for_clusters(clusters, vocabulary=vocabulary,
+                                              n_components=n_components)
+
+    for cluster, (cvn, nmf, _) in results.items():
+        print('\nCluster {} ({} diarists)'.format(cluster, len(clusters[cluster])))
+        display_topics(nmf, cvn.get_feature_names_out(), 10)
+
+    # Save the top terms of every cluster's topics in one table for dashboards
+    save_topic_summary(pd.concat([topic_summary(nmf, cvn.get_feature_names_out(),
+                                                corpus='cluster_{}'.format(cluster))
+                                  for cluster, (cvn, nmf, _) in results.items()],
+                                 ignore_index=True), 'topic_summary_clusters')
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    topic_counts = [int(arg) for arg in args if arg.isdigit()]
+    main(args[0] if args and not args[0].isdigit() else 'shared', 'drift' in args,
+         topic_counts[0] if topic_counts else N_TOPICS)
@@ -0,0 +1,128 @@
+'''
+This script holds the topic summaries shared by the topic modeling scripts:
+the top terms of every topic with their weights, as a table that can be
+printed or saved as Parquet or JSON for dashboards, so nothing has to parse
+the printed topics.
+'''
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from storage import TABLE_FORMAT, save_table
+
+TOP_WORDS = 10
+
+def top_term_indices(components, top_words=TOP_WORDS):
+    '''
+    Finds the top terms of every topic at once: argpartition picks each topic's
+    top_words columns without sorting the whole vocabulary, and only those are
+    sorted by weight.
+
+    Parameters
+    ----------
+    components : The topic by term weights of a model.
+    top_words : The number of top terms of each topic.
+
+    Returns
+    -------
+    A (number of topics, top_words) array of term columns, highest weight first.
+    '''
+    components = np.asarray(components)
+    n_terms = components.shape[1]
+    top_words = min(top_words, n_terms)
+
+    # Partition from the end rather than negating, which would copy the weights
+    top = np.argpartition(components, n_terms - top_words, axis=1)[:, n_terms - top_words:]
+    order = np.argsort(-np.take_along_axis(components, top, axis=1), axis=1, kind='stable')
+
+    return np.take_along_axis(top, order, axis=1)
+
+def topic_summary(model, feature_names, top_words=TOP_WORDS, topic_names=None, corpus=None):
+    '''
+    Given a model, return the top terms of each topic and their weights.
+
+    Parameters
+    ----------
+    model : A NMF, LSA, or LDA model of text data.
+    feature_names : A list of features extracted from the vectorized model.
+    top_words : The number of top terms of each topic.
+    topic_names : The names of the topics. Set to None as default.
+    corpus : The name of the corpus, e.g. 'cluster_0', added as a column when set.
+
+    Returns
+    -------
+    A dataframe with one row per topic and rank: the topic, its name, the rank,
+    the term and its weight.
+    '''
+    components = model.components_
+    top = top_term_indices(components, top_words)
+    n_topics, n_words = top.shape
+
+    summary = pd.DataFrame({
+        'topic': np.repeat(np.arange(n_topics), n_words),
+        'topic_name': np.repeat([topic_names[topic] if topic_names and topic_names[topic]
+                                 else None for topic in range(n_topics)], n_words),
+        'rank': np.tile(np.arange(1, n_words + 1), n_topics),
+        'term': np.asarray(feature_names, dtype=object)[top.ravel()],
+        'weight': np.take_along_axis(components, top, axis=1).ravel(),
+        })
+    if corpus is not None:
+        summary.insert(0, 'corpus', corpus)
+
+    return summary
+
+def display_topics(model, feature_names, no_top_words, topic_names=None):
+    '''
+    Given a model, print the top words for each topic.
+
+    Parameters
+    ----------
+    model : A NMF, LSA, or LDA model of text data.
+    feature_names : A list of features extracted from the vectorized model.
+    no_top_words : The number of top wrods to display from each topic.
+    topic_names : The names of the topics. Set to None as default.
+    '''
+    summary = topic_summary(model, feature_names, no_top_words, topic_names)
+    for topic, terms in summary.groupby('topic', sort=False).term:
+        if not topic_names or not topic_names[topic]:
+            print("\nTopic ", topic)
+        else:
+            print("\nTopic: '", topic_names[topic], "'")
+        print(", ".join(terms))
+
+def save_topic_summary(summary, name, table_format=TABLE_FORMAT):
+    '''
+    Saves a topic summary for dashboards.
+
+    Parameters
+    ----------
+    summary : A dataframe returned by topic_summary, or several concatenated.
+    name : The name of the file without an extension, e.g. 'topic_summary'.
+    table_format : 'json' for one record per topic with its terms and weights
+    in rank order, or a table format of save_table for one row per term.
+
+    Returns
+    -------
+    The path the summary was saved to.
+    '''
+    if table_format != 'json':
+        return save_table(summary, name, table_format)
+
+    topic_columns = [column for column in ('corpus', 'topic') if column in summary.columns]
+    records = []
+    for keys, topic_terms in summary.groupby(topic_columns, sort=False):
+        record = {column: value.item() if isinstance(value, np.generic) else value
+                  for column, value in zip(topic_columns, keys)}
+        topic_name = topic_terms.topic_name.iloc[0]
+        record['topic_name'] = None if pd.isna(topic_name) else topic_name
+        record['terms'] = topic_terms.term.tolist()
+        record['weights'] = topic_terms.weight.tolist()
+        records.append(record)
+
+    path = '{}.json'.format(name)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(records, file, indent=1)
+
+    return path
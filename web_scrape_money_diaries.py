@@ -1,28 +1,111 @@
 '''
-This script connects to Refinery29's Money Diaries website and uses Selenium to
-get the unique links for 500 money diaries. Using those links, it uses
+This script connects to Refinery29's Money Diaries website and walks the
+paginated listing (or sitemap) over plain HTTP to get the unique links for the
+money diaries. Using those links, it uses
 Beautiful Soup to scrape the diarist metadata and text of their diary and saves
 this to a dictionary.  Then the data is broken into 2 dataframes: the metadata
 and the text data.
 '''
 
 # load packages
+import csv
+import glob
+import json
 import os
 import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from contextlib import ExitStack, closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import count, islice
+from urllib.parse import urljoin, urlsplit
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment, NavigableString, ProcessingInstruction
+from lxml import etree
+import lxml.html
 import requests
+from requests.adapters import HTTPAdapter
 
 import pandas as pd
 
-from selenium import webdriver
+from storage import (COMPRESSION, TABLE_FORMAT, evict_sqlite_cache, init_sqlite_cache,
+                     read_table)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+BASE_URL = 'https://www.refinery29.com'
+LISTING_PATH = '/en-us/money-diary'
+
+# Diary slugs name the series, with or without a dated path, e.g.
+# /en-us/wellness-editor-brooklyn-ny-salary-money-diary or
+# /en-us/2020/03/9524828/remote-teacher-salary-coronavirus-china-connecticut-money-diary.
+# A few misspell it (-money-dairy) or end in the salary instead
+# (/en-us/a-week-living-in-a-van-on-a-12000-salary), but a slug that only
+# mentions a salary, e.g. /en-us/salary-negotiation-tips, is not a diary
+DIARY_LINK_PATTERN = re.compile(
+    r'^/en-us/(?!money-diar(?:y|ies)/?$)(?:\d{4}/\d{2}/\d+/)?'
+    r'(?:[\w-]*money-d(?:iar|air)[\w-]*|[\w-]+-salary)/?$')
+SITEMAP_LOC_PATTERN = re.compile(r'<loc>\s*([^<\s]+)\s*</loc>')
+
+# Diarist metadata labels, matched together in a single pass over the page
+BLANK = 'BLANK'
+FIELD_LABELS = ('Occupation', 'Age', 'Location', 'Salary')
+FIELD_LABEL_PATTERN = re.compile(r'(Occupation|Age|Location|Salary):')
+SECTION_TEXT_CLASS = 'section-text'
+
+# Comments and processing instructions are markup, not text: no label is read
+# from them, and a field takes the text after them
+MARKUP_STRINGS = (Comment, ProcessingInstruction)
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Published diaries rarely change, so cached pages are trusted for a week and
+# then revalidated with a conditional GET
+HTTP_CACHE_PATH = 'http_cache.sqlite'
+CACHE_TTL = 7 * 24 * 60 * 60
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+
+# Each cached page is keyed by URL and stores its validators (ETag and
+# Last-Modified) next to the zlib-compressed body
+HTTP_CACHE_COLUMNS = ('url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                      'fetched_at REAL, accessed_at REAL, size INTEGER, body BLOB')
+
+
+# Per-URL fetch/parse metrics and the run summary
+METRICS_PATH = 'scrape_metrics.json'
+
+# Where each output format writes the text and diarist (metadata) tables
+OUTPUT_PATHS = {
+    'csv': ('text_df.csv', 'diarist_df.csv'),
+    'jsonl': ('text_df.jsonl', 'diarist_df.jsonl'),
+    'parquet': ('text_df.parquet', 'diarist_df.parquet'),
+    }
+TABLE_COLUMNS = {
+    'text': ['story_title', 'diary_text'],
+    'diarist': ['story_title', 'occupation', 'age', 'location', 'salary'],
+    }
+PARQUET_SCHEMAS = {} if pa is None else {
+    'text': pa.schema([('story_title', pa.string()),
+                       ('diary_text', pa.list_(pa.string()))]),
+    'diarist': pa.schema([(column, pa.string()) for column in TABLE_COLUMNS['diarist']]),
+    }
 
 # Get unique links for diaries
 def get_diary_links():
     '''
     Get unique links for diaries using Selenium and Chromedriver. When
     chromedriver window opens, continue scrolling down to find
-    additonal diaries
+    additonal diaries. Kept for reference; discover_diary_links finds the same
+    links without a browser.
 
     Parameters
     ----------
@@ -34,6 +117,8 @@ def get_diary_links():
     all of the money diaries that will be appended to the stem.
     '''
 
+    from selenium import webdriver
+
     chromedriver = '/Applications/chromedriver'
     os.environ['webdriver.chrome.driver'] = chromedriver
 
@@ -49,6 +134,87 @@ def get_diary_links():
 
     return links_to_follow
 
+# Keep only the links that point at diaries
+def filter_diary_links(hrefs, page_url, link_pattern=DIARY_LINK_PATTERN):
+    '''
+    Resolves links against the page they were found on and keeps the ones whose
+    path matches the diary link pattern.
+
+    Parameters
+    ----------
+    hrefs : A list of links found on a listing page or sitemap.
+    page_url : The URL the links were found on, used to resolve relative links.
+    link_pattern : A compiled regex that diary paths must match.
+
+    Returns
+    -------
+    A list of diary paths (the unique part of each link) in page order.
+    '''
+    diary_links = []
+    for href in hrefs:
+        path = urlsplit(urljoin(page_url, href)).path
+        if link_pattern.match(path):
+            diary_links.append(path)
+
+    return diary_links
+
+# Walk the paginated listing and stream diary links as they are found
+def discover_diary_links(session=None, base_url=BASE_URL, listing_path=LISTING_PATH,
+                         sitemap_url=None, max_pages=200, link_pattern=DIARY_LINK_PATTERN,
+                         **request_kwargs):
+    '''
+    Get unique links for diaries over plain HTTP, without a browser. Walks the
+    listing pages (?page=2, ?page=3, ...) until a page adds no new diaries, or
+    reads a sitemap and any sitemaps it indexes. Links are yielded as soon as
+    they are found so fetching can start before discovery finishes.
+
+    Parameters
+    ----------
+    session : An optional shared requests.Session.
+    base_url : The site the listing path is appended to (set as default).
+    listing_path : The path of the money diaries listing (set as default).
+    sitemap_url : An optional sitemap URL to read instead of the listing.
+    max_pages : The maximum number of listing pages to walk.
+    link_pattern : A compiled regex that diary paths must match.
+    request_kwargs : Extra keyword arguments passed on to request_page.
+
+    Yields
+    ------
+    The unique part of the link for each money diary, without duplicates.
+    '''
+    session = session or create_session()
+    seen_links = set()
+
+    if sitemap_url is not None:
+        sitemaps = [sitemap_url]
+        while sitemaps:
+            sitemap = sitemaps.pop(0)
+            locs = SITEMAP_LOC_PATTERN.findall(fetch_page(session, sitemap, **request_kwargs))
+            sitemaps.extend(loc for loc in locs if loc.endswith('.xml'))
+            for link in filter_diary_links(locs, sitemap, link_pattern):
+                if link not in seen_links:
+                    seen_links.add(link)
+                    yield link
+        return
+
+    listing_url = base_url + listing_path
+    for page_number in islice(count(1), max_pages):
+        page_url = listing_url if page_number == 1 else \
+            '{}?page={}'.format(listing_url, page_number)
+        try:
+            page = fetch_page(session, page_url, **request_kwargs)
+        except requests.HTTPError:
+            return
+
+        hrefs = [a['href'] for a in BeautifulSoup(page, 'lxml').find_all('a', href=True)]
+        new_links = [link for link in filter_diary_links(hrefs, page_url, link_pattern)
+                     if link not in seen_links]
+        if not new_links:
+            return
+        for link in new_links:
+            seen_links.add(link)
+            yield link
+
 # Create a helper function to get information about each diarist
 def get_diarist_value(soup, field_name):
     '''
@@ -66,16 +232,503 @@ def get_diarist_value(soup, field_name):
     '''
     blank = 'BLANK'
     try:
-        obj = soup.find(text=re.compile(field_name))
-        if obj and obj.next_element:
-            individual_info = obj.next_element
+        obj = next((string for string in soup.find_all(string=re.compile(field_name))
+                    if not isinstance(string, MARKUP_STRINGS)), None)
+        individual_info = obj.next_element if obj else None
+        while isinstance(individual_info, MARKUP_STRINGS):
+            individual_info = individual_info.next_element
+        if individual_info:
             return individual_info.strip()
         return blank
     except TypeError:
         return blank
 
+# Tell a diary from another article that matched the link pattern
+def is_diary_record(record):
+    '''
+    Checks whether a parsed page has any of the diarist fields. Articles that
+    are not diaries have none of them, so every field falls back to BLANK.
+
+    Parameters
+    ----------
+    record : A dictionary of scraped data for one page.
+
+    Returns
+    -------
+    True if at least one of the occupation, age, location and salary was found.
+    '''
+    return any(record[column] != BLANK for column in TABLE_COLUMNS['diarist']
+               if column != 'story_title')
+
+# Record where the time goes during a crawl
+class ScrapeMetrics:
+    '''
+    Collects per-URL metrics during a crawl (fetch latency, bytes, status,
+    parse time and the fields that fell back to BLANK) together with running
+    counters for fetches, parses and writes. It is shared by all fetching
+    threads, so every update takes a lock.
+
+    Parameters
+    ----------
+    window : The number of seconds the rolling throughput is measured over.
+    log_every : Print a progress line every log_every parsed pages (0 for never).
+    '''
+
+    def __init__(self, window=60, log_every=50):
+        self.window = window
+        self.log_every = log_every
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.parsed_times = deque()
+        self.counters = Counter()
+        self.field_misses = Counter()
+        self.statuses = Counter()
+
+    def _url_metrics(self, url):
+        return self.urls.setdefault(url, {'url': url})
+
+    def record_fetch(self, url, latency, n_bytes, status, attempts=1):
+        '''
+        Records one fetch. status is the HTTP status code, or 'cache' for a page
+        read from the on-disk cache without a request.
+        '''
+        with self.lock:
+            self._url_metrics(url).update(fetch_seconds=latency, bytes=n_bytes,
+                                          status=status, attempts=attempts)
+            self.statuses[str(status)] += 1
+            self.counters['fetched'] += 1
+            self.counters['bytes'] += n_bytes
+            self.counters['fetch_seconds'] += latency
+            self.counters['retries'] += attempts - 1
+
+    def record_failure(self, url, status):
+        '''
+        Records a link that could not be fetched and was skipped. status is the
+        HTTP status code, or the name of the exception for a connection error.
+        '''
+        with self.lock:
+            self._url_metrics(url).update(status=status, failed=True)
+            self.statuses[str(status)] += 1
+            self.counters['failed'] += 1
+
+    def record_parse(self, url, parse_seconds, record):
+        '''
+        Records the parse time of one page and which fields were missing.
+        '''
+        missing = [column for column in TABLE_COLUMNS['diarist'] if record[column] == BLANK]
+        if not record['diary_text']:
+            missing.append('diary_text')
+        not_diary = not is_diary_record(record)
+
+        with self.lock:
+            self._url_metrics(url).update(parse_seconds=parse_seconds, missing_fields=missing)
+            self.field_misses.update(missing)
+            self.counters['parsed'] += 1
+            self.counters['not_diaries'] += not_diary
+            self.counters['parse_seconds'] += parse_seconds
+            now = time.time()
+            self.parsed_times.append(now)
+            while self.parsed_times and now - self.parsed_times[0] > self.window:
+                self.parsed_times.popleft()
+            parsed = self.counters['parsed']
+
+        if self.log_every and parsed % self.log_every == 0:
+            print(self.progress())
+
+    def record_write(self, write_seconds, n_records=1):
+        '''
+        Records the time spent writing records to the output tables.
+        '''
+        with self.lock:
+            self.counters['written'] += n_records
+            self.counters['write_seconds'] += write_seconds
+
+    def rolling_throughput(self):
+        '''
+        Returns the number of pages parsed per second over the rolling window.
+        '''
+        with self.lock:
+            if len(self.parsed_times) < 2:
+                return 0.0
+            span = max(time.time() - self.parsed_times[0], 1e-9)
+            return len(self.parsed_times) / span
+
+    def progress(self):
+        '''
+        Returns a one-line progress message with the running totals.
+        '''
+        return '{} fetched, {} parsed, {} written, {:.1f} pages/s over the last {}s'.format(
+            self.counters['fetched'], self.counters['parsed'], self.counters['written'],
+            self.rolling_throughput(), self.window)
+
+    def summary(self):
+        '''
+        Returns a dictionary summarising the crawl: totals, latency and parse
+        time percentiles, status counts, field misses and overall throughput.
+        '''
+        elapsed = time.time() - self.started_at
+        with self.lock:
+            per_url = pd.DataFrame(list(self.urls.values()))
+            counters = dict(self.counters)
+
+        def percentiles(column):
+            if column not in per_url:
+                return {}
+            values = per_url[column].dropna()
+            return {'p50': float(values.quantile(.5)), 'p95': float(values.quantile(.95)),
+                    'max': float(values.max())} if len(values) else {}
+
+        return {
+            'elapsed_seconds': elapsed,
+            'counters': counters,
+            'pages_per_second': counters.get('parsed', 0) / elapsed if elapsed else 0.0,
+            'mb_per_second': counters.get('bytes', 0) / 1e6 / elapsed if elapsed else 0.0,
+            'fetch_seconds': percentiles('fetch_seconds'),
+            'parse_seconds': percentiles('parse_seconds'),
+            'statuses': dict(self.statuses),
+            'field_misses': dict(self.field_misses),
+            }
+
+    def report(self):
+        '''
+        Returns a human-readable report of where the crawl spent its time.
+        '''
+        summary = self.summary()
+        counters = summary['counters']
+        lines = [
+            'Scraped {} pages in {:.1f}s ({:.2f} pages/s, {:.2f} MB/s)'.format(
+                counters.get('parsed', 0), summary['elapsed_seconds'],
+                summary['pages_per_second'], summary['mb_per_second']),
+            'Time in fetch {:.1f}s, parse {:.1f}s, write {:.1f}s (summed over workers)'.format(
+                counters.get('fetch_seconds', 0), counters.get('parse_seconds', 0),
+                counters.get('write_seconds', 0)),
+            'Fetch latency: {}'.format(summary['fetch_seconds']),
+            'Parse time: {}'.format(summary['parse_seconds']),
+            'Statuses: {}, retries: {}, skipped: {}'.format(
+                summary['statuses'], counters.get('retries', 0), counters.get('failed', 0)),
+            'Missing fields: {}, pages that were not diaries: {}'.format(
+                summary['field_misses'], counters.get('not_diaries', 0)),
+            ]
+        return '\n'.join(lines)
+
+    def write(self, metrics_path):
+        '''
+        Writes the summary and the per-URL metrics to a JSON file.
+        '''
+        with self.lock:
+            per_url = list(self.urls.values())
+        with open(metrics_path, 'w') as metrics_file:
+            json.dump({'summary': self.summary(), 'urls': per_url}, metrics_file,
+                      indent=2, default=float)
+
+# Create a shared session so connections are pooled and reused between requests
+def create_session(pool_size=10):
+    '''
+    Creates a requests session whose connection pool is large enough to serve
+    every worker thread without opening a new connection per diary.
+
+    Parameters
+    ----------
+    pool_size : The number of connections kept open per host.
+
+    Returns
+    -------
+    A requests.Session with a pooled HTTP and HTTPS adapter mounted.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+# Request one page, limiting concurrent requests per host and retrying failures
+def request_page(session, url, headers=None, host_semaphores=None, per_host_limit=4,
+                 max_retries=3, backoff=0.5, metrics=None):
+    '''
+    Requests a page and returns the response. At most per_host_limit requests
+    are in flight to the same host at once. Connection errors and retryable
+    status codes are retried with exponential backoff.
+
+    Parameters
+    ----------
+    session : The shared requests.Session used for the request.
+    url : The full URL to request.
+    headers : Optional extra request headers, e.g. for a conditional GET.
+    host_semaphores : A dictionary of host to semaphore shared by all workers.
+    per_host_limit : The maximum number of concurrent requests per host.
+    max_retries : The number of retries after the first failed attempt.
+    backoff : The delay in seconds before the first retry, doubled each retry.
+    metrics : An optional ScrapeMetrics that records the latency, size and status.
+
+    Returns
+    -------
+    The requests.Response of the first successful attempt. A 4xx status, or a
+    failure that outlasts the retries, raises a requests.RequestException.
+    '''
+    if host_semaphores is None:
+        host_semaphores = {}
+    host = urlsplit(url).netloc
+    semaphore = host_semaphores.setdefault(
+        host, threading.BoundedSemaphore(per_host_limit))
+
+    start = time.perf_counter()
+    for attempt in range(max_retries + 1):
+        try:
+            with semaphore:
+                response = session.get(url, headers=headers, timeout=30)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                if metrics is not None:
+                    metrics.record_fetch(url, time.perf_counter() - start,
+                                         len(response.content), response.status_code,
+                                         attempt + 1)
+                return response
+            if attempt == max_retries:
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+    return None
+
+def fetch_page(session, url, **request_kwargs):
+    '''
+    Requests a page with request_page and returns its HTML.
+
+    Parameters
+    ----------
+    session : The shared requests.Session used for the request.
+    url : The full URL to request.
+    request_kwargs : Extra keyword arguments passed on to request_page.
+
+    Returns
+    -------
+    The text of the response.
+    '''
+    return request_page(session, url, **request_kwargs).text
+
+# Fetch a page through the on-disk cache
+def cached_fetch_page(session, url, cache_path, ttl=CACHE_TTL,
+                      max_cache_bytes=MAX_CACHE_BYTES, **request_kwargs):
+    '''
+    Returns the HTML of a page from the on-disk cache. Pages younger than ttl
+    are read locally. Older pages are revalidated with a conditional GET, so an
+    unchanged diary costs a 304 instead of a full download.
+
+    Parameters
+    ----------
+    session : The shared requests.Session used for the request.
+    url : The full URL to request.
+    cache_path : The path of the SQLite cache file (see HTTP_CACHE_COLUMNS).
+    ttl : The number of seconds a cached page is used without revalidating.
+    max_cache_bytes : The maximum total size of the compressed bodies.
+    request_kwargs : Extra keyword arguments passed on to request_page.
+
+    Returns
+    -------
+    The text of the page.
+    '''
+    now = time.time()
+    start = time.perf_counter()
+    with closing(sqlite3.connect(cache_path, timeout=30)) as conn:
+        row = conn.execute(
+            'SELECT etag, last_modified, fetched_at, body FROM pages WHERE url = ?',
+            (url,)).fetchone()
+
+        if row is not None and now - row[2] < ttl:
+            with conn:
+                conn.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (now, url))
+            page = zlib.decompress(row[3]).decode('utf-8')
+            if request_kwargs.get('metrics') is not None:
+                request_kwargs['metrics'].record_fetch(url, time.perf_counter() - start,
+                                                       len(page.encode('utf-8')), 'cache')
+            return page
+
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+
+        response = request_page(session, url, headers=headers, **request_kwargs)
+
+        if response.status_code == 304 and row is not None:
+            with conn:
+                conn.execute(
+                    'UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?',
+                    (now, now, url))
+            return zlib.decompress(row[3]).decode('utf-8')
+
+        page = response.text
+        body = zlib.compress(page.encode('utf-8'))
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), now, now, len(body), body))
+            evict_sqlite_cache(conn, 'pages', 'url', max_cache_bytes)
+
+    return page
+
+# Collect the diarist fields and diary text in one walk over the soup
+def extract_fields_bs4(page):
+    '''
+    Parses a money diary with BeautifulSoup and walks the tree once. Each
+    string is checked against one precompiled pattern for all of the field
+    labels, and the section-text divs are collected in the same walk. A field
+    takes the node right after its first label, as get_diarist_value does,
+    passing over comments.
+
+    Parameters
+    ----------
+    page : The HTML of one money diary.
+
+    Returns
+    -------
+    A dictionary of the field values (BLANK when missing) and a list of the
+    diary text sections.
+    '''
+    soup = BeautifulSoup(page, 'lxml')
+    fields = {}
+    diary_text = []
+
+    for node in soup.descendants:
+        if isinstance(node, MARKUP_STRINGS):
+            continue
+        if isinstance(node, NavigableString):
+            for label in FIELD_LABEL_PATTERN.findall(node):
+                if label not in fields:
+                    value = node.next_element
+                    while isinstance(value, MARKUP_STRINGS):
+                        value = value.next_element
+                    fields[label] = value.strip() if isinstance(value, NavigableString) \
+                        else BLANK
+        elif node.name == 'div' and SECTION_TEXT_CLASS in node.get('class', ()):
+            diary_text.append(node.text)
+
+    return {label: fields.get(label, BLANK) for label in FIELD_LABELS}, diary_text
+
+def extract_fields_lxml(page):
+    '''
+    The same single walk as extract_fields_bs4, but over an lxml tree without
+    building a BeautifulSoup object, which is several times faster. Text and
+    tails are visited in document order, so the node after a label is the same
+    one BeautifulSoup would return. The text of comments is skipped, but the
+    text after them (their tail) is read like any other.
+
+    Parameters
+    ----------
+    page : The HTML of one money diary.
+
+    Returns
+    -------
+    A dictionary of the field values (BLANK when missing) and a list of the
+    diary text sections.
+    '''
+    root = lxml.html.fromstring(page)
+    fields = {}
+    diary_text = []
+    pending_labels = []
+
+    def visit_string(text):
+        for label in pending_labels:
+            fields[label] = text.strip()
+        del pending_labels[:]
+        for label in FIELD_LABEL_PATTERN.findall(text):
+            if label not in fields and label not in pending_labels:
+                pending_labels.append(label)
+
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event in ('comment', 'pi'):
+            if element.tail:
+                visit_string(element.tail)
+        elif event == 'start':
+            if not isinstance(element.tag, str):
+                continue
+            for label in pending_labels:
+                fields[label] = BLANK
+            del pending_labels[:]
+            if element.tag == 'div' and \
+                    SECTION_TEXT_CLASS in element.get('class', '').split():
+                diary_text.append(element.text_content())
+            if element.text:
+                visit_string(element.text)
+        elif element.tail:
+            visit_string(element.tail)
+
+    return {label: fields.get(label, BLANK) for label in FIELD_LABELS}, diary_text
+
+# Parse the HTML of one money diary into a dictionary
+def parse_money_diary(page, id_link, parser='bs4'):
+    '''
+    Creates a dictionary of the categories of scraped data from the HTML of
+    one money diary
+
+    Parameters
+    ----------
+    page : The HTML of one money diary.
+    id_link : The unique part of the link for one money diary.
+    parser : 'bs4' to parse with BeautifulSoup (set as default) or 'lxml' to
+    walk an lxml tree directly.
+
+    Returns
+    -------
+    A dictionary of scraped data for the money diary.
+    '''
+    fields, diary_text = FIELD_EXTRACTORS[parser](page)
+
+    data_dict = {
+        'story_title': id_link,
+        'occupation': fields['Occupation'],
+        'age': fields['Age'],
+        'location': fields['Location'],
+        'salary': fields['Salary'],
+        'diary_text': diary_text,
+        }
+
+    return data_dict
+
+FIELD_EXTRACTORS = {'bs4': extract_fields_bs4, 'lxml': extract_fields_lxml}
+
+# Fetch the HTML of one diary
+def fetch_diary_page(id_link, session=None, base_url=BASE_URL, cache_path=None,
+                     **fetch_kwargs):
+    '''
+    Requests the HTML of one money diary.
+
+    Parameters
+    ----------
+    id_link : The unique part of the link for one money diary.
+    session : An optional shared requests.Session. When given, the page is
+    fetched with per-host limiting and retries.
+    base_url : The site the link is appended to (set as default).
+    cache_path : An optional path of an on-disk response cache. When given, the
+    page is read through cached_fetch_page.
+    fetch_kwargs : Extra keyword arguments passed on to fetch_page or
+    cached_fetch_page.
+
+    Returns
+    -------
+    The HTML of the money diary.
+    '''
+
+    # Create full URL to scrape
+    url = base_url + id_link
+
+    if cache_path is not None:
+        return cached_fetch_page(session or create_session(1), url, cache_path,
+                                 **fetch_kwargs)
+    if session is not None:
+        return fetch_page(session, url, **fetch_kwargs)
+    return requests.get(url).text
+
 # Create a dictionary to hold the scraped data
-def get_money_diaries_dict(id_link):
+def get_money_diaries_dict(id_link, session=None, base_url=BASE_URL, cache_path=None,
+                           **fetch_kwargs):
     '''
     Creates a dictionary of the categories of scraped data from each of the
     money diaries
@@ -83,81 +736,614 @@ def get_money_diaries_dict(id_link):
     Parameters
     ----------
     id_link : The unique part of the link for one money diary.
+    session : An optional shared requests.Session.
+    base_url : The site the link is appended to (set as default).
+    cache_path : An optional path of an on-disk response cache.
+    fetch_kwargs : Extra keyword arguments passed on to fetch_diary_page.
 
     Returns
     -------
     A dictionary of scraped data for each of the money diaries.
     '''
 
-    # Develop base URL
-    base_url = 'https://www.refinery29.com'
+    # Request HTML and parse
+    page = fetch_diary_page(id_link, session=session, base_url=base_url,
+                            cache_path=cache_path, **fetch_kwargs)
 
-    # Create full URL to scrape
-    url = base_url + id_link
+    return parse_money_diary(page, id_link)
 
-    # Request HTML and parse
-    response = requests.get(url)
-    page = response.text
-    soup = BeautifulSoup(page, 'lxml')
+# Run a function over an iterable in an executor with a bounded number in flight
+def bounded_map(executor, function, iterable, max_pending):
+    '''
+    Like executor.map, but only max_pending items are submitted ahead of the
+    result being consumed. The iterable is pulled lazily, so a slow consumer
+    holds back the producer instead of letting queued work grow without limit.
+
+    Parameters
+    ----------
+    executor : A thread or process pool executor.
+    function : The function applied to each item.
+    iterable : The items, which may be a generator.
+    max_pending : The maximum number of submitted items not yet consumed.
+
+    Yields
+    ------
+    The result for each item, in the same order as the iterable.
+    '''
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
-    headers = ['story_title', 'occupation', 'age', 'location', 'salary',
-               'diary_text']
+# Worker run in the parser processes
+def parse_page_item(page_item, parser='bs4'):
+    '''
+    Parses one (id_link, page) pair with parse_money_diary.
 
-    # Story title
-    story_title = id_link
+    Parameters
+    ----------
+    page_item : A tuple of the unique part of the link and the HTML of the diary.
+    parser : The parser backend passed on to parse_money_diary.
 
-    # Occupation
-    occupation = get_diarist_value(soup, 'Occupation:')
+    Returns
+    -------
+    A dictionary of scraped data for the money diary.
+    '''
+    id_link, page = page_item
+    return parse_money_diary(page, id_link, parser)
 
-    # Age
-    age = get_diarist_value(soup, 'Age:')
+def timed_parse_page_item(page_item, parser='bs4'):
+    '''
+    Parses one (id_link, page) pair and times the parse, so the time can be
+    reported from the parser processes back to the crawl's metrics.
 
-    # Location
-    location = get_diarist_value(soup, 'Location:')
+    Parameters
+    ----------
+    page_item : A tuple of the unique part of the link and the HTML of the diary.
+    parser : The parser backend passed on to parse_money_diary.
 
-    # Salary
-    salary = get_diarist_value(soup, 'Salary:')
+    Returns
+    -------
+    A tuple of the dictionary of scraped data and the parse time in seconds.
+    '''
+    start = time.perf_counter()
+    record = parse_page_item(page_item, parser)
+    return record, time.perf_counter() - start
 
-    # Diary text
-    diary_text = []
-    for div in soup.find_all('div', class_='section-text'):
-        diary_text.append(div.text)
+def parse_pages_in_pool(page_items, parse_workers=None, max_pending=None, parser='bs4',
+                        timed=False, executor=None):
+    '''
+    Parses raw pages on a pool of processes so BeautifulSoup parsing is not
+    limited by the GIL. At most max_pending pages wait in the pool, which holds
+    back whatever produces the pages when the parsers fall behind.
 
-    data_dict = dict(zip(headers, [story_title, occupation, age, location,
-                                   salary, diary_text]))
+    Parameters
+    ----------
+    page_items : An iterable of (id_link, page) tuples, which may be a generator.
+    parse_workers : The number of parser processes (defaults to the CPU count).
+    max_pending : The maximum number of pages queued for parsing (defaults to
+    four per process).
+    parser : The parser backend passed on to parse_money_diary.
+    timed : Whether to yield (record, parse seconds) tuples instead of records.
+    executor : An optional open ProcessPoolExecutor to reuse instead of starting
+    a new pool of parse_workers processes.
 
-    return data_dict
+    Yields
+    ------
+    A dictionary of scraped data for each page, in input order.
+    '''
+    parse_workers = parse_workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * parse_workers
+    worker = timed_parse_page_item if timed else parse_page_item
+    with ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=parse_workers))
+        yield from bounded_map(executor, partial(worker, parser=parser),
+                               page_items, max_pending)
+
+# Read the pages saved in the on-disk cache
+def iter_cached_pages(cache_path):
+    '''
+    Reads every page archived in the on-disk response cache, for re-parsing
+    without touching the network.
+
+    Parameters
+    ----------
+    cache_path : The path of the SQLite cache file.
+
+    Yields
+    ------
+    A tuple of the unique part of the link and the HTML of each cached diary.
+    '''
+    with closing(sqlite3.connect(cache_path, timeout=30)) as conn:
+        for url, body in conn.execute('SELECT url, body FROM pages ORDER BY url'):
+            yield urlsplit(url).path, zlib.decompress(body).decode('utf-8')
+
+# Fetch and parse many diaries concurrently
+def iter_money_diaries(links_to_follow, max_workers=8, per_host_limit=4,
+                       max_retries=3, backoff=0.5, base_url=BASE_URL,
+                       cache_path=None, parse_workers=0, parser='bs4', metrics=None,
+                       session=None, fetch_executor=None, parse_executor=None):
+    '''
+    Fetches and parses the money diaries with a bounded thread pool that shares
+    one pooled session. Results are yielded as soon as they are parsed, in the
+    same order as the links. A link that fails (a 4xx status, or an error that
+    outlasts the retries) is recorded in the metrics and skipped, so it yields
+    nothing and is tried again on the next run. Pages without any diarist field
+    are other articles that matched the link pattern, and are dropped.
+    With parse_workers set, the threads only fetch and the raw pages are handed
+    through a bounded queue to a process pool of parsers.
+
+    Parameters
+    ----------
+    links_to_follow : The list of unique parts of the links for the money diaries.
+    max_workers : The number of worker threads. 1 fetches the links one by one.
+    per_host_limit : The maximum number of concurrent requests per host.
+    max_retries : The number of retries for each failed request.
+    backoff : The delay in seconds before the first retry, doubled each retry.
+    base_url : The site the links are appended to (set as default).
+    cache_path : An optional path of an on-disk response cache.
+    parse_workers : The number of parser processes, or 0 to parse in the
+    fetching threads.
+    parser : The parser backend passed on to parse_money_diary.
+    metrics : An optional ScrapeMetrics that records fetch and parse metrics.
+    session : An optional open requests.Session to reuse. Without one, a session
+    is created and closed when the links are done.
+    fetch_executor : An optional open ThreadPoolExecutor of max_workers threads
+    to reuse instead of starting one.
+    parse_executor : An optional open ProcessPoolExecutor of parse_workers
+    processes to reuse instead of starting one.
+
+    Yields
+    ------
+    A dictionary of scraped data for each link that was fetched.
+    '''
+    owns_session = session is None
+    if owns_session:
+        session = create_session(pool_size=max(max_workers, per_host_limit))
+    host_semaphores = {}
+    if cache_path is not None:
+        init_sqlite_cache(cache_path, 'pages', HTTP_CACHE_COLUMNS, 'url')
+
+    def fetch_one(link):
+        try:
+            return link, fetch_diary_page(
+                link, session=session, base_url=base_url, cache_path=cache_path,
+                host_semaphores=host_semaphores, per_host_limit=per_host_limit,
+                max_retries=max_retries, backoff=backoff, metrics=metrics)
+        except requests.RequestException as error:
+            if metrics is not None:
+                response = getattr(error, 'response', None)
+                metrics.record_failure(base_url + link, type(error).__name__
+                                       if response is None else response.status_code)
+            return link, None
+
+    def get_one(link):
+        page_item = fetch_one(link)
+        if page_item[1] is None:
+            return None, 0.0
+        return timed_parse_page_item(page_item, parser)
+
+    def record_parses(timed_records):
+        for record, parse_seconds in timed_records:
+            if record is None:
+                continue
+            if metrics is not None:
+                metrics.record_parse(base_url + record['story_title'], parse_seconds, record)
+            if is_diary_record(record):
+                yield record
+
+    try:
+        with ExitStack() as stack:
+            if fetch_executor is None and (parse_workers or max_workers > 1):
+                fetch_executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+            if parse_workers:
+                fetched = bounded_map(fetch_executor, fetch_one, links_to_follow,
+                                      2 * max_workers)
+                page_items = (page_item for page_item in fetched if page_item[1] is not None)
+                yield from record_parses(parse_pages_in_pool(
+                    page_items, parse_workers, parser=parser, timed=True,
+                    executor=parse_executor))
+            elif max_workers <= 1:
+                yield from record_parses(map(get_one, links_to_follow))
+            else:
+                yield from record_parses(fetch_executor.map(get_one, links_to_follow))
+    finally:
+        if owns_session:
+            session.close()
+
+# Open the session and worker pools once for a run of many batches
+def open_fetch_pools(stack, max_workers=8, per_host_limit=4, parse_workers=0,
+                     **fetch_kwargs):
+    '''
+    Opens the pooled session, the fetching threads and, with parse_workers set,
+    the parser processes that iter_money_diaries would otherwise start on every
+    call, and registers them on an ExitStack so they are closed with it.
+
+    Parameters
+    ----------
+    stack : The contextlib.ExitStack that closes the session and pools.
+    max_workers : The number of worker threads.
+    per_host_limit : The maximum number of concurrent requests per host.
+    parse_workers : The number of parser processes, or 0 to parse in the
+    fetching threads.
+    fetch_kwargs : The other keyword arguments of iter_money_diaries, ignored.
+
+    Returns
+    -------
+    A dictionary of the session, fetch_executor and parse_executor keyword
+    arguments of iter_money_diaries.
+    '''
+    pools = {'session': stack.enter_context(
+        create_session(pool_size=max(max_workers, per_host_limit)))}
+    if parse_workers or max_workers > 1:
+        pools['fetch_executor'] = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+    if parse_workers:
+        pools['parse_executor'] = stack.enter_context(
+            ProcessPoolExecutor(max_workers=parse_workers))
+
+    return pools
+
+def fetch_money_diaries(links_to_follow, **fetch_kwargs):
+    '''
+    Fetches and parses the money diaries with iter_money_diaries.
+
+    Parameters
+    ----------
+    links_to_follow : The list of unique parts of the links for the money diaries.
+    fetch_kwargs : Extra keyword arguments passed on to iter_money_diaries.
+
+    Returns
+    -------
+    A list of dictionaries of scraped data, one per link.
+    '''
+    return list(iter_money_diaries(links_to_follow, **fetch_kwargs))
+
+# Write scraped records to disk as soon as they are parsed
+class RecordSink:
+    '''
+    Streams scraped diaries to the diarist (metadata) table and the text table
+    in one pass, so memory stays flat however many diaries are scraped.
+
+    csv matches the original text_df.csv/diarist_df.csv layout. jsonl and
+    parquet keep diary_text as a real list instead of its string repr. Parquet
+    tables are folders of part files: each sink adds one part and writes a row
+    group every row_group_size records.
+
+    When appending, the batch is all or nothing: if the with block raises, the
+    rows written so far are discarded so the tables stay in step with the
+    manifest, and a rerun scrapes the batch again without duplicating it.
+
+    Parameters
+    ----------
+    text_path : The path of the text table.
+    diarist_path : The path of the diarist table.
+    output_format : 'csv', 'jsonl' or 'parquet'.
+    append : Whether to add to existing tables instead of replacing them.
+    row_group_size : The number of records per Parquet row group.
+    '''
+
+    def __init__(self, text_path, diarist_path, output_format='csv', append=False,
+                 row_group_size=64):
+        if output_format not in OUTPUT_PATHS:
+            raise ValueError('Unknown output format: {}'.format(output_format))
+        if output_format == 'parquet' and pq is None:
+            raise ImportError('Writing parquet requires pyarrow')
+
+        self.output_format = output_format
+        self.append = append
+        self.row_group_size = row_group_size
+        self.buffers = {'text': [], 'diarist': []}
+        self.paths = {}
+        self.files = {}
+        self.writers = {}
+        self.start_offsets = {}
+
+        for table, path in (('text', text_path), ('diarist', diarist_path)):
+            if output_format == 'parquet':
+                self.files[table] = self.paths[table] = self._open_part(path, append)
+            else:
+                is_new = not append or not os.path.exists(path)
+                self.paths[table] = path
+                self.files[table] = open(path, 'w' if not append else 'a',
+                                         newline='', encoding='utf-8')
+                if output_format == 'csv':
+                    self.writers[table] = csv.writer(self.files[table])
+                    if is_new:
+                        self.writers[table].writerow(TABLE_COLUMNS[table])
+                # Where this sink's rows start, to cut them off again in discard
+                self.start_offsets[table] = self.files[table].tell()
+
+    @staticmethod
+    def _open_part(folder, append):
+        os.makedirs(folder, exist_ok=True)
+        parts = sorted(glob.glob(os.path.join(folder, 'part-*.parquet')))
+        if not append:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        return os.path.join(folder, 'part-{:05d}.parquet'.format(len(parts)))
+
+    def write(self, record):
+        '''
+        Writes one scraped diary to both tables.
+
+        Parameters
+        ----------
+        record : A dictionary of scraped data for one money diary.
+        '''
+        for table, columns in TABLE_COLUMNS.items():
+            row = {column: record[column] for column in columns}
+            if self.output_format == 'csv':
+                self.writers[table].writerow(
+                    [str(value) if isinstance(value, list) else value
+                     for value in row.values()])
+            elif self.output_format == 'jsonl':
+                self.files[table].write(json.dumps(row) + '\n')
+            else:
+                self.buffers[table].append(row)
+                if len(self.buffers[table]) >= self.row_group_size:
+                    self._write_row_group(table)
+
+    def _write_row_group(self, table):
+        rows = self.buffers[table]
+        if not rows:
+            return
+        schema = PARQUET_SCHEMAS[table]
+        if table not in self.writers:
+            self.writers[table] = pq.ParquetWriter(self.files[table], schema,
+                                                   compression=COMPRESSION)
+        self.writers[table].write_table(pa.Table.from_pylist(rows, schema=schema))
+        self.buffers[table] = []
+
+    def close(self):
+        '''
+        Writes any buffered rows and closes both tables.
+        '''
+        for table in TABLE_COLUMNS:
+            if self.output_format == 'parquet':
+                self._write_row_group(table)
+                if table in self.writers:
+                    self.writers[table].close()
+            else:
+                self.files[table].flush()
+                os.fsync(self.files[table].fileno())
+                self.files[table].close()
+
+    def discard(self):
+        '''
+        Closes both tables without the rows written by this sink: the Parquet
+        part files are removed, and csv and jsonl files are cut back to where
+        this sink started.
+        '''
+        for table in TABLE_COLUMNS:
+            if self.output_format == 'parquet':
+                if table in self.writers:
+                    self.writers[table].close()
+                if os.path.exists(self.paths[table]):
+                    os.remove(self.paths[table])
+            else:
+                self.files[table].close()
+                with open(self.paths[table], 'r+b') as table_file:
+                    table_file.truncate(self.start_offsets[table])
+                    os.fsync(table_file.fileno())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.append:
+            self.discard()
+        else:
+            self.close()
+
+def write_record(sink, record, metrics=None):
+    '''
+    Writes one record to a RecordSink, timing the write when metrics are kept.
+
+    Parameters
+    ----------
+    sink : An open RecordSink.
+    record : A dictionary of scraped data for one money diary.
+    metrics : An optional ScrapeMetrics that records the time spent writing.
+    '''
+    start = time.perf_counter()
+    sink.write(record)
+    if metrics is not None:
+        metrics.record_write(time.perf_counter() - start)
+
+# Read the story titles back out of a saved diarist table
+def read_story_titles(diarist_path):
+    '''
+    Reads the story_title column of a diarist table written by RecordSink.
+
+    Parameters
+    ----------
+    diarist_path : The path of the diarist table (csv, jsonl or parquet).
+
+    Returns
+    -------
+    A set of the story titles in the table.
+    '''
+    return set(read_table(diarist_path, columns=['story_title']).story_title)
+
+def manifest_path_for(diarist_path):
+    '''
+    Returns the path of the manifest of story titles saved to a diarist table,
+    e.g. diarist_df.parquet.manifest.txt, so each table and format has its own.
+    '''
+    return '{}.manifest.txt'.format(diarist_path)
+
+# Read the story titles that have already been scraped
+def load_manifest(manifest_path, diarist_path=None):
+    '''
+    Reads the manifest of story titles already saved to the dataset. If there is
+    no manifest yet but a diarist table exists, the manifest is seeded from the
+    story_title column of that table. If the diarist table is gone (deleted or
+    moved), nothing in the manifest is saved any more, so it is emptied.
+
+    Parameters
+    ----------
+    manifest_path : The path of the manifest file, one story title per line.
+    diarist_path : An optional path of the diarist table the manifest belongs to.
+
+    Returns
+    -------
+    A set of the story titles that are already in the dataset.
+    '''
+    if diarist_path is not None and not os.path.exists(diarist_path):
+        open(manifest_path, 'w').close()
+        return set()
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest:
+            return {line.strip() for line in manifest if line.strip()}
+
+    if diarist_path is not None and os.path.exists(diarist_path):
+        scraped_titles = read_story_titles(diarist_path)
+        with open(manifest_path, 'w') as manifest:
+            manifest.writelines(title + '\n' for title in scraped_titles)
+        return scraped_titles
+
+    return set()
+
+# Append a batch of scraped diaries to the tables and record a checkpoint
+def append_checkpoint(money_diary_list, text_path, diarist_path, manifest_path,
+                      output_format='csv', metrics=None):
+    '''
+    Appends a batch of scraped diaries to the text and diarist tables and
+    then adds their story titles to the manifest. If the batch fails part way,
+    the sink discards its rows and the manifest is not touched. The manifest is
+    written last, so a crash can only repeat a batch, never lose or duplicate one.
+
+    Parameters
+    ----------
+    money_diary_list : An iterable of dictionaries of scraped data.
+    text_path : The path of the text table.
+    diarist_path : The path of the diarist table.
+    manifest_path : The path of the manifest file.
+    output_format : 'csv', 'jsonl' or 'parquet'.
+    metrics : An optional ScrapeMetrics that records the time spent writing.
+
+    Returns
+    -------
+    The number of diaries appended.
+    '''
+    story_titles = []
+    with RecordSink(text_path, diarist_path, output_format, append=True) as sink:
+        for record in money_diary_list:
+            write_record(sink, record, metrics)
+            story_titles.append(record['story_title'])
+
+    with open(manifest_path, 'a') as manifest:
+        manifest.writelines(title + '\n' for title in story_titles)
+        manifest.flush()
+        os.fsync(manifest.fileno())
+
+    return len(story_titles)
+
+# Scrape only the diaries that are not in the dataset yet
+def scrape_new_money_diaries(links_to_follow, output_format=TABLE_FORMAT, text_path=None,
+                             diarist_path=None, manifest_path=None,
+                             checkpoint_every=25, **fetch_kwargs):
+    '''
+    Scrapes the links that are not in the manifest yet and appends them to the
+    text and diarist tables every checkpoint_every diaries. Rerunning after a
+    crash resumes after the last checkpoint, and a weekly refresh only fetches
+    the new diaries. The session and worker pools are opened once and shared by
+    every batch.
+
+    Parameters
+    ----------
+    links_to_follow : An iterable of unique parts of the links for the money diaries.
+    output_format : 'csv', 'jsonl' or 'parquet'.
+    text_path : The path of the text table (defaults by format).
+    diarist_path : The path of the diarist table (defaults by format).
+    manifest_path : The path of the manifest file (defaults to the one of the
+    diarist table, see manifest_path_for).
+    checkpoint_every : The number of diaries fetched between checkpoints.
+    fetch_kwargs : Extra keyword arguments passed on to iter_money_diaries.
+
+    Returns
+    -------
+    The number of diaries that were scraped in this run.
+    '''
+    default_text_path, default_diarist_path = OUTPUT_PATHS[output_format]
+    text_path = text_path or default_text_path
+    diarist_path = diarist_path or default_diarist_path
+    manifest_path = manifest_path or manifest_path_for(diarist_path)
+    scraped_titles = load_manifest(manifest_path, diarist_path)
+
+    def new_links():
+        for link in links_to_follow:
+            if link not in scraped_titles:
+                scraped_titles.add(link)
+                yield link
+
+    # Links may be a generator from discover_diary_links, so batches are
+    # pulled lazily and fetching starts while discovery is still running
+    pending_links = new_links()
+    scraped_count = 0
+    with ExitStack() as stack:
+        pools = open_fetch_pools(stack, **fetch_kwargs)
+        while True:
+            batch = list(islice(pending_links, checkpoint_every))
+            if not batch:
+                return scraped_count
+            scraped_count += append_checkpoint(
+                iter_money_diaries(batch, **fetch_kwargs, **pools),
+                text_path, diarist_path, manifest_path, output_format,
+                fetch_kwargs.get('metrics'))
 
 # Scrape the data
-def scrape_r29_money_diaries(links_to_follow):
+def scrape_r29_money_diaries(links_to_follow, max_workers=8, per_host_limit=4,
+                             base_url=BASE_URL, cache_path=HTTP_CACHE_PATH,
+                             incremental=False, parse_workers=0, parser='bs4',
+                             output_format=TABLE_FORMAT, metrics=None):
     '''
     Returns 2 dataframes with information scraped from Refinery29: a
-    metadata dataframe and a text dataframe
+    metadata dataframe and a text dataframe. Each diary is written to both
+    tables as soon as it is parsed. In incremental mode only the diaries
+    missing from the existing tables are scraped and appended.
 
     Parameters
     ----------
     links_to_follow : The list of unique parts of the links for the money diaries.
+    max_workers : The number of diaries fetched concurrently.
+    per_host_limit : The maximum number of concurrent requests per host.
+    base_url : The site the links are appended to (set as default).
+    cache_path : The path of the on-disk response cache, or None to disable it.
+    incremental : Whether to resume from the manifest and append new diaries
+    instead of rewriting the tables.
+    parse_workers : The number of parser processes, or 0 to parse in the
+    fetching threads.
+    parser : The parser backend passed on to parse_money_diary.
+    output_format : 'parquet' (text_df.parquet and diarist_df.parquet, the
+    default when pyarrow is installed), 'csv' or 'jsonl'.
+    metrics : An optional ScrapeMetrics that records fetch, parse and write metrics.
 
     Returns
     -------
     Two dataframes with the information scraped from the Refinery29 website:
     diarist_df (the metadata dataframe) and text_df (the text dataframe)
     '''
+    fetch_kwargs = dict(max_workers=max_workers, per_host_limit=per_host_limit,
+                        base_url=base_url, cache_path=cache_path,
+                        parse_workers=parse_workers, parser=parser, metrics=metrics)
 
-    money_diary_list = []
+    if incremental:
+        scrape_new_money_diaries(links_to_follow, output_format, **fetch_kwargs)
+        return
 
-    for link in links_to_follow:
-        money_diary_list.append(get_money_diaries_dict(link))
-
-    money_df = pd.DataFrame(money_diary_list)
-
-    # Split the money df into 2 separate df to make processing text easier
-    text_df = money_df[['story_title', 'diary_text']]
-    diarist_df = money_df.drop('diary_text', axis=1)
-
-    # Save dataframes to csv files
-    text_df.to_csv(r'text_df.csv', index=False)
-    diarist_df.to_csv(r'diarist_df.csv', index=False)
+    # Split each diary into the metadata and text tables to make processing
+    # text easier, and save them as the diaries come in
+    text_path, diarist_path = OUTPUT_PATHS[output_format]
+    with RecordSink(text_path, diarist_path, output_format) as sink:
+        for record in iter_money_diaries(links_to_follow, **fetch_kwargs):
+            write_record(sink, record, metrics)
 
 def main():
     '''
@@ -167,7 +1353,13 @@ def main():
     '''
 
     # Call internal functions to this script
-    links_to_follow = get_diary_links()
-    scrape_r29_money_diaries(links_to_follow)
+    metrics = ScrapeMetrics()
+    links_to_follow = discover_diary_links()
+    scrape_r29_money_diaries(links_to_follow, incremental=True, metrics=metrics)
+
+    # Report where the crawl spent its time
+    print(metrics.report())
+    metrics.write(METRICS_PATH)
 
-main()
+if __name__ == '__main__':
+    main()